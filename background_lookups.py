@@ -0,0 +1,87 @@
+"""
+Runs the small lookups behind as-you-type form checks off the GUI thread.
+
+A form field (see ui/field_checks.py) asks for a lookup once the user stops
+typing, e.g. "is this phone number registered?". BackgroundLookups runs the
+repository method on its own worker thread, with its own connection
+(HospitalRepository.reader_for_thread), so a slow disk, network share or
+server never freezes the window.
+
+Each lookup belongs to a key (one per form field). Submitting a new lookup for
+a key cancels the previous one if it has not started yet, and once it has
+started its answer is dropped: only the newest lookup of a key is ever
+delivered (is_current). Lookups are single reads on an index, so one worker
+is enough and keeps them in order.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundLookups:
+    """Runs read-only repository calls on a worker thread; only the newest call per key counts."""
+
+    def __init__(self, repository, workers=1):
+        self.repository = repository
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hms-lookup")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._latest = {} # key -> (generation, future) of the newest lookup
+        self._generation = 0
+
+    def _reader(self):
+        reader = getattr(self._local, "reader", None)
+        if reader is None:
+            reader = self._local.reader = self.repository.reader_for_thread()
+        return reader
+
+    def submit(self, key, method_name, *args, callback):
+        """
+        Runs repository.<method_name>(*args) in the background, scoped like
+        the repository's session, then calls callback(generation, result) on
+        the worker thread. Returns the lookup's generation.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._cancel(key)
+            future = self._executor.submit(self._run, key, generation, self.repository.clinic_id,
+                                           method_name, args, callback)
+            self._latest[key] = (generation, future)
+            return generation
+
+    def cancel(self, key):
+        """Forgets the lookup of `key`: it does not run if it has not started, and is never delivered."""
+        with self._lock:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        latest = self._latest.pop(key, None)
+        if latest:
+            latest[1].cancel()
+
+    def is_current(self, key, generation):
+        """True if `generation` is still the newest lookup of `key` (the GUI checks again on delivery)."""
+        with self._lock:
+            latest = self._latest.get(key)
+            return latest is not None and latest[0] == generation
+
+    def _run(self, key, generation, clinic_id, method_name, args, callback):
+        if not self.is_current(key, generation):
+            return # Superseded while it was queued
+        reader = self._reader()
+        if reader is not self.repository:
+            reader.clinic_id = clinic_id
+        try:
+            result = getattr(reader, method_name)(*args)
+        except (OSError, RuntimeError) as e: # Server unreachable; the form is still checked on submit
+            print(f"Background lookup {method_name} failed: {e}")
+            return
+        if self.is_current(key, generation):
+            callback(generation, result)
+
+    def shutdown(self):
+        """Drops queued lookups and waits for a running one to finish."""
+        with self._lock:
+            for key in list(self._latest):
+                self._cancel(key)
+        self._executor.shutdown(wait=True)
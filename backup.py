@@ -0,0 +1,385 @@
+"""
+Online backups, snapshot retention and point-in-time restore.
+
+Copying hms.db while the app writes to it can produce a corrupt copy, so
+backups use SQLite's online backup API, copying every page in one step from a
+single read transaction. (A copy made in several small steps starts over
+whenever another connection writes between two steps, so on a busy database it
+never finishes.) In WAL mode (server.py, replicas) desks keep reading and
+writing while a snapshot is taken; with a rollback journal, writes wait until
+the copy is done, about a second per 200 MB.
+
+    backups/
+        hms-20261019-101500.db     snapshot (consistent copy)
+        hms-20261019-101500.json   manifest: time, change_log revision, row counts
+        changes-000000000001-000000000342.jsonl   archived change_log entries
+
+Between snapshots, the change_log entries (row images, see change_log.py) are
+archived to changes-*.jsonl files. restore() copies the newest snapshot taken
+before the wanted time and replays the archived changes up to that time, so
+the database can be brought back to any moment, not just to a snapshot.
+
+    python backup.py snapshot hms.db backups/           # snapshot + archive changes + retention
+    python backup.py archive hms.db backups/            # archive new changes only
+    python backup.py verify backups/hms-20261019-101500.db
+    python backup.py restore backups/ restored.db ["2026-10-19 14:30:00"] [--live hms.db]
+
+Times are UTC 'YYYY-MM-DD HH:MM:SS', like the database's own timestamps.
+After restoring over the live database, recreate any workstation replicas
+(delete their hms_local.db) so they copy the restored state.
+"""
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import change_log
+
+KEEP_LAST = 8 # Newest snapshots always kept
+KEEP_DAILY = 30 # Plus the newest snapshot of each of this many days
+
+_SNAPSHOT_PREFIX = "hms-"
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime(_TIME_FORMAT)
+
+
+def online_backup(source, dest_path):
+    """
+    Copies an open connection's database to dest_path in one step, so the
+    copy is the database as of one moment and cannot be restarted by writes.
+    Returns the number of pages copied.
+    """
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=-1)
+        return dest.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dest.close()
+
+
+def _table_counts(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in change_log.REPLICATED_TABLES}
+
+
+def take_snapshot(db_path, backup_dir):
+    """
+    Writes a consistent snapshot of db_path into backup_dir, with its manifest.
+    Returns the snapshot's path.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = _SNAPSHOT_PREFIX + datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    final_path = os.path.join(backup_dir, name + ".db")
+    partial_path = final_path + ".partial"
+    started = time.perf_counter()
+    source = sqlite3.connect(db_path)
+    try:
+        pages = online_backup(source, partial_path)
+    finally:
+        source.close()
+
+    snapshot = sqlite3.connect(partial_path)
+    try:
+        manifest = {
+            "taken_at": _utc_now(),
+            "source": os.path.abspath(db_path),
+            "revision": change_log.current_revision(snapshot.cursor()),
+            "pages": pages,
+            "counts": _table_counts(snapshot),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+    finally:
+        snapshot.close()
+    with open(os.path.join(backup_dir, name + ".json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(partial_path, final_path) # Only complete snapshots get a .db name
+    return final_path
+
+
+def list_snapshots(backup_dir):
+    """Returns [(snapshot path, manifest)] oldest first (complete snapshots only)."""
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(backup_dir, _SNAPSHOT_PREFIX + "*.db"))):
+        manifest_path = path[:-3] + ".json"
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                snapshots.append((path, json.load(manifest_file)))
+    return snapshots
+
+
+def prune_snapshots(backup_dir, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY):
+    """
+    Deletes snapshots beyond the retention policy: the newest `keep_last`, plus
+    the newest snapshot of each of the last `keep_daily` days, are kept.
+    Archived changes older than the oldest kept snapshot are deleted too.
+    Returns the number of deleted snapshots.
+    """
+    snapshots = list_snapshots(backup_dir)
+    keep = {path for path, _ in snapshots[-keep_last:]} if keep_last else set()
+    oldest_day = (datetime.now(timezone.utc) - timedelta(days=keep_daily)).strftime("%Y-%m-%d")
+    newest_per_day = {}
+    for path, manifest in snapshots:
+        day = manifest["taken_at"][:10]
+        if day >= oldest_day:
+            newest_per_day[day] = path
+    keep.update(newest_per_day.values())
+
+    deleted = 0
+    for path, _ in snapshots:
+        if path not in keep:
+            os.remove(path)
+            os.remove(path[:-3] + ".json")
+            deleted += 1
+    kept = [manifest for path, manifest in snapshots if path in keep]
+    if kept:
+        oldest_revision = min(manifest["revision"] for manifest in kept)
+        for path, first, last in _change_archives(backup_dir):
+            if last <= oldest_revision:
+                os.remove(path)
+    return deleted
+
+
+# --- Change archive ---
+
+def _change_archives(backup_dir):
+    """Returns [(path, first revision, last revision)] of the archived change files, in order."""
+    archives = []
+    for path in glob.glob(os.path.join(backup_dir, "changes-*.jsonl")):
+        first, last = os.path.basename(path)[len("changes-"):-len(".jsonl")].split("-")
+        archives.append((path, int(first), int(last)))
+    return sorted(archives, key=lambda archive: archive[1])
+
+
+def archive_changes(db_path, backup_dir):
+    """
+    Appends the change_log entries not archived yet to a new changes-*.jsonl
+    file in backup_dir. Returns the number of archived entries.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    archives = _change_archives(backup_dir)
+    last_archived = archives[-1][2] if archives else 0
+    conn = sqlite3.connect(db_path)
+    try:
+        oldest = change_log.oldest_revision(conn.cursor())
+        if oldest is not None and oldest > last_archived + 1 and archives:
+            print(f"Warning: change_log entries {last_archived + 1}-{oldest - 1} were pruned before "
+                  f"being archived; point-in-time restore has a gap there until the next snapshot.")
+        rows = conn.execute("""
+        SELECT revision, table_name, row_id, op, changed_at, row_data
+        FROM change_log WHERE revision > ? ORDER BY revision
+        """, (last_archived,)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return 0
+    path = os.path.join(backup_dir, f"changes-{rows[0][0]:012d}-{rows[-1][0]:012d}.jsonl")
+    with open(path + ".partial", "w") as archive:
+        for row in rows:
+            archive.write(json.dumps(row) + "\n")
+    os.replace(path + ".partial", path)
+    return len(rows)
+
+
+def _archived_changes(backup_dir, after_revision):
+    """Yields archived change_log rows with a revision above after_revision, in order."""
+    for path, first, last in _change_archives(backup_dir):
+        if last <= after_revision:
+            continue
+        with open(path) as archive:
+            for line in archive:
+                row = json.loads(line)
+                if row[0] > after_revision:
+                    yield row
+
+
+# --- Restore ---
+
+def _apply_change(conn, table_name, row_id, op, row_data):
+    if op == "delete" or row_data is None:
+        conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (row_id,))
+        return
+    row = json.loads(row_data)
+    columns = list(row)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "id")
+    # Columns kept out of the log: an existing row keeps its own, a new one gets the placeholder
+    for column, placeholder in change_log.OMITTED_COLUMNS.get(table_name, {}).items():
+        if column not in row:
+            row[column] = placeholder
+            columns.append(column)
+    conn.execute(f"""
+    INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    """, [row[column] for column in columns])
+
+
+def restore(backup_dir, out_path, until=None, live_db=None):
+    """
+    Rebuilds the database as it was at `until` (UTC 'YYYY-MM-DD HH:MM:SS';
+    None = as late as the backups allow) into out_path: the newest snapshot
+    taken before then, plus the archived changes (and, with live_db, the
+    changes still only in the live database's change_log) up to that time.
+    Returns (snapshot used, changes replayed).
+    """
+    snapshots = [(path, manifest) for path, manifest in list_snapshots(backup_dir)
+                 if until is None or manifest["taken_at"] <= until]
+    if not snapshots:
+        raise ValueError("No snapshot was taken before that time")
+    snapshot_path, manifest = snapshots[-1]
+    if os.path.exists(out_path):
+        raise ValueError(f"{out_path} already exists")
+
+    source = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        online_backup(source, out_path)
+    finally:
+        source.close()
+
+    changes = list(_archived_changes(backup_dir, manifest["revision"]))
+    if live_db:
+        newest = changes[-1][0] if changes else manifest["revision"]
+        live = sqlite3.connect(f"file:{live_db}?mode=ro", uri=True)
+        try:
+            changes += live.execute("""
+            SELECT revision, table_name, row_id, op, changed_at, row_data
+            FROM change_log WHERE revision > ? ORDER BY revision
+            """, (newest,)).fetchall()
+        finally:
+            live.close()
+
+    conn = sqlite3.connect(out_path)
+    replayed = 0
+    try:
+        with conn:
+            for revision, table_name, row_id, op, changed_at, row_data in changes:
+                if until is not None and changed_at > until:
+                    break
+                _apply_change(conn, table_name, row_id, op, row_data)
+                # Keep the log as it was (the triggers just logged the replay under new revisions)
+                conn.execute("DELETE FROM change_log WHERE revision >= ?", (revision,))
+                conn.execute("""
+                INSERT INTO change_log (revision, table_name, row_id, op, changed_at, row_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, (revision, table_name, row_id, op, changed_at, row_data))
+                replayed += 1
+            conn.execute("""
+            UPDATE sqlite_sequence SET seq = (SELECT COALESCE(MAX(revision), 0) FROM change_log)
+            WHERE name = 'change_log'
+            """)
+    finally:
+        conn.close()
+    return snapshot_path, replayed
+
+
+def verify(db_path, manifest=None):
+    """
+    Checks a snapshot or restored database: integrity_check and, given its
+    manifest, the row counts. Returns a list of problems (empty if it is fine).
+    """
+    problems = []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if result != ["ok"]:
+            problems.extend(f"integrity: {line}" for line in result)
+        if manifest:
+            counts = _table_counts(conn)
+            for table, expected in manifest["counts"].items():
+                if counts.get(table) != expected:
+                    problems.append(f"{table}: {counts.get(table)} rows, manifest says {expected}")
+    except sqlite3.Error as e:
+        problems.append(f"cannot read: {e}")
+    finally:
+        conn.close()
+    return problems
+
+
+class BackupScheduler:
+    """
+    Background thread that archives new changes every `archive_interval`
+    seconds and takes a snapshot (then applies retention) every `snapshot_interval` seconds.
+    """
+
+    def __init__(self, db_path, backup_dir, snapshot_interval=6 * 3600, archive_interval=300):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.snapshot_interval = snapshot_interval
+        self.archive_interval = archive_interval
+        self.last_snapshot = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hms-backup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        snapshots = list_snapshots(self.backup_dir) if os.path.isdir(self.backup_dir) else []
+        next_snapshot = time.monotonic()
+        if snapshots:
+            taken = datetime.strptime(snapshots[-1][1]["taken_at"], _TIME_FORMAT).replace(tzinfo=timezone.utc)
+            age = (datetime.now(timezone.utc) - taken).total_seconds()
+            next_snapshot += max(0, self.snapshot_interval - age)
+        while not self._stop.is_set():
+            try:
+                archive_changes(self.db_path, self.backup_dir)
+                if time.monotonic() >= next_snapshot:
+                    self.last_snapshot = take_snapshot(self.db_path, self.backup_dir)
+                    prune_snapshots(self.backup_dir)
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+                    print(f"Backup snapshot written: {self.last_snapshot}")
+            except (sqlite3.Error, OSError) as e:
+                print(f"Backup failed: {e}")
+            self._stop.wait(min(self.archive_interval, max(1, next_snapshot - time.monotonic())))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "snapshot" and len(sys.argv) == 4:
+        archive_changes(sys.argv[2], sys.argv[3])
+        path = take_snapshot(sys.argv[2], sys.argv[3])
+        print(f"Snapshot written: {path} ({prune_snapshots(sys.argv[3])} old snapshot(s) removed)")
+    elif command == "archive" and len(sys.argv) == 4:
+        print(f"Archived {archive_changes(sys.argv[2], sys.argv[3])} change(s).")
+    elif command == "verify" and len(sys.argv) == 3:
+        manifest_path = sys.argv[2][:-3] + ".json"
+        manifest = None
+        if sys.argv[2].endswith(".db") and os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        problems = verify(sys.argv[2], manifest)
+        for problem in problems:
+            print(problem)
+        print("FAILED" if problems else "OK")
+        sys.exit(1 if problems else 0)
+    elif command == "restore" and len(sys.argv) >= 4:
+        args = sys.argv[2:]
+        live_db = None
+        if "--live" in args[:-1]:
+            live_db = args.pop(args.index("--live") + 1)
+            args.remove("--live")
+        until = args[2] if len(args) > 2 else None
+        try:
+            snapshot_path, replayed = restore(args[0], args[1], until, live_db)
+        except ValueError as e:
+            print(f"Restore failed: {e}")
+            sys.exit(1)
+        problems = verify(args[1])
+        print(f"Restored {snapshot_path} + {replayed} change(s) into {args[1]}: "
+              + ("; ".join(problems) if problems else "verified OK"))
+        sys.exit(1 if problems else 0)
+    else:
+        print("Usage: python backup.py snapshot <database> <backup dir>")
+        print("       python backup.py archive <database> <backup dir>")
+        print("       python backup.py verify <snapshot or database>")
+        print("       python backup.py restore <backup dir> <new database> [\"YYYY-MM-DD HH:MM:SS\"] [--live <database>]")
+        sys.exit(2)
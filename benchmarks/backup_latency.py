@@ -0,0 +1,132 @@
+"""
+How much a running backup slows down the app's own queries.
+
+    python benchmarks/backup_latency.py --patients 200000
+
+A "desk" thread repeats what MainWindow does on every refresh (count and fetch
+one page of patients, and every 10th round register a patient) on its own
+connection and records how long each round takes. Meanwhile backups are taken
+back to back, and only those that complete while the desk is still writing
+are counted. This runs with no backup, with backup.py's one-step backup (with
+a rollback journal and in WAL mode), and with a backup copied in small steps
+for comparison: writes between steps make that one start over, so on a busy
+database it rarely finishes.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+from db_manager import DatabaseManager
+
+
+def fill_database(db, patients):
+    with db.conn:
+        db.conn.executemany("""
+        INSERT INTO patients (first_name, last_name, date_of_birth, gender, contact_phone, problem, address, blood_type)
+        VALUES ('Bench', ?, '1990-01-01', 'Other', ?, 'Checkup', 'Main St', 'O+')
+        """, ((f"Patient{number}", f"{number:010d}") for number in range(patients)))
+
+
+STEPPED_PAGES = 256 # Pages per step of the stepped comparison (1 MB with 4 KB pages)
+STEPPED_PAUSE = 0.01 # Seconds between its steps
+
+
+def stepped_backup(source, dest_path):
+    """Copies in steps of STEPPED_PAGES pages with a pause in between (the approach backup.py dropped)."""
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=STEPPED_PAGES, progress=lambda status, remaining, total: time.sleep(STEPPED_PAUSE))
+    finally:
+        dest.close()
+
+
+def desk_rounds(db_path, seconds):
+    """Runs refresh rounds for `seconds`. Returns (each round's latency in ms, patients registered)."""
+    db = DatabaseManager(db_path, defer_schema=True)
+    latencies = []
+    writes = 0
+    deadline = time.perf_counter() + seconds
+    number = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db.count_patients()
+        db.get_patients_page(limit=50, offset=0)
+        if number % 10 == 0:
+            db.create_patient("Desk", f"Round{number}", "1990-01-01", "Other", f"9{number:09d}", "Checkup", "", "O+", 1)
+            writes += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+        number += 1
+        time.sleep(0.005)
+    db.conn.close()
+    return latencies, writes
+
+
+def backups_until(db_path, out_dir, stop, copy):
+    """Keeps taking backups until `stop` is set. Returns the number completed before it was set."""
+    completed = 0
+    while not stop.is_set():
+        dest_path = os.path.join(out_dir, "copy.db")
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        source = sqlite3.connect(db_path)
+        try:
+            copy(source, dest_path)
+        finally:
+            source.close()
+        if not stop.is_set(): # One still running when the desk stopped writing does not count
+            completed += 1
+    return completed
+
+
+def measure(db_path, out_dir, seconds, copy=None):
+    stop = threading.Event()
+    result = {}
+    worker = None
+    if copy is not None:
+        worker = threading.Thread(target=lambda: result.update(backups=backups_until(db_path, out_dir, stop, copy)))
+        worker.start()
+    latencies, writes = desk_rounds(db_path, seconds)
+    stop.set()
+    if worker:
+        worker.join()
+    latencies.sort()
+    return {
+        "rounds": len(latencies),
+        "writes": writes,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "max": latencies[-1],
+        "backups": result.get("backups", 0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure desk query latency while backups run.")
+    parser.add_argument("--patients", type=int, default=200000, help="Patients in the database (default: 200000)")
+    parser.add_argument("--seconds", type=float, default=10, help="Seconds per run (default: 10)")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        fill_database(DatabaseManager(db_path), options.patients)
+        print(f"{options.patients} patients, {os.path.getsize(db_path) / 1024 / 1024:.0f} MB")
+        runs = (
+            ("no backup", "delete", None),
+            ("backup.py", "delete", backup.online_backup),
+            ("stepped backup", "delete", stepped_backup),
+            ("backup.py, WAL", "wal", backup.online_backup),
+        )
+        for label, journal_mode, copy in runs:
+            with sqlite3.connect(db_path) as conn:
+                conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()
+            stats = measure(db_path, tmp, options.seconds, copy)
+            print(f"{label:>16}: p50 {stats['p50']:6.1f} ms  p99 {stats['p99']:7.1f} ms  max {stats['max']:7.1f} ms"
+                  f"  ({stats['rounds']} rounds, {stats['writes']} writes, {stats['backups']} backups completed)")
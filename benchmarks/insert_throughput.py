@@ -0,0 +1,89 @@
+"""
+Patient inserts per second: one commit per insert vs. group commit.
+
+    python benchmarks/insert_throughput.py --inserts 2000 --clients 8
+
+"before": every client thread has its own DatabaseManager connection and
+each create_patient() commits (and syncs) on its own, as the app does today.
+"after":  the same client threads hand their inserts to one GroupCommitWriter,
+which commits them in small batches.
+
+Both runs use a fresh database in WAL mode with the same `synchronous`
+setting, so every acknowledged insert is equally durable.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DatabaseManager
+from group_commit import GroupCommitWriter
+
+
+def _patient(client, number):
+    return ("Bench", f"Client{chr(65 + client % 26)}", "1990-01-01", "Other",
+            f"{client:03d}{number:07d}", "Checkup", "", "O+", 1)
+
+
+def _run_clients(clients, inserts, insert_one):
+    """Runs `inserts` inserts spread over `clients` threads. Returns (seconds, failures)."""
+    failures = []
+    per_client = inserts // clients
+
+    def client_loop(client):
+        for number in range(per_client):
+            if not insert_one(client, number):
+                failures.append((client, number))
+
+    threads = [threading.Thread(target=client_loop, args=(client,)) for client in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, len(failures)
+
+
+def bench_commit_per_insert(db_path, clients, inserts, synchronous):
+    local = threading.local()
+
+    def insert_one(client, number):
+        db = getattr(local, "db", None)
+        if db is None:
+            db = local.db = DatabaseManager(db_path, defer_schema=True) # Schema already created below
+            db.cursor.execute(f"PRAGMA synchronous={synchronous}")
+        return db.create_patient(*_patient(client, number))
+
+    setup = DatabaseManager(db_path) # Creates the schema once, up front
+    setup.cursor.execute("PRAGMA journal_mode=WAL").fetchone() # Finish the statement so it releases its lock
+    return _run_clients(clients, inserts, insert_one)
+
+
+def bench_group_commit(db_path, clients, inserts, synchronous):
+    writer = GroupCommitWriter(db_path, synchronous=synchronous)
+    try:
+        return _run_clients(clients, inserts,
+                            lambda client, number: writer.call("create_patient", *_patient(client, number)))
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-insert commits with group commit.")
+    parser.add_argument("--inserts", type=int, default=2000, help="Total inserts per run (default: 2000)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads (default: 8)")
+    parser.add_argument("--synchronous", default="FULL", choices=["OFF", "NORMAL", "FULL"],
+                        help="SQLite synchronous setting for both runs (default: FULL)")
+    options = parser.parse_args()
+    total = options.inserts // options.clients * options.clients
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, bench in (("commit per insert", bench_commit_per_insert), ("group commit", bench_group_commit)):
+            db_path = os.path.join(tmp, label.replace(" ", "_") + ".db")
+            seconds, failures = bench(db_path, options.clients, options.inserts, options.synchronous)
+            print(f"{label:>18}: {total / seconds:8.0f} inserts/s "
+                  f"({total} inserts, {options.clients} clients, {seconds:.2f} s, {failures} failed)")
@@ -0,0 +1,111 @@
+"""
+Memory held by MainWindow's row cache while paging through a large database.
+
+    python benchmarks/row_cache_memory.py --patients 1000000 --budget-mb 8
+
+Fills a database with --patients patients (or reuses --db), then visits
+--pages random pages (among the first --max-page) of the receptionist's
+patient list in random sort orders, storing every page in a RowCache the way MainWindow does. It reports
+what an unbounded cache would have kept, what the RowCache kept, and the
+memory actually allocated (tracemalloc), and exits with status 1 if the
+cache's own accounting or the measured memory exceeds the budget.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DatabaseManager
+from row_cache import RowCache, estimate_size
+
+PAGE_SIZE = 50
+# Measured memory may exceed the accounted size by this much (allocator overhead, the live page)
+MEASURED_SLACK = 1.25
+
+
+def fill_database(db, patients):
+    """Bulk-inserts synthetic patients in one transaction."""
+    started = time.perf_counter()
+    rng = random.Random(1)
+    first_names = ["Ann", "John", "Mary", "Ahmed", "Li", "Sofia", "Omar", "Eva", "Raj", "Nina"]
+    last_names = ["Lee", "Smith", "Khan", "Garcia", "Novak", "Okafor", "Silva", "Haddad"]
+    blood_types = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+    rows = ((rng.choice(first_names), f"{rng.choice(last_names)}{number % 1000}",
+             f"{rng.randint(1930, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             rng.choice(["Male", "Female"]), f"05{number:08d}", "Checkup", "Main St", rng.choice(blood_types))
+            for number in range(patients))
+    with db.conn:
+        db.conn.executemany("""
+        INSERT INTO patients (first_name, last_name, date_of_birth, gender, contact_phone, problem, address, blood_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    print(f"Inserted {patients} patients in {time.perf_counter() - started:.1f} s")
+
+
+def visit_pages(db, cache, pages, max_page, total):
+    """Shows `pages` random pages through the cache. Returns the bytes an unbounded cache would hold."""
+    rng = random.Random(2)
+    unbounded = 0
+    last_page = min(max_page, (total - 1) // PAGE_SIZE)
+    for _ in range(pages):
+        query = {"filters": {}, "sort_by": rng.choice(["id", "full_name"]),
+                 "descending": rng.random() < 0.5, "limit": PAGE_SIZE,
+                 "offset": rng.randint(0, last_page) * PAGE_SIZE}
+        patients = db.get_patients_page(**query)
+        key = ("patients_page", (), query["sort_by"], query["descending"], query["limit"], query["offset"])
+        if key not in cache:
+            unbounded += estimate_size((patients, total))
+        cache.show("all_patients", key, (patients, total))
+    return unbounded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the row cache stays within its memory budget.")
+    parser.add_argument("--patients", type=int, default=1000000, help="Patients to insert (default: 1000000)")
+    parser.add_argument("--db", help="Use this existing database instead of filling a new one")
+    parser.add_argument("--pages", type=int, default=500, help="Random pages to visit (default: 500)")
+    parser.add_argument("--max-page", type=int, default=2000,
+                        help="Highest page number visited; deep OFFSETs are slow to fetch (default: 2000)")
+    parser.add_argument("--budget-mb", type=float, default=8, help="Row cache budget in MB (default: 8)")
+    options = parser.parse_args()
+    budget = int(options.budget_mb * 1024 * 1024)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(options.db or os.path.join(tmp, "bench.db"))
+        if not options.db:
+            fill_database(db, options.patients)
+        total = db.count_patients()
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        cache = RowCache(budget)
+        started = time.perf_counter()
+        unbounded = visit_pages(db, cache, options.pages, options.max_page, total)
+        seconds = time.perf_counter() - started
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        db.conn.close()
+
+    print(f"{total} patients, {options.pages} pages of {PAGE_SIZE} visited in {seconds:.1f} s")
+    print(f"Unbounded cache would hold: {unbounded / 1024 / 1024:8.2f} MB")
+    print(f"Row cache accounted:        {cache.size_bytes / 1024 / 1024:8.2f} MB "
+          f"(budget {options.budget_mb:.2f} MB, {cache.evictions} evictions)")
+    print(f"Measured (tracemalloc):     {held / 1024 / 1024:8.2f} MB")
+    print(cache.describe())
+
+    failed = False
+    if cache.size_bytes > budget:
+        print("FAIL: the cache's accounted size exceeds its budget")
+        failed = True
+    if held > budget * MEASURED_SLACK:
+        print(f"FAIL: measured memory exceeds {MEASURED_SLACK:.2f} x the budget")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,107 @@
+"""
+Revision log of row changes, used to keep workstation replicas up to date
+(see replica.py) and to restore a backup to a point in time (see backup.py).
+
+Triggers on the replicated tables append (table, row id, operation, row image)
+to `change_log` whenever a row is inserted, updated or deleted, whichever
+connection makes the change. `revision` only ever grows, so a replica that
+remembers the last revision it has seen can ask for everything after it and
+copy just those rows. `row_data` is the row as JSON after the change (NULL for
+a delete), so replaying the log on top of a snapshot rebuilds later states.
+
+Secrets (OMITTED_COLUMNS, e.g. users.password) are never written to the log,
+so they never reach the backup archives either. A row replayed into a
+restored database keeps the value it had in the snapshot; a user created
+after the snapshot gets the placeholder, which no password matches.
+"""
+
+# Tables copied to replicas, parents first (so rows are inserted after the rows they refer to)
+REPLICATED_TABLES = ("clinics", "users", "patients", "encounters")
+# Columns left out of row_data, with the value a restore inserts instead (see backup._apply_change)
+OMITTED_COLUMNS = {"users": {"password": ""}}
+
+
+def create_change_log(cursor):
+    """
+    Creates the change_log table and its triggers. Run after every column
+    migration: the triggers are rebuilt whenever a table's columns changed.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        revision INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        row_data TEXT
+    );
+    """)
+    cursor.execute("PRAGMA table_info(change_log)")
+    if "row_data" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE change_log ADD COLUMN row_data TEXT")
+
+    for table in REPLICATED_TABLES:
+        # Stored columns only (PRAGMA table_info leaves out generated ones)
+        cursor.execute(f"PRAGMA table_info({table})")
+        omitted = OMITTED_COLUMNS.get(table, {})
+        rebuilt = False
+        row_image = "json_object(" + ", ".join(f"'{row[1]}', NEW.{row[1]}" for row in cursor.fetchall()
+                                               if row[1] not in omitted) + ")"
+        for op, row, data in (("INSERT", "NEW", row_image), ("UPDATE", "NEW", row_image), ("DELETE", "OLD", "NULL")):
+            name = f"trg_{table}_log_{op.lower()}"
+            trigger_sql = (
+                f"CREATE TRIGGER {name} AFTER {op} ON {table} BEGIN "
+                f"INSERT INTO change_log (table_name, row_id, op, row_data) "
+                f"VALUES ('{table}', {row}.id, '{op.lower()}', {data}); END"
+            )
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,))
+            existing = cursor.fetchone()
+            if existing is None or existing[0] != trigger_sql:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cursor.execute(trigger_sql)
+                rebuilt = True
+        for column in omitted if rebuilt else (): # Entries written before the column was left out
+            cursor.execute(f"""
+            UPDATE change_log SET row_data = json_remove(row_data, '$.{column}')
+            WHERE table_name = ? AND json_extract(row_data, '$.{column}') IS NOT NULL
+            """, (table,))
+
+
+def current_revision(cursor):
+    """Returns the newest revision in the log (0 if it is empty)."""
+    cursor.execute("SELECT COALESCE(MAX(revision), 0) FROM change_log")
+    return cursor.fetchone()[0]
+
+
+def changes_since(cursor, revision):
+    """
+    Returns ([(table_name, row_id)], newest revision) for every row changed
+    after `revision`. A row changed several times is listed once.
+    """
+    cursor.execute("""
+    SELECT table_name, row_id, MAX(revision) FROM change_log
+    WHERE revision > ?
+    GROUP BY table_name, row_id
+    """, (revision,))
+    rows = cursor.fetchall()
+    newest = max((row[2] for row in rows), default=revision)
+    return [(table_name, row_id) for table_name, row_id, _ in rows], newest
+
+
+def oldest_revision(cursor):
+    """Returns the oldest revision still in the log, or None if it is empty."""
+    cursor.execute("SELECT MIN(revision) FROM change_log")
+    return cursor.fetchone()[0]
+
+
+def prune_change_log(cursor, older_than_days=30):
+    """
+    Deletes log entries older than `older_than_days`. A replica that has not
+    synced since then copies the whole database again. Returns the number of deleted entries.
+    """
+    # The newest entry is always kept, so a gap after a replica's revision shows it missed changes
+    cursor.execute("""
+    DELETE FROM change_log
+    WHERE changed_at < datetime('now', ?) AND revision < (SELECT MAX(revision) FROM change_log)
+    """, (f"-{int(older_than_days)} days",))
+    return cursor.rowcount
@@ -0,0 +1,232 @@
+"""
+Client adapter for server.py.
+
+RemoteDatabaseManager implements the same HospitalRepository interface as
+DatabaseManager, so MainWindow can use either one without changes:
+
+    db = RemoteDatabaseManager("http://127.0.0.1:8765")
+    role, user_id = db.check_credentials("admin", "admin123")
+
+A successful login keeps the server's session token, which every later call
+sends; the server works out the desk's clinic from it.
+"""
+import http.client
+import json
+from urllib.parse import urlsplit
+
+from duplicates import DUPLICATE_THRESHOLD
+from repository import HospitalRepository
+from records import (
+    PendingUser, User, Clinic, Doctor, DoctorWorkload, DoctorEvent, PatientSummary, Patient, PatientDetails,
+    Encounter, DuplicateCandidate, PhoneMatch
+)
+
+
+class RemoteDatabaseManager(HospitalRepository):
+    """Talks to an HMS server instead of a local SQLite file."""
+
+    def __init__(self, base_url, timeout=10):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._conn = None
+        self._owner = None # The client whose session a reader_for_thread() client shares
+        self.session = None # Token from check_credentials; the server scopes calls by its user's clinic
+        self.clinic_id = None # Informational only: the server never takes the clinic from the client
+
+    def reader_for_thread(self):
+        """A client with its own HTTP connection (http.client connections are not thread-safe)."""
+        reader = RemoteDatabaseManager(self.base_url, self.timeout)
+        reader._owner = self
+        return reader
+
+    def _call(self, method_name, *args):
+        """Calls one DatabaseManager method on the server and returns its JSON result."""
+        return self._request(method_name, *args).get("result")
+
+    def _request(self, method_name, *args):
+        """Calls one server method with this desk's session and returns the whole JSON answer."""
+        session = (self._owner or self).session
+        body = json.dumps({"args": list(args), "session": session})
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("POST", f"/api/{method_name}", body, {"Content-Type": "application/json"})
+                response = self._conn.getresponse()
+                payload = json.loads(response.read() or b"{}")
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The kept-alive connection was dropped; reconnect once
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Server error calling {method_name}: {payload.get('error')}")
+        return payload
+
+    def _rows(self, record_type, method_name, *args):
+        """Calls a method returning rows and turns the JSON lists back into records."""
+        return [record_type._make(row) for row in self._call(method_name, *args)]
+
+    # --- Session ---
+
+    def start_session(self, user_id):
+        self.clinic_id = self.get_user_clinic(user_id)
+        return self.clinic_id
+
+    def get_user_clinic(self, user_id):
+        return self._call("get_user_clinic", user_id)
+
+    def end_session(self):
+        if self.session:
+            try:
+                self._request("end_session")
+            except (OSError, RuntimeError) as e: # The token expires on the server anyway
+                print(f"Could not end the server session: {e}")
+        self.session = None
+        self.clinic_id = None
+
+    # --- Clinics ---
+
+    def get_clinics(self):
+        return self._rows(Clinic, "get_clinics")
+
+    def create_clinic(self, name):
+        return self._call("create_clinic", name)
+
+    def set_user_clinic(self, user_id, clinic_id):
+        return self._call("set_user_clinic", user_id, clinic_id)
+
+    # --- Users ---
+
+    def register_user(self, full_name, phone, password, role, clinic_id=None):
+        return self._call("register_user", full_name, phone, password, role, clinic_id)
+
+    def check_credentials(self, phone, password, workstation=None):
+        # The server rate limits by this desk's address, not by a key it sends
+        payload = self._request("check_credentials", phone, password)
+        if payload.get("session"):
+            self.session = payload["session"]
+        return tuple(payload.get("result"))
+
+    def login_retry_after(self, phone, workstation=None):
+        return self._call("login_retry_after", phone) # Limited by this desk's address, like logins
+
+    def is_phone_registered(self, phone, workstation=None):
+        return self._call("is_phone_registered", phone)
+
+    def get_pending_registrations(self):
+        return self._rows(PendingUser, "get_pending_registrations")
+
+    def approve_registration(self, user_id):
+        return self._call("approve_registration", user_id)
+
+    def deny_registration(self, user_id):
+        return self._call("deny_registration", user_id)
+
+    def create_admin_user(self, full_name, phone, password):
+        return self._call("create_admin_user", full_name, phone, password)
+
+    def get_doctors(self):
+        return self._rows(Doctor, "get_doctors")
+
+    def get_doctor_workload(self, doctor_id=None):
+        return self._rows(DoctorWorkload, "get_doctor_workload", doctor_id)
+
+    def get_doctor_events(self, doctor_id, after_id=0, limit=100):
+        return self._rows(DoctorEvent, "get_doctor_events", doctor_id, after_id, limit)
+
+    def get_last_seen_event(self, doctor_id):
+        return self._call("get_last_seen_event", doctor_id)
+
+    def mark_doctor_events_seen(self, doctor_id, event_id):
+        return self._call("mark_doctor_events_seen", doctor_id, event_id)
+
+    def get_all_users(self, sort_by="id", descending=False):
+        return self._rows(User, "get_all_users", sort_by, descending)
+
+    def delete_user_by_admin(self, user_id, admin_id):
+        return self._call("delete_user_by_admin", user_id, admin_id)
+
+    def create_user_by_admin(self, full_name, phone, password, role, clinic_id=None):
+        return self._call("create_user_by_admin", full_name, phone, password, role, clinic_id)
+
+    # --- Patients ---
+
+    def create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id):
+        return self._call("create_patient", first_name, last_name, dob, gender, contact_phone,
+                          problem, address, blood_type, receptionist_id)
+
+    def find_duplicate_candidates(self, first_name, last_name, dob, contact_phone, threshold=DUPLICATE_THRESHOLD, exclude_id=None):
+        return self._rows(DuplicateCandidate, "find_duplicate_candidates",
+                          first_name, last_name, dob, contact_phone, threshold, exclude_id)
+
+    def find_patients_by_phone(self, contact_phone, exclude_id=None, limit=5):
+        return self._rows(PhoneMatch, "find_patients_by_phone", contact_phone, exclude_id, limit)
+
+    def delete_patient(self, patient_id):
+        return self._call("delete_patient", patient_id)
+
+    def get_all_patients(self):
+        return self._rows(PatientSummary, "get_all_patients")
+
+    def get_patients_page(self, filters=None, sort_by="id", descending=False, limit=50, offset=0):
+        return self._rows(PatientSummary, "get_patients_page", filters, sort_by, descending, limit, offset)
+
+    def count_patients(self, filters=None):
+        return self._call("count_patients", filters)
+
+    def assign_patient_to_doctor(self, patient_id, doctor_id):
+        return self._call("assign_patient_to_doctor", patient_id, doctor_id)
+
+    def get_patients_for_doctor(self, doctor_id, sort_by="id", descending=False):
+        return self._rows(Patient, "get_patients_for_doctor", doctor_id, sort_by, descending)
+
+    def update_patient_status_by_doctor(self, patient_id, new_status):
+        return self._call("update_patient_status_by_doctor", patient_id, new_status)
+
+    def get_patient_details(self, patient_id):
+        row = self._call("get_patient_details", patient_id)
+        return PatientDetails._make(row) if row else None
+
+    def update_patient(self, patient_id, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
+        return self._call("update_patient", patient_id, first_name, last_name, dob, gender,
+                          contact_phone, problem, address, blood_type)
+
+    def search_patients(self, term, include_archive=True):
+        return self._rows(PatientSummary, "search_patients", term, include_archive)
+
+    # --- Visit history ---
+
+    def add_encounter(self, patient_id, doctor_id, diagnosis, notes, visit_date=None):
+        return self._call("add_encounter", patient_id, doctor_id, diagnosis, notes, visit_date)
+
+    def get_patient_timeline(self, patient_id, limit=20, before=None):
+        return self._rows(Encounter, "get_patient_timeline", patient_id, limit, before)
+
+    # --- Reports ---
+
+    def refresh_reports(self, full=False):
+        return self._call("refresh_reports", full)
+
+    def get_reports(self):
+        report = self._call("get_reports")
+        if report:
+            for key in ("daily", "blood_types", "age_bands"): # JSON lists back into the rows DatabaseManager returns
+                report[key] = [tuple(row) for row in report[key]]
+        return report
+
+    # --- Archive ---
+
+    def archive_patients(self, older_than_days=365, batch_size=500):
+        return self._call("archive_patients", older_than_days, batch_size)
+
+    def is_patient_archived(self, patient_id):
+        return self._call("is_patient_archived", patient_id)
+
+    def restore_patient(self, patient_id):
+        return self._call("restore_patient", patient_id)
@@ -1,28 +1,311 @@
 import sqlite3
-import hashlib
+import hmac
+import math
+import os
 import sys
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from duplicates import blocking_keys, match_score, normalize_phone, DUPLICATE_THRESHOLD
+import reports
+import change_log
+import workload
+import inbox
+import login_limits
+import queries
+from repository import HospitalRepository
+from records import (
+    PendingUser, User, Clinic, Doctor, DoctorWorkload, DoctorEvent, PatientSummary, Patient, PatientDetails,
+    Encounter, DuplicateCandidate, PhoneMatch, normalize_dob
+)
 
-class DatabaseManager:
+# Columns copied into the archive database when a patient is archived.
+ARCHIVED_PATIENT_COLUMNS = (
+    "id", "first_name", "last_name", "date_of_birth", "gender", "contact_phone",
+    "problem", "address", "blood_type", "assigned_doctor_id", "doctor_status",
+    "created_by_receptionist_id", "created_at", "deleted_at", "clinic_id",
+    "dup_name_key", "dup_phone_key", "legacy_id", "row_version", "status_changed_at"
+)
+# Archive columns added after the first version, with their types (added to older archive files)
+ARCHIVE_ADDED_COLUMNS = {
+    "clinic_id": "INTEGER", "dup_name_key": "TEXT", "dup_phone_key": "TEXT",
+    "legacy_id": "INTEGER", "row_version": "INTEGER", "status_changed_at": "DATETIME",
+}
+ARCHIVED_ENCOUNTER_COLUMNS = (
+    "id", "patient_id", "visit_date", "doctor_id", "diagnosis", "notes", "created_at"
+)
+# Users referred to by an archived row may have been deleted since it was archived.
+# Restoring applies the delete_user_by_admin() policy instead of failing the foreign key.
+_EXISTING_USER = "(SELECT id FROM main.users WHERE id = a.{column})"
+RESTORED_COLUMN_VALUES = {
+    "assigned_doctor_id": _EXISTING_USER.format(column="assigned_doctor_id"),
+    "doctor_status": f"CASE WHEN a.assigned_doctor_id IS NULL OR {_EXISTING_USER.format(column='assigned_doctor_id')}"
+                     f" IS NOT NULL THEN a.doctor_status ELSE 'pending' END",
+    "created_by_receptionist_id": _EXISTING_USER.format(column="created_by_receptionist_id"),
+    "doctor_id": _EXISTING_USER.format(column="doctor_id"),
+    "row_version": "COALESCE(a.row_version, 1)", # Archived before versions were kept
+    # Inserted as deleted and un-deleted afterwards, so the patients insert triggers
+    # see a restore, not a new patient (no 'assigned' event in the doctor's inbox)
+    "deleted_at": "COALESCE(a.deleted_at, CURRENT_TIMESTAMP)",
+}
+
+def _restored_values(columns):
+    """SELECT list that copies archived columns, dropping references to deleted users."""
+    return ", ".join(RESTORED_COLUMN_VALUES.get(column, f"a.{column}") for column in columns)
+
+# Sortable list columns: record field -> SQL expression. Only these names ever
+# reach an ORDER BY, so a sort key coming from the UI (or the server API) cannot inject SQL.
+PATIENT_SORT_COLUMNS = {
+    "id": "p.id", "full_name": "p.full_name", "date_of_birth": "p.birth_date", "age": "-p.birth_date",
+    "gender": "p.gender", "contact_phone": "p.contact_phone", "problem": "p.problem",
+    "doctor_name": "u.full_name", "doctor_status": "p.doctor_status",
+    "created_at": "p.created_at", "blood_type": "p.blood_type",
+}
+# Sorts an index can deliver in order (walking it beats sorting every patient for one page)
+INDEXED_PATIENT_SORTS = {"id", "full_name", "date_of_birth", "age"}
+DOCTOR_PATIENT_SORT_COLUMNS = {field: f"p.{field}" for field in Patient._fields}
+DOCTOR_PATIENT_SORT_COLUMNS.update(date_of_birth="p.birth_date", age="-p.birth_date")
+USER_SORT_COLUMNS = {
+    "id": "u.id", "full_name": "u.full_name", "phone": "u.phone", "role": "u.role",
+    "status": "u.status", "created_at": "u.created_at", "clinic_name": "c.name",
+}
+
+def _order_by(sort_columns, sort_by, descending):
+    """
+    Builds an ORDER BY clause; ties (and unknown sort keys) fall back to the id.
+    A column written "-column" sorts the other way round (age: latest birth date first).
+    """
+    direction = "DESC" if descending else "ASC"
+    id_column = sort_columns["id"]
+    column = sort_columns.get(sort_by, id_column)
+    if column == id_column:
+        return f"ORDER BY {id_column} {direction}"
+    column_direction = direction
+    if column.startswith("-"):
+        column = column[1:]
+        column_direction = "ASC" if descending else "DESC"
+    return f"ORDER BY {column} {column_direction}, {id_column} {direction}"
+
+def _patient_filters(filters, indexed_sort=False, clinic_id=None):
+    """
+    Turns list filters into a WHERE clause and its parameters. Supported keys:
+    doctor_id, status, blood_type, created_from and created_to ('YYYY-MM-DD', inclusive),
+    age_min and age_max (whole years, inclusive).
+    With indexed_sort=True the unfiltered list walks the sort index instead of the deleted_at one.
+    A clinic_id (the session's, never a UI filter) limits the list to that clinic's patients.
+    """
+    filters = filters or {}
+    clauses = []
+    params = []
+    if filters.get("doctor_id") is not None:
+        clauses.append("p.assigned_doctor_id = ?")
+        params.append(filters["doctor_id"])
+    if filters.get("status"):
+        clauses.append("p.doctor_status = ?")
+        params.append(filters["status"])
+    if filters.get("blood_type"):
+        clauses.append("p.blood_type = ?")
+        params.append(filters["blood_type"])
+    # Compare created_at against the raw bounds (not date(created_at)) so the index is used
+    if filters.get("created_from"):
+        clauses.append("p.created_at >= ?")
+        params.append(filters["created_from"])
+    if filters.get("created_to"):
+        clauses.append("p.created_at < date(?, '+1 day')")
+        params.append(filters["created_to"])
+    # Age bands become a birth date range, so the birth_date index answers them
+    if filters.get("age_min") is not None:
+        clauses.append("p.birth_date <= date('now', 'localtime', ?)")
+        params.append(f"-{int(filters['age_min'])} years")
+    if filters.get("age_max") is not None:
+        clauses.append("p.birth_date > date('now', 'localtime', ?)")
+        params.append(f"-{int(filters['age_max']) + 1} years")
+    if clinic_id is not None:
+        # (clinic_id, deleted_at) is one range of idx_patients_clinic: only the clinic's rows are read
+        clauses.insert(0, "p.clinic_id = ?")
+        params.insert(0, clinic_id)
+        clauses.append("p.deleted_at IS NULL")
+    else:
+        # With a real filter, keep the planner on that filter's index (see queries.py)
+        clauses.append("+p.deleted_at IS NULL" if clauses or indexed_sort else "p.deleted_at IS NULL")
+    return "WHERE " + " AND ".join(clauses), params
+
+# Cursor row factories, one per record type (see DatabaseManager._fetch_records)
+_ROW_FACTORIES = {}
+
+def _record_factory(record_type):
+    """Returns a sqlite3 row_factory that builds `record_type` records directly."""
+    factory = _ROW_FACTORIES.get(record_type)
+    if factory is None:
+        make = record_type._make
+        factory = _ROW_FACTORIES[record_type] = lambda cursor, row: make(row)
+    return factory
+
+class DatabaseManager(HospitalRepository):
     """
     This class handles all interactions with the SQLite database.
+    It is the SQLite implementation of HospitalRepository (see repository.py).
     """
-    def __init__(self, db_name="hms.db"):
+    def __init__(self, db_name="hms.db", defer_schema=False):
+        """
+        Opens the database. With defer_schema=True the table/migration checks
+        are skipped until ensure_schema() is called, so the app can show its
+        login screen first.
+        """
+        self.db_name = db_name
+        # Old/deleted patient records are moved into a separate file (e.g. hms_archive.db)
+        self.archive_path = os.path.splitext(db_name)[0] + "_archive.db"
+        self.schema_ready = False
+        self._batch_depth = 0 # > 0 while inside batch(); commits are deferred
+        self.clinic_id = None # Clinic the session is limited to; None sees the whole hospital (see start_session)
+        self.query_timings = queries.QueryTimings()
+        # Login rate limits, shared with this process's other connections to the file (see login_limits.py)
+        self.login_limiter = login_limits.limiter_for(os.path.abspath(db_name))
         try:
-            self.conn = sqlite3.connect(db_name)
+            self.conn = sqlite3.connect(db_name, cached_statements=queries.STATEMENT_CACHE_SIZE)
+            # SQLite ignores the declared FOREIGN KEYs unless each connection turns them on
+            self.conn.execute("PRAGMA foreign_keys = ON")
             self.cursor = self.conn.cursor()
-            self.create_tables()
-            self._create_default_admin()
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             sys.exit(1)
+        if not defer_schema:
+            self.ensure_schema()
+
+    def ensure_schema(self):
+        """Creates/migrates the tables and the default admin. Only does work the first time."""
+        if self.schema_ready:
+            return
+        self.create_tables()
+        self._create_default_admin()
+        self.schema_ready = True
+
+    def _commit(self):
+        """Commits, unless the call is part of a batch() (which commits once at the end)."""
+        if not self._batch_depth:
+            self.conn.commit()
+
+    def _rollback(self):
+        """Undoes the current call: the whole transaction, or only this call's savepoint in a batch."""
+        if self._batch_depth:
+            self.cursor.execute("ROLLBACK TO batch_item")
+        else:
+            self.conn.rollback()
 
-    def _hash_password(self, password):
-        """Hashes a password for secure storage."""
-        return hashlib.sha256(password.encode()).hexdigest()
+    @contextmanager
+    def batch(self):
+        """
+        Groups many write calls into one transaction and a single commit
+        (one disk sync instead of one per call). Use call_in_batch() inside it.
+        """
+        self.conn.commit() # Start from a clean transaction state
+        self.cursor.execute("BEGIN")
+        self._batch_depth += 1
+        try:
+            yield
+        except Exception:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._batch_depth -= 1
+
+    def call_in_batch(self, method_name, *args):
+        """
+        Runs one DatabaseManager method inside the current batch() under its
+        own savepoint, so a failing call is undone without losing the others.
+        """
+        self.cursor.execute("SAVEPOINT batch_item")
+        try:
+            return getattr(self, method_name)(*args)
+        except Exception:
+            self.cursor.execute("ROLLBACK TO batch_item") # Errors the method did not handle itself
+            raise
+        finally:
+            self.cursor.execute("RELEASE batch_item")
+
+    def reader_for_thread(self):
+        """A new connection to the same file; sqlite3 connections stay on the thread that opened them."""
+        return DatabaseManager(self.db_name, defer_schema=True)
+
+    # --- Session scoping ---
+
+    def start_session(self, user_id):
+        """
+        Limits every following call to the clinic of the user who logged in
+        (doctors and receptionists with a clinic). Admins, and users without
+        a clinic, see the whole hospital. Returns the session's clinic id.
+        """
+        self.clinic_id = self.get_user_clinic(user_id)
+        return self.clinic_id
+
+    def get_user_clinic(self, user_id):
+        """Returns the clinic a user's session is limited to (None for admins and hospital-wide users)."""
+        try:
+            row = self._execute("get_user_clinic", (user_id,)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Error reading user clinic: {e}")
+            return None
+
+    def end_session(self):
+        self.clinic_id = None
+
+    @contextmanager
+    def scoped(self, clinic_id):
+        """Runs a with-block limited to `clinic_id` (server.py serves many desks on one connection)."""
+        previous = self.clinic_id
+        self.clinic_id = clinic_id
+        try:
+            yield
+        finally:
+            self.clinic_id = previous
+
+    def _scope(self, column, keyword="AND"):
+        """Returns the {scope} template part and its parameters for the session (see queries.py)."""
+        if self.clinic_id is None:
+            return "", []
+        return f"{keyword} {column} = ?", [self.clinic_id]
+
+    def _execute(self, name, params=(), **parts):
+        """Runs a registered statement (see queries.py) on the main cursor and times it."""
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(queries.sql(name, **parts), params)
+        finally:
+            self.query_timings.record(name, time.perf_counter() - started)
+
+    def _fetch_records(self, record_type, name, params=(), **parts):
+        """
+        Runs a registered SELECT and returns its rows as `record_type` records.
+        The records are built by the cursor's row_factory while fetching, so no
+        intermediate list of plain tuples is created.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = _record_factory(record_type)
+        started = time.perf_counter()
+        try:
+            return cursor.execute(queries.sql(name, **parts), params).fetchall()
+        finally:
+            self.query_timings.record(name, time.perf_counter() - started)
+            cursor.close()
+
+    def get_query_stats(self):
+        """Returns [(name, calls, total_ms, avg_ms, max_ms)] for this connection, slowest first."""
+        return self.query_timings.summary()
+
+    def check_query_plans(self):
+        """Returns [(name, plan line)] for every hot query that scans a whole table."""
+        return queries.find_full_scans(self.conn)
 
     def create_tables(self):
         """Creates the necessary tables if they don't exist."""
         try:
+            # Lets maintenance.py hand free pages back a few at a time. This only takes
+            # effect on a new, empty file; existing files are converted by maintenance.py.
+            self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
             # Users table: 'pending' status for new registrations, 'active' for approved
             self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -32,7 +315,8 @@ class DatabaseManager:
                 password TEXT NOT NULL,
                 role TEXT NOT NULL,
                 status TEXT NOT NULL DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                clinic_id INTEGER REFERENCES clinics (id)
             );
             """)
             
@@ -51,14 +335,159 @@ class DatabaseManager:
                 doctor_status TEXT DEFAULT 'pending',
                 created_by_receptionist_id INTEGER,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                deleted_at DATETIME,
+                dup_name_key TEXT,
+                dup_phone_key TEXT,
+                full_name TEXT GENERATED ALWAYS AS (first_name || ' ' || last_name) VIRTUAL,
+                row_version INTEGER NOT NULL DEFAULT 1,
+                birth_date TEXT GENERATED ALWAYS AS (date(date_of_birth)) VIRTUAL,
+                clinic_id INTEGER REFERENCES clinics (id),
                 FOREIGN KEY (assigned_doctor_id) REFERENCES users (id),
                 FOREIGN KEY (created_by_receptionist_id) REFERENCES users (id)
             );
             """)
+
+            # Encounters: one row per visit, so history is never overwritten
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS encounters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patient_id INTEGER NOT NULL,
+                visit_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                doctor_id INTEGER,
+                diagnosis TEXT,
+                notes TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (patient_id) REFERENCES patients (id),
+                FOREIGN KEY (doctor_id) REFERENCES users (id)
+            );
+            """)
+            # Serves the per-patient timeline (newest first) without sorting
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_encounters_patient_visit
+            ON encounters (patient_id, visit_date)
+            """)
+
+            # Databases created before soft delete existed need the new column
+            self._add_column_if_missing("patients", "deleted_at", "DATETIME")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_deleted_at ON patients (deleted_at)")
+
+            # Blocking keys for duplicate detection (see duplicates.py)
+            self._add_column_if_missing("patients", "dup_name_key", "TEXT")
+            self._add_column_if_missing("patients", "dup_phone_key", "TEXT")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_dup_name_key ON patients (dup_name_key)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_dup_phone_key ON patients (dup_phone_key)")
+            self._backfill_blocking_keys()
+
+            # List views read (and sort by) the display name, so keep it as an indexed
+            # generated column instead of concatenating it for every row of every poll
+            self._add_column_if_missing("patients", "full_name",
+                                        "TEXT GENERATED ALWAYS AS (first_name || ' ' || last_name) VIRTUAL")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_full_name ON patients (full_name)")
+
+            # Typed date of birth: date() gives the ISO date, or NULL for text that is not one.
+            # Age filters, age sorts and age-band counts are ranges on this index; with
+            # deleted_at in it, current patients are counted without reading their rows.
+            self._add_column_if_missing("patients", "birth_date",
+                                        "TEXT GENERATED ALWAYS AS (date(date_of_birth)) VIRTUAL")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_birth_date ON patients (birth_date, deleted_at)")
+            self._normalize_birth_dates()
+
+            # Filter columns of the patient lists (see get_patients_page)
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_patients_doctor_status
+            ON patients (assigned_doctor_id, doctor_status)
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_status ON patients (doctor_status)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_blood_type ON patients (blood_type)")
+            # Foreign key columns not already leading another index: deleting a user
+            # looks up the rows that refer to it (see delete_user_by_admin)
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_patients_created_by
+            ON patients (created_by_receptionist_id)
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_encounters_doctor ON encounters (doctor_id)")
+            # Pending registrations and the active-doctor list
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_status_role ON users (status, role)")
+
+            # Clinics (sites or departments). Users and patients with a clinic_id belong to
+            # one; desks of that clinic only ever read its rows (see start_session)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS clinics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL
+            );
+            """)
+            self._add_column_if_missing("users", "clinic_id", "INTEGER REFERENCES clinics (id)")
+            self._add_column_if_missing("patients", "clinic_id", "INTEGER REFERENCES clinics (id)")
+            # A clinic's current patients are one range; so are its doctors and pending registrations
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_clinic ON patients (clinic_id, deleted_at)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_clinic ON users (clinic_id, status, role)")
+
+            # Counts update_patient() edits, so a replica can tell its edit raced another one (see replica.py)
+            self._add_column_if_missing("patients", "row_version", "INTEGER NOT NULL DEFAULT 1")
+            # Id in the legacy Tkinter app's hospital.db, for patients imported from it. Unique because
+            # migrate_legacy.py imports a single legacy database and refuses a second one
+            self._add_column_if_missing("patients", "legacy_id", "INTEGER")
+            # When a patient was last assigned, accepted or denied; archive_patients() goes by last activity
+            self._add_column_if_missing("patients", "status_changed_at", "DATETIME")
+            self.cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_legacy_id ON patients (legacy_id) WHERE legacy_id IS NOT NULL
+            """)
+
+            # Pre-aggregated statistics for the admin Reports tab (see reports.py)
+            reports.create_rollup_tables(self.cursor)
+            # Revision log that workstation replicas pull changes from (see change_log.py)
+            change_log.create_change_log(self.cursor)
+            # Per-doctor patient counters kept up to date by triggers (see workload.py)
+            workload.create_workload(self.cursor)
+            # Doctors' "patient assigned to you" notifications (see inbox.py)
+            inbox.create_inbox(self.cursor)
+            # Failed login counts and lockouts (see login_limits.py)
+            login_limits.create_login_attempts(self.cursor)
             self.conn.commit()
         except sqlite3.Error as e:
             print(f"Error creating tables: {e}")
 
+    def _add_column_if_missing(self, table, column, definition):
+        """Adds a column to a table created by an older version of the app."""
+        # table_xinfo (unlike table_info) also lists generated columns
+        self.cursor.execute(f"PRAGMA table_xinfo({table})")
+        existing_columns = [row[1] for row in self.cursor.fetchall()]
+        if column not in existing_columns:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _backfill_blocking_keys(self, batch_size=1000):
+        """Computes duplicate-detection keys for patients saved before they existed."""
+        while True:
+            self.cursor.execute("""
+            SELECT id, last_name, date_of_birth, contact_phone FROM patients
+            WHERE dup_name_key IS NULL AND dup_phone_key IS NULL
+              AND (last_name != '' OR contact_phone != '')
+            LIMIT ?
+            """, (batch_size,))
+            rows = self.cursor.fetchall()
+            if not rows:
+                break
+            updates = [(*blocking_keys(last, dob, phone), patient_id) for patient_id, last, dob, phone in rows]
+            self.cursor.executemany("UPDATE patients SET dup_name_key = ?, dup_phone_key = ? WHERE id = ?", updates)
+            if all(name_key is None and phone_key is None for name_key, phone_key, _ in updates):
+                break # Nothing left that can be keyed
+
+    def _normalize_birth_dates(self):
+        """Rewrites dates of birth saved in another format (e.g. '03/02/1990') as ISO dates."""
+        self.cursor.execute("""
+        SELECT id, last_name, date_of_birth, contact_phone FROM patients
+        WHERE birth_date IS NULL AND date_of_birth != ''
+        """)
+        updates = []
+        for patient_id, last_name, dob, phone in self.cursor.fetchall():
+            try:
+                dob = normalize_dob(dob)
+            except ValueError:
+                continue # Left as typed; it has no age until someone corrects it
+            updates.append((dob, blocking_keys(last_name, dob, phone)[0], patient_id))
+        self.cursor.executemany("UPDATE patients SET date_of_birth = ?, dup_name_key = ? WHERE id = ?", updates)
+
     def _create_default_admin(self):
         """Creates a default admin user if one doesn't exist."""
         try:
@@ -74,20 +503,18 @@ class DatabaseManager:
         except sqlite3.Error as e:
             print(f"Error creating default admin: {e}")
 
-    def register_user(self, full_name, phone, password, role):
+    def register_user(self, full_name, phone, password, role, clinic_id=None):
         """
-        Registers a new user with 'pending' status.
+        Registers a new user with 'pending' status, optionally in a clinic.
         Returns True on success, False on failure (e.g., phone exists).
         """
         if role == "admin":
             return False # Admins can only be created by other admins
         try:
             hashed_pass = self._hash_password(password)
-            self.cursor.execute("""
-            INSERT INTO users (full_name, phone, password, role, status)
-            VALUES (?, ?, ?, ?, 'pending')
-            """, (full_name, phone, hashed_pass, role))
-            self.conn.commit()
+            self._execute("register_user", (full_name, phone, hashed_pass, role, clinic_id))
+            self._commit()
+            self.login_limiter.forget_unknown(phone)
             return True
         except sqlite3.IntegrityError:
             # This error occurs if the phone number is not unique
@@ -96,28 +523,73 @@ class DatabaseManager:
             print(f"Error registering user: {e}")
             return False
 
-    def check_credentials(self, phone, password):
+    def check_credentials(self, phone, password, workstation=login_limits.LOCAL_WORKSTATION):
         """
         Checks if a user's phone and password are valid and 'active'.
         Returns (role, user_id) if successful, else (None, None).
+        Attempts over the rate limits, for unknown phones or for locked accounts
+        are refused before the password is hashed (see login_limits.py).
         """
+        if not self.login_limiter.allow(phone, workstation):
+            return (None, None)
         try:
-            hashed_pass = self._hash_password(password)
-            self.cursor.execute("""
-            SELECT role, id FROM users 
-            WHERE phone = ? AND password = ? AND status = 'active'
-            """, (phone, hashed_pass))
-            result = self.cursor.fetchone()
-            return result if result else (None, None)
+            row = self._execute("login_lookup", (phone,)).fetchone()
+            if row is None:
+                self.login_limiter.remember_unknown(phone)
+                return (None, None)
+            user_id, role, stored_hash, status, failures, locked_until = row
+            now = time.time()
+            if locked_until and locked_until > now:
+                return (None, None)
+            if not hmac.compare_digest(stored_hash, self._hash_password(password)):
+                # The count and the lock are written in one transaction (on the server, by its single writer)
+                failures = self._execute("record_login_failure", (phone, now)).fetchone()[0]
+                if failures >= login_limits.MAX_FAILURES:
+                    self._execute("lock_login", (now + login_limits.LOCKOUT_SECONDS, phone))
+                self._commit()
+                return (None, None)
+            if failures is not None: # The right password ends the run of failures
+                self._execute("clear_login_failures", (phone,))
+                self._commit()
+            return (role, user_id) if status == 'active' else (None, None)
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Error checking credentials: {e}")
             return (None, None)
 
+    def login_retry_after(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        """Whole seconds until `phone` may try to log in again (0 if it may now): lockout or rate limit."""
+        if not self.login_limiter.allow_lookup(workstation):
+            # The workstation is over its limit: so is its next login, and the database is not asked
+            return max(1, math.ceil(self.login_limiter.wait(phone, workstation)))
+        wait = self.login_limiter.wait(phone)
+        try:
+            row = self._execute("get_login_lock", (phone,)).fetchone()
+            if row:
+                wait = max(wait, row[0] - time.time())
+        except sqlite3.Error as e:
+            print(f"Error reading login lockout: {e}")
+        return max(0, math.ceil(wait))
+
+    def is_phone_registered(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        """
+        True if a user already has this phone number (one lookup on the UNIQUE phone index).
+        Over the workstation's rate limit it answers False without a lookup; it is only
+        a hint, since register_user() still refuses a phone number in use.
+        """
+        if not self.login_limiter.allow_lookup(workstation):
+            return False
+        try:
+            return self._execute("phone_registered", (phone,)).fetchone() is not None
+        except sqlite3.Error as e:
+            print(f"Error checking phone number: {e}")
+            return False
+
     def get_pending_registrations(self):
         """Returns a list of all users with 'pending' status."""
         try:
-            self.cursor.execute("SELECT id, full_name, phone, role, created_at FROM users WHERE status='pending'")
-            return self.cursor.fetchall()
+            scope, params = self._scope("clinic_id")
+            return self._fetch_records(PendingUser, "get_pending_registrations", params, scope=scope)
         except sqlite3.Error as e:
             print(f"Error fetching pending registrations: {e}")
             return []
@@ -125,9 +597,10 @@ class DatabaseManager:
     def approve_registration(self, user_id):
         """Changes a user's status from 'pending' to 'active'."""
         try:
-            self.cursor.execute("UPDATE users SET status='active' WHERE id=?", (user_id,))
-            self.conn.commit()
-            return True
+            scope, params = self._scope("clinic_id")
+            approved = self._execute("approve_registration", (user_id, *params), scope=scope).rowcount > 0
+            self._commit()
+            return approved
         except sqlite3.Error as e:
             print(f"Error approving registration: {e}")
             return False
@@ -135,8 +608,9 @@ class DatabaseManager:
     def deny_registration(self, user_id):
         """Deletes a 'pending' user."""
         try:
-            self.cursor.execute("DELETE FROM users WHERE id=? AND status='pending'", (user_id,))
-            self.conn.commit()
+            scope, params = self._scope("clinic_id")
+            self._execute("deny_registration", (user_id, *params), scope=scope)
+            self._commit()
             return True
         except sqlite3.Error as e:
             print(f"Error denying registration: {e}")
@@ -146,11 +620,9 @@ class DatabaseManager:
         """Admin-only function to create a new, active admin user."""
         try:
             hashed_pass = self._hash_password(password)
-            self.cursor.execute("""
-            INSERT INTO users (full_name, phone, password, role, status)
-            VALUES (?, ?, ?, 'admin', 'active')
-            """, (full_name, phone, hashed_pass))
-            self.conn.commit()
+            self._execute("create_admin_user", (full_name, phone, hashed_pass))
+            self._commit()
+            self.login_limiter.forget_unknown(phone)
             return True
         except sqlite3.IntegrityError:
             return False # Phone already exists
@@ -161,30 +633,136 @@ class DatabaseManager:
     def get_doctors(self):
         """Returns a list of all active doctors (id, full_name)."""
         try:
-            self.cursor.execute("SELECT id, full_name FROM users WHERE role='doctor' AND status='active'")
-            return self.cursor.fetchall()
+            scope, params = self._scope("clinic_id")
+            return self._fetch_records(Doctor, "get_doctors", params, scope=scope)
         except sqlite3.Error as e:
             print(f"Error fetching doctors: {e}")
             return []
 
+    def get_doctor_workload(self, doctor_id=None):
+        """
+        Returns DoctorWorkload records for all active doctors (by name), or for
+        one doctor. The counts are read from doctor_workload, not recounted.
+        """
+        try:
+            if doctor_id is None:
+                scope, params = self._scope("u.clinic_id")
+                return self._fetch_records(DoctorWorkload, "get_doctor_workload", params, scope=scope)
+            scope, params = self._scope("u.clinic_id")
+            return self._fetch_records(DoctorWorkload, "get_one_doctor_workload", (doctor_id, *params), scope=scope)
+        except sqlite3.Error as e:
+            print(f"Error fetching doctor workload: {e}")
+            return []
+
+    def get_doctor_events(self, doctor_id, after_id=0, limit=100):
+        """Returns the doctor's DoctorEvent records with an id above after_id, oldest first."""
+        try:
+            scope, params = self._scope("u.clinic_id")
+            return self._fetch_records(DoctorEvent, "get_doctor_events", (doctor_id, *params, after_id, limit),
+                                       scope=scope)
+        except sqlite3.Error as e:
+            print(f"Error fetching doctor events: {e}")
+            return []
+
+    def get_last_seen_event(self, doctor_id):
+        """Returns the id of the newest event the doctor has looked at (0 if none)."""
+        try:
+            scope, params = self._scope("u.clinic_id")
+            row = self._execute("get_last_seen_event", (doctor_id, *params), scope=scope).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            print(f"Error fetching last seen event: {e}")
+            return 0
+
+    def mark_doctor_events_seen(self, doctor_id, event_id):
+        """Records that the doctor has looked at their events up to event_id."""
+        try:
+            scope, params = self._scope("u.clinic_id")
+            marked = self._execute("mark_doctor_events_seen", (event_id, doctor_id, *params), scope=scope).rowcount > 0
+            self._commit()
+            return marked
+        except sqlite3.Error as e:
+            print(f"Error marking events seen: {e}")
+            return False
+
     def create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id):
-        """Creates a new patient record."""
+        """Creates a new patient record. Returns the new patient's id, or False on failure."""
         try:
-            self.cursor.execute("""
-            INSERT INTO patients (first_name, last_name, date_of_birth, gender, contact_phone, problem, address, blood_type, created_by_receptionist_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id))
-            self.conn.commit()
-            return True
+            dob = normalize_dob(dob)
+        except ValueError as e:
+            print(f"Error creating patient: {e}")
+            return False
+        name_key, phone_key = blocking_keys(last_name, dob, contact_phone)
+        try:
+            self._execute("create_patient", (first_name, last_name, dob, gender, contact_phone, problem,
+                                             address, blood_type, receptionist_id, name_key, phone_key,
+                                             receptionist_id))
+            patient_id = self.cursor.lastrowid
+            # The problem given at registration starts the patient's visit history
+            self._execute("add_system_encounter", (patient_id, problem, "Registered"))
+            self._commit()
+            return patient_id
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Error creating patient: {e}")
             return False
 
+    def find_duplicate_candidates(self, first_name, last_name, dob, contact_phone, threshold=DUPLICATE_THRESHOLD, exclude_id=None):
+        """
+        Looks for existing patients that are probably the same person.
+        Candidates come from the indexed blocking keys (phonetic last name + DOB,
+        normalized phone), so this never scans the whole table.
+        Returns a list of DuplicateCandidate, best first.
+        """
+        try:
+            dob = normalize_dob(dob) # Keys are built from the stored (ISO) form
+        except ValueError:
+            pass
+        name_key, phone_key = blocking_keys(last_name, dob, contact_phone)
+        if name_key is None and phone_key is None:
+            return []
+        try:
+            # "+": the blocking key indexes stay the way in; the clinic only filters their few matches
+            scope, params = self._scope("+clinic_id")
+            self._execute("duplicate_candidates", [name_key, phone_key] + params, scope=scope)
+            candidates = []
+            for patient_id, first, last, other_dob, phone in self.cursor.fetchall():
+                if patient_id == exclude_id:
+                    continue
+                score = match_score((first_name, last_name, dob, contact_phone), (first, last, other_dob, phone))
+                if score >= threshold:
+                    candidates.append(DuplicateCandidate(score, patient_id, f"{first} {last}", other_dob, phone))
+            candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+            return candidates
+        except sqlite3.Error as e:
+            print(f"Error finding duplicate patients: {e}")
+            return []
+
+    def find_patients_by_phone(self, contact_phone, exclude_id=None, limit=5):
+        """
+        Returns up to `limit` PhoneMatch: current patients whose phone normalizes
+        to the same number (the indexed dup_phone_key), except exclude_id.
+        """
+        phone_key = normalize_phone(contact_phone)
+        if phone_key is None:
+            return []
+        try:
+            scope, params = self._scope("+clinic_id")
+            return self._fetch_records(PhoneMatch, "patients_by_phone", [phone_key, exclude_id] + params + [limit],
+                                       scope=scope)
+        except sqlite3.Error as e:
+            print(f"Error finding patients by phone: {e}")
+            return []
+
     def delete_patient(self, patient_id):
-        """Deletes a patient record."""
+        """
+        Soft-deletes a patient record. The row is hidden from all views and
+        is physically moved to the archive by the next archive_patients() run.
+        """
         try:
-            self.cursor.execute("DELETE FROM patients WHERE id=?", (patient_id,))
-            self.conn.commit()
+            scope, params = self._scope("clinic_id")
+            self._execute("delete_patient", [patient_id] + params, scope=scope)
+            self._commit()
             return True
         except sqlite3.Error as e:
             print(f"Error deleting patient: {e}")
@@ -196,39 +774,53 @@ class DatabaseManager:
         """
         try:
             # Use LEFT JOIN to include patients even if they have no doctor assigned
-            self.cursor.execute("""
-            SELECT p.id, p.first_name || ' ' || p.last_name, p.date_of_birth, p.contact_phone, p.problem, u.full_name, p.doctor_status, p.created_at, p.blood_type
-            FROM patients p
-            LEFT JOIN users u ON p.assigned_doctor_id = u.id
-            """)
-            return self.cursor.fetchall()
+            scope, params = self._scope("p.clinic_id")
+            return self._fetch_records(PatientSummary, "get_all_patients", params, scope=scope)
         except sqlite3.Error as e:
             print(f"Error fetching all patients: {e}")
             return []
 
+    def get_patients_page(self, filters=None, sort_by="id", descending=False, limit=50, offset=0):
+        """
+        Returns one page of the patient list (PatientSummary records), filtered
+        and sorted inside SQLite so only the visible rows are fetched.
+        `filters` is a dict as described in _patient_filters; `sort_by` is a
+        PatientSummary field name.
+        """
+        where, params = _patient_filters(filters, sort_by in INDEXED_PATIENT_SORTS, self.clinic_id)
+        try:
+            return self._fetch_records(PatientSummary, "get_patients_page", params + [limit, offset],
+                                       where=where, order_by=_order_by(PATIENT_SORT_COLUMNS, sort_by, descending))
+        except sqlite3.Error as e:
+            print(f"Error fetching patient page: {e}")
+            return []
+
+    def count_patients(self, filters=None):
+        """Returns how many patients match the filters (for the page count)."""
+        where, params = _patient_filters(filters, clinic_id=self.clinic_id)
+        try:
+            return self._execute("count_patients", params, where=where).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error counting patients: {e}")
+            return 0
+
     def assign_patient_to_doctor(self, patient_id, doctor_id):
         """Assigns a patient to a doctor and sets status to 'pending' for doctor."""
         try:
-            self.cursor.execute("""
-            UPDATE patients 
-            SET assigned_doctor_id = ?, doctor_status = 'pending'
-            WHERE id = ?
-            """, (doctor_id, patient_id))
-            self.conn.commit()
-            return True
+            scope, params = self._scope("clinic_id")
+            assigned = self._execute("assign_patient", [doctor_id, patient_id] + params, scope=scope).rowcount > 0
+            self._commit()
+            return assigned
         except sqlite3.Error as e:
             print(f"Error assigning patient: {e}")
             return False
 
-    def get_patients_for_doctor(self, doctor_id):
-        """Returns all patients assigned to a specific doctor."""
+    def get_patients_for_doctor(self, doctor_id, sort_by="id", descending=False):
+        """Returns all patients assigned to a specific doctor, sorted by a Patient field."""
         try:
-            self.cursor.execute("""
-            SELECT id, p.first_name || ' ' || p.last_name, date_of_birth, gender, contact_phone, problem, doctor_status, created_at, blood_type
-            FROM patients p
-            WHERE assigned_doctor_id = ?
-            """, (doctor_id,))
-            return self.cursor.fetchall()
+            scope, params = self._scope("p.clinic_id")
+            return self._fetch_records(Patient, "get_patients_for_doctor", [doctor_id] + params, scope=scope,
+                                       order_by=_order_by(DOCTOR_PATIENT_SORT_COLUMNS, sort_by, descending))
         except sqlite3.Error as e:
             print(f"Error fetching patients for doctor: {e}")
             return []
@@ -238,13 +830,10 @@ class DatabaseManager:
         if new_status not in ('accepted', 'denied'):
             return False
         try:
-            self.cursor.execute("""
-            UPDATE patients 
-            SET doctor_status = ?
-            WHERE id = ?
-            """, (new_status, patient_id))
-            self.conn.commit()
-            return True
+            scope, params = self._scope("clinic_id")
+            updated = self._execute("update_patient_status", [new_status, patient_id] + params, scope=scope).rowcount > 0
+            self._commit()
+            return updated
         except sqlite3.Error as e:
             print(f"Error updating patient status: {e}")
             return False
@@ -252,93 +841,411 @@ class DatabaseManager:
 
     # --- NEW ADMIN FUNCTIONS ---
 
-    def get_all_users(self):
-        """Returns a list of all users."""
+    def get_all_users(self, sort_by="id", descending=False):
+        """Returns a list of all users (of the session's clinic), sorted by a User field."""
         try:
-            self.cursor.execute("SELECT id, full_name, phone, role, status, created_at FROM users")
-            return self.cursor.fetchall()
+            scope, params = self._scope("u.clinic_id", "WHERE")
+            return self._fetch_records(User, "get_all_users", params, scope=scope,
+                                       order_by=_order_by(USER_SORT_COLUMNS, sort_by, descending))
         except sqlite3.Error as e:
             print(f"Error fetching all users: {e}")
             return []
 
     def delete_user_by_admin(self, user_id, admin_id):
-        """Deletes any user. Prevents admin self-deletion."""
+        """
+        Deletes any user. Prevents admin self-deletion.
+        A deleted doctor's patients are unassigned and go back to 'pending'
+        (so a receptionist can assign them again); the user is removed from
+        the patients they registered and the visits they recorded.
+        """
         if user_id == admin_id:
             print("Admin cannot delete themselves.")
             return False # Admin cannot delete themselves
         try:
-            # Also delete patients created by this user if they are a receptionist
-            # Or unassign patients if they are a doctor (optional, but good practice)
-            
-            # For simplicity, we just delete the user.
-            # In a real app, you'd handle foreign key constraints.
-            
-            self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-            self.conn.commit()
+            # One statement per referencing column, then the delete, in one transaction
+            self._execute("unassign_doctor_patients", (user_id,))
+            self._execute("clear_patient_creator", (user_id,))
+            self._execute("clear_encounter_doctor", (user_id,))
+            self._execute("delete_user", (user_id,))
+            self._commit()
             return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Error deleting user: {e}")
             return False
 
-    def create_user_by_admin(self, full_name, phone, password, role):
-        """Admin-only function to create a new, active user of any role."""
+    def repair_orphans(self):
+        """
+        Fixes rows that refer to users or patients that no longer exist (left by
+        versions that did not enforce foreign keys): the delete_user_by_admin()
+        policy is applied to them, and visits of missing patients are deleted.
+        Returns {statement name: rows changed}, or None on failure.
+        """
+        repaired = {}
+        try:
+            for name in ("repair_patient_doctors", "repair_patient_creators",
+                         "repair_encounter_doctors", "delete_orphan_encounters"):
+                repaired[name] = self._execute(name).rowcount
+            self._commit()
+            return repaired
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Error repairing orphaned rows: {e}")
+            return None
+
+    def create_user_by_admin(self, full_name, phone, password, role, clinic_id=None):
+        """Admin-only function to create a new, active user of any role, optionally in a clinic."""
         if role not in ('admin', 'doctor', 'receptionist'):
             return False
         try:
             hashed_pass = self._hash_password(password)
-            self.cursor.execute("""
-            INSERT INTO users (full_name, phone, password, role, status)
-            VALUES (?, ?, ?, ?, 'active')
-            """, (full_name, phone, hashed_pass, role))
-            self.conn.commit()
+            self._execute("create_user_by_admin", (full_name, phone, hashed_pass, role, clinic_id))
+            self._commit()
+            self.login_limiter.forget_unknown(phone)
             return True
         except sqlite3.IntegrityError:
             return False # Phone already exists
         except sqlite3.Error as e:
             print(f"Error creating user by admin: {e}")
             return False
+
+    # --- CLINICS ---
+
+    def get_clinics(self):
+        """Returns every Clinic, by name."""
+        try:
+            return self._fetch_records(Clinic, "get_clinics")
+        except sqlite3.Error as e:
+            print(f"Error fetching clinics: {e}")
+            return []
+
+    def create_clinic(self, name):
+        """Adds a clinic. Returns its id, or False on failure (e.g. the name exists)."""
+        try:
+            self._execute("create_clinic", (name,))
+            clinic_id = self.cursor.lastrowid
+            self._commit()
+            return clinic_id
+        except sqlite3.IntegrityError:
+            return False # Name already exists
+        except sqlite3.Error as e:
+            print(f"Error creating clinic: {e}")
+            return False
+
+    def set_user_clinic(self, user_id, clinic_id):
+        """
+        Moves a user to a clinic (None: hospital-wide). Patients the user
+        registered or treats that belong to no clinic yet move along, so an
+        existing hospital can be split into clinics user by user.
+        """
+        try:
+            self._execute("set_user_clinic", (clinic_id, user_id))
+            if clinic_id is not None:
+                self._execute("move_creator_patients", (clinic_id, user_id))
+                self._execute("move_doctor_patients", (clinic_id, user_id))
+            self._commit()
+            return True
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Error setting user clinic: {e}")
+            return False
     
     # --- ADD THESE TWO NEW FUNCTIONS ---
 
     def get_patient_details(self, patient_id):
         """
         Fetches all editable details for a single patient.
-        Returns a tuple of the data.
+        Returns a PatientDetails record, or None if there is no such patient.
+        List views never carry these fields (address etc.); they are read
+        only when the edit dialog is opened for one patient.
         """
         try:
-            self.cursor.execute("""
-            SELECT first_name, last_name, date_of_birth, gender, 
-                   contact_phone, problem, address, blood_type
-            FROM patients 
-            WHERE id = ?
-            """, (patient_id,))
-            return self.cursor.fetchone() # Returns one tuple or None
+            scope, params = self._scope("clinic_id")
+            rows = self._fetch_records(PatientDetails, "get_patient_details", [patient_id] + params, scope=scope)
+            return rows[0] if rows else None
         except sqlite3.Error as e:
             print(f"Error fetching patient details: {e}")
             return None
 
     def update_patient(self, patient_id, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
-        """Updates an existing patient's record."""
+        """
+        Updates an existing patient's record.
+        A changed problem is also recorded as a new encounter, so earlier ones stay in the history.
+        """
         try:
-            self.cursor.execute("""
-            UPDATE patients SET
-                first_name = ?,
-                last_name = ?,
-                date_of_birth = ?,
-                gender = ?,
-                contact_phone = ?,
-                problem = ?,
-                address = ?,
-                blood_type = ?
-            WHERE id = ?
-            """, (first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, patient_id))
-            self.conn.commit()
+            dob = normalize_dob(dob)
+        except ValueError as e:
+            print(f"Error updating patient: {e}")
+            return False
+        try:
+            scope, params = self._scope("clinic_id")
+            row = self._execute("get_patient_problem", [patient_id] + params, scope=scope).fetchone()
+            if row is None:
+                return False # Not a current patient of this session
+            if row[0] != problem:
+                self._execute("add_system_encounter", (patient_id, problem, "Problem updated"))
+            self._execute("update_patient", [first_name, last_name, dob, gender, contact_phone, problem, address, blood_type,
+                          *blocking_keys(last_name, dob, contact_phone), patient_id] + params, scope=scope)
+            self._commit()
             return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Error updating patient: {e}")
             return False
 
     # --- END OF NEW FUNCTIONS ---
+
+    # --- ENCOUNTER (VISIT HISTORY) FUNCTIONS ---
+
+    def add_encounter(self, patient_id, doctor_id, diagnosis, notes, visit_date=None):
+        """Records a visit for a patient. visit_date defaults to now."""
+        try:
+            scope, params = self._scope("p.clinic_id")
+            added = self._execute("add_encounter", (visit_date, doctor_id, diagnosis, notes, patient_id, *params),
+                                  scope=scope).rowcount > 0
+            self._commit()
+            return added
+        except sqlite3.Error as e:
+            print(f"Error adding encounter: {e}")
+            return False
+
+    def get_patient_timeline(self, patient_id, limit=20, before=None):
+        """
+        Returns one page of a patient's encounters (Encounter records), newest first.
+        `before` is the (visit_date, id) of the last row of the previous page;
+        seeking past it through the (patient_id, visit_date) index keeps every
+        page equally cheap, however long the history gets.
+        """
+        try:
+            scope, params = self._scope("p.clinic_id")
+            if before is None:
+                return self._fetch_records(Encounter, "timeline_first_page", (patient_id, *params, limit), scope=scope)
+            else:
+                return self._fetch_records(Encounter, "timeline_next_page",
+                                           (patient_id, *params, before[0], before[1], limit), scope=scope)
+        except sqlite3.Error as e:
+            print(f"Error fetching patient timeline: {e}")
+            return []
+
+    # --- REPORT FUNCTIONS ---
+
+    def refresh_reports(self, full=False):
+        """Updates the report rollup tables (incrementally unless full=True)."""
+        try:
+            reports.refresh_rollups(self.cursor, full)
+            self._commit()
+            return True
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Error refreshing reports: {e}")
+            return False
+
+    def get_reports(self):
+        """Returns the pre-aggregated report data (see reports.read_report)."""
+        try:
+            return reports.read_report(self.cursor)
+        except sqlite3.Error as e:
+            print(f"Error reading reports: {e}")
+            return None
+
+    # --- ARCHIVE FUNCTIONS ---
+
+    @contextmanager
+    def _archive_read(self):
+        """
+        ATTACHes the archive database read-only for the duration of a with-block.
+        Searches never create, migrate or commit anything; callers check that the file exists.
+        """
+        uri = "file:" + pathname2url(os.path.abspath(self.archive_path)) + "?mode=ro"
+        self.cursor.execute("ATTACH DATABASE ? AS archive", (uri,))
+        try:
+            yield
+        finally:
+            self.cursor.execute("DETACH DATABASE archive")
+
+    @contextmanager
+    def _archive_attached(self):
+        """
+        ATTACHes the archive database for writing (archive_patients, restore_patient),
+        creating or migrating its tables first. Work done inside the block is
+        committed on success and rolled back on error.
+        """
+        self.cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        try:
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive.patients (
+                id INTEGER PRIMARY KEY,
+                first_name TEXT NOT NULL,
+                last_name TEXT NOT NULL,
+                date_of_birth TEXT NOT NULL,
+                gender TEXT,
+                contact_phone TEXT,
+                problem TEXT,
+                address TEXT,
+                blood_type TEXT,
+                assigned_doctor_id INTEGER,
+                doctor_status TEXT,
+                created_by_receptionist_id INTEGER,
+                created_at DATETIME,
+                deleted_at DATETIME,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                clinic_id INTEGER,
+                dup_name_key TEXT,
+                dup_phone_key TEXT,
+                legacy_id INTEGER,
+                row_version INTEGER
+            );
+            """)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive.encounters (
+                id INTEGER PRIMARY KEY,
+                patient_id INTEGER NOT NULL,
+                visit_date DATETIME NOT NULL,
+                doctor_id INTEGER,
+                diagnosis TEXT,
+                notes TEXT,
+                created_at DATETIME
+            );
+            """)
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS archive.idx_archive_encounters_patient_visit
+            ON encounters (patient_id, visit_date)
+            """)
+            # Archives written by older versions
+            self.cursor.execute("PRAGMA archive.table_info(patients)")
+            existing_columns = [row[1] for row in self.cursor.fetchall()]
+            for column, definition in ARCHIVE_ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    self.cursor.execute(f"ALTER TABLE archive.patients ADD COLUMN {column} {definition}")
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.cursor.execute("DETACH DATABASE archive")
+
+    def archive_patients(self, older_than_days=365, batch_size=500):
+        """
+        Moves patients out of the hot table into the archive database.
+        A patient is archived if it was soft-deleted, or if it is no longer
+        waiting on a doctor (not 'pending') and has had no activity for
+        `older_than_days`: no registration, assignment, status change or visit
+        since then. A patient still being seen keeps getting visits and stays.
+        Each batch is committed separately so the write lock is never held long.
+        Returns the number of archived patients, or None on failure.
+        """
+        columns = ", ".join(ARCHIVED_PATIENT_COLUMNS)
+        encounter_columns = ", ".join(ARCHIVED_ENCOUNTER_COLUMNS)
+        archived = 0
+        last_id = 0 # Walks the table once in id order; patients still active are not looked at again
+        try:
+            with self._archive_attached():
+                while True:
+                    # Newest visit per patient: one seek on the (patient_id, visit_date) index
+                    self.cursor.execute("""
+                    SELECT p.id FROM main.patients p
+                    WHERE p.id > ?
+                      AND (p.deleted_at IS NOT NULL
+                           OR (p.doctor_status != 'pending'
+                               AND MAX(p.created_at, COALESCE(p.status_changed_at, ''),
+                                       COALESCE((SELECT MAX(e.visit_date) FROM main.encounters e
+                                                 WHERE e.patient_id = p.id), '')) < datetime('now', ?)))
+                    ORDER BY p.id
+                    LIMIT ?
+                    """, (last_id, f"-{int(older_than_days)} days", batch_size))
+                    ids = [row[0] for row in self.cursor.fetchall()]
+                    if not ids:
+                        break
+                    last_id = ids[-1]
+                    placeholders = ", ".join("?" * len(ids))
+                    self.cursor.execute(f"""
+                    INSERT INTO archive.patients ({columns}, archived_at)
+                    SELECT {columns}, CURRENT_TIMESTAMP FROM main.patients WHERE id IN ({placeholders})
+                    """, ids)
+                    self.cursor.execute(f"""
+                    INSERT INTO archive.encounters ({encounter_columns})
+                    SELECT {encounter_columns} FROM main.encounters WHERE patient_id IN ({placeholders})
+                    """, ids)
+                    self.cursor.execute(f"DELETE FROM main.encounters WHERE patient_id IN ({placeholders})", ids)
+                    self.cursor.execute(f"DELETE FROM main.patients WHERE id IN ({placeholders})", ids)
+                    self.conn.commit()
+                    archived += len(ids)
+            return archived
+        except sqlite3.Error as e:
+            print(f"Error archiving patients: {e}")
+            return None
+
+    def search_patients(self, term, include_archive=True):
+        """
+        Searches patients by ID, name or contact phone.
+        Falls back to the archive database when nothing matches in the hot table;
+        archived results are returned with 'archived' as their doctor status.
+        Rows have the same shape as get_all_patients().
+        """
+        term = term.strip()
+        like = f"%{term}%"
+        patient_id = int(term) if term.isdigit() else -1
+        try:
+            scope, params = self._scope("p.clinic_id")
+            results = self._fetch_records(PatientSummary, "search_patients", [patient_id, like, like] + params, scope=scope)
+            if results or not include_archive or not os.path.exists(self.archive_path):
+                return results
+
+            scope, params = self._scope("a.clinic_id")
+            with self._archive_read():
+                return self._fetch_records(PatientSummary, "search_archived_patients", [patient_id, like, like] + params,
+                                           scope=scope)
+        except sqlite3.Error as e:
+            print(f"Error searching patients: {e}")
+            return []
+
+    def is_patient_archived(self, patient_id):
+        """Returns True if the patient only exists in the archive database."""
+        if not os.path.exists(self.archive_path):
+            return False
+        try:
+            with self._archive_read():
+                scope, params = self._scope("clinic_id")
+                self.cursor.execute(f"SELECT 1 FROM archive.patients WHERE id = ? {scope}", (patient_id, *params))
+                return self.cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            print(f"Error checking archive: {e}")
+            return False
+
+    def restore_patient(self, patient_id):
+        """Moves an archived patient back into the hot table (un-deleting it)."""
+        columns = ", ".join(ARCHIVED_PATIENT_COLUMNS)
+        encounter_columns = ", ".join(ARCHIVED_ENCOUNTER_COLUMNS)
+        try:
+            scope, params = self._scope("a.clinic_id")
+            with self._archive_attached():
+                self.cursor.execute(f"""
+                INSERT INTO main.patients ({columns})
+                SELECT {_restored_values(ARCHIVED_PATIENT_COLUMNS)} FROM archive.patients a WHERE a.id = ? {scope}
+                """, (patient_id, *params))
+                if self.cursor.rowcount == 0:
+                    return False
+                self.cursor.execute("UPDATE main.patients SET deleted_at = NULL WHERE id = ?", (patient_id,))
+                # Patients archived before the blocking keys were archived get them back for duplicate detection
+                self.cursor.execute("""
+                SELECT last_name, date_of_birth, contact_phone FROM main.patients
+                WHERE id = ? AND dup_name_key IS NULL AND dup_phone_key IS NULL
+                """, (patient_id,))
+                row = self.cursor.fetchone()
+                if row:
+                    self.cursor.execute("UPDATE main.patients SET dup_name_key = ?, dup_phone_key = ? WHERE id = ?",
+                                        (*blocking_keys(*row), patient_id))
+                self.cursor.execute(f"""
+                INSERT INTO main.encounters ({encounter_columns})
+                SELECT {_restored_values(ARCHIVED_ENCOUNTER_COLUMNS)} FROM archive.encounters a WHERE a.patient_id = ?
+                """, (patient_id,))
+                self.cursor.execute("DELETE FROM archive.encounters WHERE patient_id = ?", (patient_id,))
+                self.cursor.execute("DELETE FROM archive.patients WHERE id = ?", (patient_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error restoring patient: {e}")
+            return False
     
     def __del__(self):
         """Close the database connection when the object is destroyed."""
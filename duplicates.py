@@ -0,0 +1,205 @@
+"""
+Duplicate patient detection.
+
+Patients are grouped by cheap "blocking keys" that are stored (and indexed) on
+every patient row, so finding candidates for a new patient is an index lookup
+instead of a full table scan. Candidates are then scored with Jaro-Winkler
+name similarity plus exact DOB / phone matches.
+
+Run as a script to scan a whole database for existing duplicates:
+    python duplicates.py hms.db
+"""
+import os
+import sys
+
+import jobs
+
+DUPLICATE_THRESHOLD = 0.75 # Scores at or above this are reported as likely duplicates
+BLOCKING_KEY_COLUMNS = ("dup_name_key", "dup_phone_key") # Indexed patients columns, see blocking_keys()
+
+_SOUNDEX_CODES = {}
+for _letters, _code in (("BFPV", "1"), ("CGJKQSXZ", "2"), ("DT", "3"), ("L", "4"), ("MN", "5"), ("R", "6")):
+    for _letter in _letters:
+        _SOUNDEX_CODES[_letter] = _code
+
+
+def soundex(name):
+    """Returns the 4-character American Soundex code of a name (e.g. 'Robert' -> 'R163')."""
+    letters = [c for c in name.upper() if c.isalpha()]
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = _SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'H' and 'W' do not separate letters with the same code; vowels do
+        if letter not in "HW":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def normalize_phone(phone):
+    """Keeps the last 10 digits of a phone number, or returns None if there are none."""
+    digits = "".join(c for c in (phone or "") if c.isdigit())
+    return digits[-10:] or None
+
+
+def blocking_keys(last_name, dob, phone):
+    """
+    Returns the (name_key, phone_key) blocking keys stored on a patient row.
+    Two patients are only compared if they share at least one key.
+    """
+    sound = soundex(last_name or "")
+    name_key = f"{sound}|{dob}" if sound and dob else None
+    return name_key, normalize_phone(phone)
+
+
+def jaro_winkler(a, b):
+    """Jaro-Winkler similarity between two strings, from 0.0 (different) to 1.0 (equal)."""
+    if a == b:
+        return 1.0
+    len_a, len_b = len(a), len(b)
+    if not len_a or not len_b:
+        return 0.0
+
+    window = max(max(len_a, len_b) // 2 - 1, 0)
+    a_matched = [False] * len_a
+    b_matched = [False] * len_b
+    matches = 0
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(i + window + 1, len_b)):
+            if not b_matched[j] and b[j] == char:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+
+    # Count transpositions between the matched characters
+    b_chars = [b[j] for j in range(len_b) if b_matched[j]]
+    transpositions = 0
+    k = 0
+    for i in range(len_a):
+        if a_matched[i]:
+            if a[i] != b_chars[k]:
+                transpositions += 1
+            k += 1
+    jaro = (matches / len_a + matches / len_b + (matches - transpositions / 2) / matches) / 3
+
+    prefix = 0
+    for char_a, char_b in zip(a[:4], b[:4]):
+        if char_a != char_b:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def match_score(patient_a, patient_b):
+    """
+    Scores how likely two patients are the same person (0.0 - 1.0).
+    Each patient is a (first_name, last_name, dob, phone) tuple.
+    """
+    first_a, last_a, dob_a, phone_a = patient_a
+    first_b, last_b, dob_b, phone_b = patient_b
+    name_score = (jaro_winkler(first_a.lower(), first_b.lower()) + jaro_winkler(last_a.lower(), last_b.lower())) / 2
+    dob_score = 1.0 if dob_a and dob_a == dob_b else 0.0
+    phone_a, phone_b = normalize_phone(phone_a), normalize_phone(phone_b)
+    phone_score = 1.0 if phone_a and phone_a == phone_b else 0.0
+    return 0.5 * name_score + 0.3 * dob_score + 0.2 * phone_score
+
+
+# --- BATCH SCAN ---
+
+def _score_blocks(blocks, threshold):
+    """Worker: scores every pair inside each block. Returns (score, id_a, id_b) tuples."""
+    pairs = []
+    for rows in blocks:
+        for i, (id_a, *patient_a) in enumerate(rows):
+            for id_b, *patient_b in rows[i + 1:]:
+                score = match_score(patient_a, patient_b)
+                if score >= threshold:
+                    pairs.append((round(score, 3), id_a, id_b))
+    return pairs
+
+
+def _key_ranges(conn, key_column, partitions):
+    """
+    Splits the values of a blocking key into at most `partitions` ranges holding
+    about as many patients each, as (first_key, stop_key) pairs: first_key
+    included, stop_key excluded (None for the last range). A key never spans
+    two ranges, so neither does its block. The split points are read off the
+    key's index, once, here in the calling process.
+    """
+    total = conn.execute(f"SELECT COUNT(*) FROM patients WHERE {key_column} IS NOT NULL").fetchone()[0]
+    if not total:
+        return []
+    step = -(-total // partitions) # Ceiling division
+    starts = sorted({conn.execute(f"""
+        SELECT {key_column} FROM patients WHERE {key_column} IS NOT NULL ORDER BY {key_column} LIMIT 1 OFFSET ?
+        """, (offset,)).fetchone()[0] for offset in range(0, total, step)})
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _load_blocks(conn, key_column, first_key, stop_key, last_id):
+    """
+    Reads the patients whose blocking key lies in [first_key, stop_key), in key
+    order along the key's index, and groups them into blocks of 2+ rows
+    sharing a key. Patients registered after the scan started (id > last_id) are left out.
+    """
+    below_stop, params = (f"AND {key_column} < ?", (first_key, stop_key)) if stop_key is not None else ("", (first_key,))
+    # "+deleted_at": walk the key's index in order, not idx_patients_deleted_at (see queries.py)
+    cursor = conn.execute(f"""
+    SELECT {key_column}, id, first_name, last_name, date_of_birth, contact_phone
+    FROM patients
+    WHERE {key_column} >= ? {below_stop} AND +deleted_at IS NULL AND id <= ?
+    ORDER BY {key_column}, id
+    """, (*params, last_id))
+    blocks = []
+    current_key = None
+    for key, *row in cursor:
+        if key != current_key:
+            blocks.append([])
+            current_key = key
+        blocks[-1].append(tuple(row))
+    return [rows for rows in blocks if len(rows) > 1]
+
+
+def _scan_key_range(conn, first_key, stop_key, key_column, last_id, threshold):
+    """Job (see jobs.py): loads and scores the blocks of one range of a blocking key."""
+    return _score_blocks(_load_blocks(conn, key_column, first_key, stop_key, last_id), threshold)
+
+
+def find_duplicate_pairs(db_path="hms.db", workers=None, threshold=DUPLICATE_THRESHOLD, partitions=None):
+    """
+    Scans the whole patients table for likely duplicates. The values of each
+    blocking key are split into ranges, and each worker process reads and
+    scores the blocks of one range on its own read-only connection.
+    Returns sorted (score, id_a, id_b) tuples, best first.
+    """
+    partitions = partitions or workers or os.cpu_count() or 1
+    conn = jobs.connect_read_only(db_path)
+    try:
+        last_id = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+        key_ranges = {key_column: _key_ranges(conn, key_column, partitions) for key_column in BLOCKING_KEY_COLUMNS}
+    finally:
+        conn.close()
+    pairs = {}
+    for key_column, ranges in key_ranges.items():
+        for partition_pairs in jobs.run_partitioned(_scan_key_range, db_path, args=(key_column, last_id, threshold),
+                                                    workers=workers, ranges=ranges):
+            # A pair may share both keys; keep it once
+            for score, id_a, id_b in partition_pairs:
+                pairs[(id_a, id_b)] = score
+    return sorted(((score, id_a, id_b) for (id_a, id_b), score in pairs.items()), reverse=True)
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "hms.db"
+    duplicate_pairs = find_duplicate_pairs(db_path)
+    for score, id_a, id_b in duplicate_pairs:
+        print(f"{score:.2f}  patient {id_a}  <->  patient {id_b}")
+    print(f"{len(duplicate_pairs)} likely duplicate pair(s) found.")
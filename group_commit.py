@@ -0,0 +1,156 @@
+"""
+Group commit: a dedicated writer thread that applies DatabaseManager writes
+in small batches, one transaction (and one disk sync) per batch.
+
+Every DatabaseManager write method commits on its own, so N writes cost N
+disk syncs. With many desks registering patients at once that sync dominates
+latency. GroupCommitWriter queues writes from any number of threads; the
+writer takes every write that queued up while it was busy with the previous
+commit (at most `batch_max`, optionally waiting `batch_delay` seconds for
+more), runs each one under its own savepoint inside one transaction, and
+commits once. Batches therefore grow with the load on their own: a lone
+write is committed immediately, and under a burst one sync covers many
+writes. Each caller gets its result only after that commit, so an
+acknowledged write is on disk.
+
+    writer = GroupCommitWriter("hms.db")
+    writer.call("create_patient", "Ann", "Lee", "1990-01-01", ...) # blocks until committed
+    future = writer.submit("add_encounter", 7, 2, "Flu", "")        # or wait later
+    writer.close()
+
+server.py uses this as its single writer; benchmarks/insert_throughput.py
+compares it against committing every insert.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from db_manager import DatabaseManager
+
+# DatabaseManager methods that write
+WRITE_METHODS = {
+    "register_user", "approve_registration", "deny_registration",
+    "create_admin_user", "create_patient", "delete_patient",
+    "assign_patient_to_doctor", "update_patient_status_by_doctor",
+    "delete_user_by_admin", "create_user_by_admin", "update_patient",
+    "add_encounter", "refresh_reports", "mark_doctor_events_seen",
+    "create_clinic", "set_user_clinic",
+    "check_credentials", # Counts failed logins and locks accounts (see login_limits.py)
+    # These manage their own transactions (or ATTACH a database), so they are never batched
+    "archive_patients", "restore_patient",
+}
+UNBATCHED_WRITE_METHODS = {"archive_patients", "restore_patient"}
+
+_STOP = object() # Queue sentinel: finish the queued writes, then exit
+
+
+class GroupCommitWriter:
+    """Owns the only writing connection to a database and commits queued writes in batches."""
+
+    def __init__(self, db_path="hms.db", batch_max=64, batch_delay=0.0, synchronous="FULL"):
+        self.db_path = db_path
+        self.batch_max = batch_max # Most writes committed together
+        self.batch_delay = batch_delay # Extra seconds to wait for more writes (0: take what is queued)
+        self.synchronous = synchronous # FULL: a commit is on disk when it is acknowledged
+        self.batches_committed = 0
+        self.writes_committed = 0
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hms-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait() # The schema is checked before the first write is accepted
+
+    def submit(self, method_name, *args, clinic_id=None):
+        """
+        Queues one write and returns a Future that resolves once it is committed.
+        The write runs scoped to clinic_id (see DatabaseManager.scoped).
+        """
+        if method_name not in WRITE_METHODS:
+            raise ValueError(f"'{method_name}' is not a write method")
+        future = Future()
+        self._queue.put((method_name, args, future, clinic_id))
+        return future
+
+    def call(self, method_name, *args, clinic_id=None):
+        """Queues one write and waits until it is committed. Returns the method's result."""
+        return self.submit(method_name, *args, clinic_id=clinic_id).result()
+
+    def queued(self):
+        """Number of writes waiting for the writer."""
+        return self._queue.qsize()
+
+    def close(self):
+        """Commits everything already queued, then stops the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _open(self):
+        db = DatabaseManager(self.db_path)
+        # WAL: readers on other connections keep reading while a batch is written,
+        # and a commit appends to the log instead of rewriting pages in place
+        db.cursor.execute("PRAGMA journal_mode=WAL")
+        db.cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+        return db
+
+    def _run(self):
+        db = self._open()
+        self._ready.set()
+        held = None # A write that could not join the previous batch
+        while True:
+            item = held if held is not None else self._queue.get()
+            if item is _STOP:
+                break
+            batch, held = self._collect(item)
+            self._apply(db, batch)
+        db.conn.close()
+
+    def _collect(self, first):
+        """
+        Gathers the writes queued behind `first`, plus any arriving within
+        batch_delay (up to batch_max in total).
+        Returns (batch, held), where `held` must start the next batch.
+        """
+        batch = [first]
+        if first[0] in UNBATCHED_WRITE_METHODS:
+            return batch, None # Always runs alone
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_max:
+            try:
+                timeout = deadline - time.monotonic()
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP or item[0] in UNBATCHED_WRITE_METHODS:
+                return batch, item
+            batch.append(item)
+        return batch, None
+
+    def _apply(self, db, batch):
+        """Runs one batch in one transaction and answers every caller after the commit."""
+        try:
+            if len(batch) == 1 and batch[0][0] in UNBATCHED_WRITE_METHODS:
+                method_name, args, _, clinic_id = batch[0]
+                with db.scoped(clinic_id):
+                    results = [getattr(db, method_name)(*args)]
+            else:
+                results = []
+                with db.batch():
+                    for method_name, args, _, clinic_id in batch:
+                        with db.scoped(clinic_id):
+                            try:
+                                results.append(db.call_in_batch(method_name, *args))
+                            except Exception as e: # A bad call (e.g. malformed arguments) fails alone
+                                results.append(e)
+                self.batches_committed += 1
+                self.writes_committed += sum(1 for result in results if not isinstance(result, Exception))
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        # Only acknowledge once the batch is committed (durable)
+        for (_, _, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,77 @@
+"""
+Per-doctor notification inbox: "patient X was assigned to you".
+
+A trigger on `patients` appends a row to `doctor_events` whenever a patient is
+assigned to a doctor ('assigned'), and tells the previous doctor when a patient
+is moved to someone else ('unassigned'). Because it is a trigger, the event is
+written in the same transaction as the assignment, whichever connection makes
+it: assign_patient_to_doctor(), a replica copying the primary's rows, a
+restore from backup.
+
+Restoring an archived patient is not an assignment: restore_patient() inserts
+the row as deleted and then clears deleted_at, which neither trigger reacts to.
+
+Event ids only ever grow (AUTOINCREMENT), so a doctor's desk keeps the id of
+the newest event it has seen and asks for anything after it: one range read on
+the (doctor_id, id) index instead of reloading the whole patient list. The id
+up to which a doctor has looked at their events is kept in `doctor_inbox`, so
+events that arrived while they were logged out still show up as new.
+"""
+
+EVENT_RETENTION_DAYS = 30 # Older events are deleted by maintenance (see maintenance.py)
+
+
+def create_inbox(cursor):
+    """Creates the event and inbox tables and the triggers that fill them."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctor_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        patient_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    # (doctor_id) also holds the rowid, so "doctor_id = ? AND id > ?" is one index range
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctor_events_doctor ON doctor_events (doctor_id)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctor_inbox (
+        doctor_id INTEGER PRIMARY KEY,
+        last_seen_id INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_inbox_insert AFTER INSERT ON patients
+    WHEN NEW.assigned_doctor_id IS NOT NULL AND NEW.deleted_at IS NULL
+    BEGIN
+        INSERT INTO doctor_events (doctor_id, kind, patient_id) VALUES (NEW.assigned_doctor_id, 'assigned', NEW.id);
+    END
+    """)
+    # A new doctor, or the same doctor again after the patient was accepted or denied
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_inbox_update
+    AFTER UPDATE OF assigned_doctor_id, doctor_status ON patients
+    WHEN NEW.deleted_at IS NULL AND (OLD.assigned_doctor_id IS NOT NEW.assigned_doctor_id
+                                     OR (OLD.doctor_status != 'pending' AND NEW.doctor_status = 'pending'))
+    BEGIN
+        INSERT INTO doctor_events (doctor_id, kind, patient_id)
+        SELECT OLD.assigned_doctor_id, 'unassigned', NEW.id
+        WHERE OLD.assigned_doctor_id IS NOT NULL AND OLD.assigned_doctor_id IS NOT NEW.assigned_doctor_id;
+        INSERT INTO doctor_events (doctor_id, kind, patient_id)
+        SELECT NEW.assigned_doctor_id, 'assigned', NEW.id WHERE NEW.assigned_doctor_id IS NOT NULL;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_inbox_delete AFTER DELETE ON users
+    BEGIN
+        DELETE FROM doctor_events WHERE doctor_id = OLD.id;
+        DELETE FROM doctor_inbox WHERE doctor_id = OLD.id;
+    END
+    """)
+
+
+def prune_doctor_events(cursor, older_than_days=EVENT_RETENTION_DAYS):
+    """Deletes events older than `older_than_days`. Returns the number of deleted events. The caller commits."""
+    cursor.execute("DELETE FROM doctor_events WHERE created_at < datetime('now', ?)",
+                   (f"-{int(older_than_days)} days",))
+    return cursor.rowcount
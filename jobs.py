@@ -0,0 +1,193 @@
+"""
+Multi-process runner for heavy read-only jobs (exports, full-history reports,
+duplicate scans).
+
+Such jobs never run on the GUI's (or the server's) connection. run_partitioned()
+splits a table into `id` ranges and hands each range to a worker process, which
+opens its own read-only connection (`mode=ro` URI, so a job can never write)
+and returns a partial result; the partial results are then merged in the
+calling process, in id order as they complete (iter_partitioned). SQLite allows
+any number of concurrent readers, so a long job uses every core while the
+application keeps working.
+
+The ranges end at the table's MAX(id) read once when the job starts, so every
+worker is pinned to the same upper bound and rows registered while the job
+runs are left out of all of them.
+
+Jobs are plain module-level functions `job(conn, first_id, last_id, *args)` so
+they can be sent to the worker processes. A job that splits its work on
+something else than `id` (duplicates.py splits on the blocking keys) passes
+its own `ranges`; the bounds are handed to the job as they are.
+
+    python jobs.py export hms.db patients.csv
+    python jobs.py stats hms.db
+"""
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.request import pathname2url
+
+
+def connect_read_only(db_path):
+    """Opens a connection that can only read (writes fail with 'readonly database')."""
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True)
+
+
+def id_ranges(db_path, table="patients", partitions=None):
+    """Splits the table's id span into at most `partitions` inclusive (first_id, last_id) ranges."""
+    partitions = partitions or os.cpu_count() or 1
+    conn = connect_read_only(db_path)
+    try:
+        low, high = conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+    finally:
+        conn.close()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // partitions)) # Ceiling division
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def _run_partition(job, db_path, first_id, last_id, args):
+    """Worker: runs one job partition on its own read-only connection."""
+    conn = connect_read_only(db_path)
+    try:
+        return job(conn, first_id, last_id, *args)
+    finally:
+        conn.close()
+
+
+def iter_partitioned(job, db_path="hms.db", table="patients", args=(), workers=None, partitions=None, ranges=None):
+    """
+    Runs job(conn, first_id, last_id, *args) over id ranges of `table` (or
+    over the given `ranges`) in worker processes and yields the partial
+    results in range order, each as soon as it and every range before it are done.
+    """
+    if ranges is None:
+        ranges = id_ranges(db_path, table, partitions or workers)
+    if not ranges:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_partition, job, db_path, first_id, last_id, args): index
+                   for index, (first_id, last_id) in enumerate(ranges)}
+        finished = {} # index -> result of ranges done ahead of an earlier one
+        next_index = 0
+        for future in as_completed(futures):
+            finished[futures[future]] = future.result()
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+
+def run_partitioned(job, db_path="hms.db", table="patients", args=(), workers=None, partitions=None, ranges=None):
+    """Like iter_partitioned(), but returns all partial results (in range order) as a list."""
+    return list(iter_partitioned(job, db_path, table, args, workers, partitions, ranges))
+
+
+# --- Patient export ---
+
+EXPORT_COLUMNS = (
+    "id", "first_name", "last_name", "date_of_birth", "gender", "contact_phone",
+    "problem", "address", "blood_type", "assigned_doctor", "doctor_status", "created_at"
+)
+
+
+EXPORT_PARTITIONS_PER_WORKER = 4 # More, smaller parts: the first ones are appended while later ones still run
+
+
+def _export_partition(conn, first_id, last_id, part_dir):
+    """Job: writes one id range to its own CSV part file. Returns (path, rows written)."""
+    part_path = os.path.join(part_dir, f"part-{first_id}.csv")
+    rows = conn.execute("""
+    SELECT p.id, p.first_name, p.last_name, p.date_of_birth, p.gender, p.contact_phone,
+           p.problem, p.address, p.blood_type, u.full_name, p.doctor_status, p.created_at
+    FROM patients p
+    LEFT JOIN users u ON p.assigned_doctor_id = u.id
+    WHERE p.id BETWEEN ? AND ? AND p.deleted_at IS NULL
+    ORDER BY p.id
+    """, (first_id, last_id))
+    written = 0
+    with open(part_path, "w", newline="", encoding="utf-8") as part:
+        writer = csv.writer(part)
+        for row in rows: # Streamed from the cursor, never the whole range in memory
+            writer.writerow(row)
+            written += 1
+    return part_path, written
+
+
+def export_patients_csv(db_path, out_path, workers=None):
+    """
+    Writes every current patient to a CSV file. Returns the number of rows written.
+    Each worker writes its range to a part file next to out_path; the parts are
+    appended to the output in id order as they finish and then deleted.
+    """
+    workers = workers or os.cpu_count() or 1
+    written = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as part_dir, \
+            open(out_path, "w", newline="", encoding="utf-8") as out:
+        csv.writer(out).writerow(EXPORT_COLUMNS)
+        for part_path, rows in iter_partitioned(_export_partition, db_path, args=(part_dir,), workers=workers,
+                                                partitions=workers * EXPORT_PARTITIONS_PER_WORKER):
+            with open(part_path, newline="", encoding="utf-8") as part:
+                shutil.copyfileobj(part, out)
+            os.remove(part_path)
+            written += rows
+    return written
+
+
+# --- Full-history statistics ---
+
+def _patient_stats(conn, first_id, last_id):
+    stats = {"patients": 0, "deleted": 0, "by_status": Counter(), "by_blood_type": Counter(),
+             "by_gender": Counter(), "by_month": Counter()}
+    for status, blood_type, gender, month, deleted, count in conn.execute("""
+    SELECT doctor_status, COALESCE(blood_type, 'Unknown'), COALESCE(gender, 'Unknown'),
+           strftime('%Y-%m', created_at), deleted_at IS NOT NULL, COUNT(*)
+    FROM patients
+    WHERE id BETWEEN ? AND ?
+    GROUP BY 1, 2, 3, 4, 5
+    """, (first_id, last_id)):
+        if deleted:
+            stats["deleted"] += count
+            continue
+        stats["patients"] += count
+        stats["by_status"][status] += count
+        stats["by_blood_type"][blood_type] += count
+        stats["by_gender"][gender] += count
+        stats["by_month"][month] += count
+    return stats
+
+
+def patient_statistics(db_path, workers=None):
+    """
+    Counts patients over the whole history (by status, blood type, gender and
+    registration month). Returns a dict of totals and Counters.
+    """
+    totals = {"patients": 0, "deleted": 0, "by_status": Counter(), "by_blood_type": Counter(),
+              "by_gender": Counter(), "by_month": Counter()}
+    for partial in run_partitioned(_patient_stats, db_path, workers=workers):
+        for key, value in partial.items():
+            totals[key] += value
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "stats") or (sys.argv[1] == "export" and len(sys.argv) < 4):
+        print("Usage: python jobs.py export <database> <out.csv>")
+        print("       python jobs.py stats <database>")
+        sys.exit(2)
+    if sys.argv[1] == "export":
+        count = export_patients_csv(sys.argv[2], sys.argv[3])
+        print(f"Exported {count} patient(s) to {sys.argv[3]}.")
+    else:
+        result = patient_statistics(sys.argv[2])
+        print(f"Patients: {result['patients']} (plus {result['deleted']} deleted, not yet archived)")
+        for title, key in (("Status", "by_status"), ("Blood type", "by_blood_type"),
+                           ("Gender", "by_gender"), ("Registered per month", "by_month")):
+            print(f"{title}:")
+            for name, count in sorted(result[key].items()):
+                print(f"    {name}: {count}")
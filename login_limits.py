@@ -0,0 +1,156 @@
+"""
+Brute-force protection for check_credentials().
+
+Every login attempt costs a password hash (and a database lookup), so an
+unthrottled login endpoint lets anyone burn CPU by guessing. Before anything
+is hashed, an attempt has to get past:
+
+1. two token buckets: one per workstation (server.py: per client address) and
+   one per phone number. A bucket allows a short burst and then a steady
+   rate, so a script hammering the login gets refused in memory, cheaply.
+   The lookups the login and registration screens make before there is a
+   session (is_phone_registered, login_retry_after) take from the same
+   workstation bucket, so they cannot be used to probe phone numbers instead;
+2. a negative cache of phone numbers that belong to no user, so guessing
+   random numbers does not reach the database either;
+3. a lockout kept in the database (`login_attempts`): after MAX_FAILURES
+   wrong passwords in a row the account refuses logins for LOCKOUT_SECONDS,
+   on every desk and across restarts. A successful login clears the count.
+
+The in-memory state is shared by every connection of a process to the same
+database file (limiter_for), e.g. all of server.py's reader connections.
+"""
+import threading
+import time
+
+PHONE_BURST = 5 # Attempts one phone number may make at once...
+PHONE_RATE = 1 / 12 # ...then one every 12 seconds
+WORKSTATION_BURST = 20 # Attempts one workstation may make at once...
+WORKSTATION_RATE = 1.0 # ...then one per second
+MAX_FAILURES = 5 # Wrong passwords in a row before an account is locked
+LOCKOUT_SECONDS = 15 * 60
+UNKNOWN_PHONE_TTL = 60 # Seconds a phone number with no user is remembered as such
+MAX_TRACKED = 10000 # Buckets / unknown phones kept before idle ones are dropped
+LOCAL_WORKSTATION = "local" # Workstation key of logins typed on this machine (server.py uses client addresses)
+
+
+def create_login_attempts(cursor):
+    """Creates the table of consecutive failed logins per phone number."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS login_attempts (
+        phone TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL DEFAULT 0,
+        locked_until REAL NOT NULL DEFAULT 0,
+        last_failure_at REAL
+    );
+    """)
+
+
+class TokenBucket:
+    """Holds up to `capacity` tokens and gains `rate` tokens per second."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Takes one token. Returns False (taking nothing) if the bucket is empty."""
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class LoginLimiter:
+    """Token buckets and the unknown-phone cache for one database (thread-safe)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._phones = {} # phone -> TokenBucket
+        self._workstations = {} # workstation -> TokenBucket
+        self._unknown = {} # phone -> time until which it is known to have no user
+
+    def _bucket(self, buckets, key, capacity, rate, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_TRACKED:
+                # A full bucket is the same as a new one, so it can be forgotten
+                for idle in [k for k, b in buckets.items() if b.is_full(now)]:
+                    del buckets[idle]
+            bucket = buckets[key] = TokenBucket(capacity, rate, now)
+        return bucket
+
+    def allow(self, phone, workstation):
+        """
+        Takes a token for the workstation and for the phone. Returns False if
+        either is exhausted, or if the phone is known to have no user.
+        """
+        with self._lock:
+            now = self.clock()
+            if not self._bucket(self._workstations, workstation, WORKSTATION_BURST, WORKSTATION_RATE, now).take(now):
+                return False
+            if not self._bucket(self._phones, phone, PHONE_BURST, PHONE_RATE, now).take(now):
+                return False
+            expires = self._unknown.get(phone)
+            if expires is not None:
+                if expires > now:
+                    return False
+                del self._unknown[phone]
+            return True
+
+    def allow_lookup(self, workstation):
+        """Takes a token for the workstation only. Returns False if it is exhausted."""
+        with self._lock:
+            now = self.clock()
+            return self._bucket(self._workstations, workstation, WORKSTATION_BURST, WORKSTATION_RATE, now).take(now)
+
+    def wait(self, phone, workstation=None):
+        """Seconds until the phone's bucket (and the workstation's, if given) allows another attempt."""
+        with self._lock:
+            now = self.clock()
+            buckets = [self._phones.get(phone), self._workstations.get(workstation)]
+            return max([bucket.wait(now) for bucket in buckets if bucket], default=0)
+
+    def remember_unknown(self, phone):
+        """Records that no user has this phone (for UNKNOWN_PHONE_TTL seconds)."""
+        with self._lock:
+            now = self.clock()
+            if len(self._unknown) >= MAX_TRACKED:
+                self._unknown = {p: expires for p, expires in self._unknown.items() if expires > now}
+            self._unknown[phone] = now + UNKNOWN_PHONE_TTL
+
+    def forget_unknown(self, phone):
+        """Called when a user gets this phone (registration), so they can log in at once."""
+        with self._lock:
+            self._unknown.pop(phone, None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(db_path):
+    """Returns the LoginLimiter shared by every connection of this process to db_path."""
+    with _limiters_lock:
+        limiter = _limiters.get(db_path)
+        if limiter is None:
+            limiter = _limiters[db_path] = LoginLimiter()
+        return limiter
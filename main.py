@@ -1,28 +1,48 @@
+import time
+_PROCESS_START = time.perf_counter() # Start of startup-time measurement
+
+import os
 import sys
 import ctypes
-from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget, QMessageBox
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget, QMessageBox, QSystemTrayIcon, QStyle
+from PyQt5.QtCore import Qt, QTimer, QObject, QEvent, pyqtSignal
 from PyQt5.QtGui import QIcon
 
 # Import our custom classes
 from db_manager import DatabaseManager
+from row_cache import RowCache
+from background_lookups import BackgroundLookups
 
-# --- NEW IMPORTS ---
-# Instead of one import, we import from our new, separate files
+# Only the login/register pages are imported up front. Each dashboard module is
+# imported the first time a user with that role logs in (see _ensure_dashboard).
 from ui.auth_widgets import LoginWidget, RegisterWidget
-from ui.admin_dashboard import AdminDashboardWidget
-from ui.doctor_dashboard import DoctorDashboardWidget
-from ui.receptionist_dashboard import ReceptionistDashboardWidget, EditPatientDialog
-# --- END NEW IMPORTS ---
+
+_IMPORTS_DONE = time.perf_counter()
 
 
 class MainWindow(QMainWindow):
+    """
+    The application window. It only talks to its data source through the
+    HospitalRepository interface (repository.py) and the typed records in
+    records.py, so a DatabaseManager, a RemoteDatabaseManager or an
+    InMemoryRepository can be passed in.
+    """
+    HISTORY_PAGE_SIZE = 20 # Encounters fetched per "Load Older Visits" click
+    # A doctor's patient list is reloaded when their inbox has new events, and
+    # otherwise only every this many polls (to pick up edits made at reception)
+    DOCTOR_FULL_REFRESH_POLLS = 12
+    # A background lookup finished: key, generation, function that shows its answer
+    lookup_finished = pyqtSignal(str, int, object)
+
     def __init__(self, db_manager):
         super().__init__()
         self.db = db_manager
         
         self.current_user_id = None
         self.current_user_role = None
+        self.doctor_event_cursor = 0 # Newest inbox event fetched (see poll_doctor_events)
+        self.doctor_polls = 0
+        self.tray_icon = None # Created for the first desktop notification
 
         self.setWindowTitle("Hospital Management System")
         self.setGeometry(100, 100, 800, 600)
@@ -33,37 +53,39 @@ class MainWindow(QMainWindow):
         self.stack = QStackedWidget(self)
         self.setCentralWidget(self.stack)
 
-        # Initialize all pages
+        # Initialize the login pages. Dashboards are built on first use,
+        # since a user only ever sees the one for their role.
         self.login_widget = LoginWidget()
         self.register_widget = RegisterWidget()
-        self.admin_dashboard = AdminDashboardWidget()
-        self.doctor_dashboard = DoctorDashboardWidget()
-        self.receptionist_dashboard = ReceptionistDashboardWidget()
+        self.admin_dashboard = None
+        self.doctor_dashboard = None
+        self.receptionist_dashboard = None
 
         # Add pages to the stack
         self.stack.addWidget(self.login_widget)
         self.stack.addWidget(self.register_widget)
-        self.stack.addWidget(self.admin_dashboard)
-        self.stack.addWidget(self.doctor_dashboard)
-        self.stack.addWidget(self.receptionist_dashboard)
         
-        self.cached_pending_users = []
-        self.cached_all_users = []
-        self.cached_doctor_patients = []
-        self.cached_all_patients = []
-        self.cached_doctors_list = []
+        # Rows fetched for every view, kept within a memory budget (HMS_CACHE_MB)
+        self.row_cache = RowCache()
+        self.patient_search_term = ""
+
+        # As-you-type form checks run on a worker thread (see background_lookups.py)
+        self.lookups = BackgroundLookups(self.db)
+        self.lookup_finished.connect(self._show_lookup_result)
 
         # Setup refresh timer
         self.refresh_timer = QTimer(self)
         self.refresh_timer.setInterval(5000) # 5000 ms = 5 seconds
         self.refresh_timer.timeout.connect(self.refresh_data_views)
 
+        # Report rollups are refreshed by a slower periodic job while an admin is logged in
+        self.report_timer = QTimer(self)
+        self.report_timer.setInterval(60000) # 60 seconds
+        self.report_timer.timeout.connect(self.refresh_reports)
+
         # Connect signals and slots
         self._connect_login_signals()
         self._connect_register_signals()
-        self._connect_admin_signals()
-        self._connect_doctor_signals()
-        self._connect_receptionist_signals()
 
         # Show the first page
         self.show_login_page()
@@ -71,14 +93,22 @@ class MainWindow(QMainWindow):
     # --- Page Navigation ---
     def show_login_page(self):
         self.refresh_timer.stop() # Stop polling when logged out
+        self.report_timer.stop()
         self.current_user_id = None
         self.current_user_role = None
+        self.db.end_session()
+        if self.doctor_dashboard:
+            self.doctor_dashboard.reset_history()
+            self.doctor_dashboard.reset_inbox()
+        if self.tray_icon:
+            self.tray_icon.hide()
+        if self.receptionist_dashboard:
+            self.receptionist_dashboard.reset_patient_query()
         
-        self.cached_pending_users = []
-        self.cached_all_users = []
-        self.cached_doctor_patients = []
-        self.cached_all_patients = []
-        self.cached_doctors_list = []
+        if len(self.row_cache):
+            print(self.row_cache.describe())
+        self.row_cache.clear()
+        self.patient_search_term = ""
         
         self.login_widget.clear_fields()
         self.stack.setCurrentWidget(self.login_widget)
@@ -88,6 +118,8 @@ class MainWindow(QMainWindow):
     def show_register_page(self):
         self.refresh_timer.stop() # Stop polling here too
         self.register_widget.clear_fields()
+        self.db.ensure_schema()
+        self.register_widget.set_clinics([clinic.name for clinic in self.db.get_clinics()])
         self.stack.setCurrentWidget(self.register_widget)
         self.resize(380, 300)
         self.center()
@@ -95,15 +127,24 @@ class MainWindow(QMainWindow):
     def show_dashboard(self, role, user_id):
         self.current_user_id = user_id
         self.current_user_role = role
+        # From here on every query only sees the user's clinic (admins see the whole hospital)
+        self.db.start_session(user_id)
         
         self.resize(800, 600)
         self.center()
+        self._ensure_dashboard(role)
         
         if role == 'admin':
             self.load_admin_data()
+            self.refresh_reports()
+            self.report_timer.start()
             self.stack.setCurrentWidget(self.admin_dashboard)
         elif role == 'doctor':
             self.load_doctor_data()
+            # Events that arrived while the doctor was away show up as new
+            self.doctor_event_cursor = self.db.get_last_seen_event(user_id)
+            self.doctor_polls = 0
+            self.poll_doctor_events(reload_patients=False)
             self.stack.setCurrentWidget(self.doctor_dashboard)
         elif role == 'receptionist':
             self.load_receptionist_data()
@@ -111,6 +152,24 @@ class MainWindow(QMainWindow):
             
         self.refresh_timer.start() # Start the refresh timer
             
+    def _ensure_dashboard(self, role):
+        """Imports, builds and connects the dashboard for a role the first time it is needed."""
+        if role == 'admin' and self.admin_dashboard is None:
+            from ui.admin_dashboard import AdminDashboardWidget
+            self.admin_dashboard = AdminDashboardWidget()
+            self.stack.addWidget(self.admin_dashboard)
+            self._connect_admin_signals()
+        elif role == 'doctor' and self.doctor_dashboard is None:
+            from ui.doctor_dashboard import DoctorDashboardWidget
+            self.doctor_dashboard = DoctorDashboardWidget()
+            self.stack.addWidget(self.doctor_dashboard)
+            self._connect_doctor_signals()
+        elif role == 'receptionist' and self.receptionist_dashboard is None:
+            from ui.receptionist_dashboard import ReceptionistDashboardWidget
+            self.receptionist_dashboard = ReceptionistDashboardWidget()
+            self.stack.addWidget(self.receptionist_dashboard)
+            self._connect_receptionist_signals()
+
     def center(self):
         """Center the window on the screen."""
         frame_geom = self.frameGeometry()
@@ -131,11 +190,10 @@ class MainWindow(QMainWindow):
             print("Auto-refreshing Admin data...")
             self.load_admin_data()
         elif current_widget == self.doctor_dashboard:
-            print("Auto-refreshing Doctor data...")
-            self.load_doctor_data()
+            self.poll_doctor_events()
         elif current_widget == self.receptionist_dashboard:
             print("Auto-refreshing Receptionist data...")
-            self.load_receptionist_data()
+            self.load_receptionist_data(auto_refresh=True)
         # If on login or register page, timer is stopped, so this won't run.
 
     # --- Signal Connections ---
@@ -147,6 +205,8 @@ class MainWindow(QMainWindow):
     def _connect_register_signals(self):
         self.register_widget.registration_submitted.connect(self.handle_registration)
         self.register_widget.back_to_login.connect(self.show_login_page)
+        self._connect_field_check(self.register_widget.phone_check, "register_phone",
+                                  "is_phone_registered", self._describe_user_phone)
         
     def _connect_admin_signals(self):
         self.admin_dashboard.logout_requested.connect(self.show_login_page)
@@ -157,10 +217,20 @@ class MainWindow(QMainWindow):
         # --- NEW ADMIN CONNECTIONS ---
         self.admin_dashboard.add_user.connect(self.handle_add_user)
         self.admin_dashboard.remove_user.connect(self.handle_remove_user)
+        self.admin_dashboard.set_user_clinic.connect(self.handle_set_user_clinic)
+        self.admin_dashboard.archive_records.connect(self.handle_archive_records)
+        self.admin_dashboard.refresh_reports.connect(self.refresh_reports)
 
     def _connect_doctor_signals(self):
         self.doctor_dashboard.logout_requested.connect(self.show_login_page)
         self.doctor_dashboard.update_patient_status.connect(self.handle_update_patient_status)
+        self.doctor_dashboard.history_requested.connect(self.handle_history_request)
+        self.doctor_dashboard.add_encounter.connect(self.handle_add_encounter)
+        self.doctor_dashboard.sort_changed.connect(self.load_doctor_data)
+        self.doctor_dashboard.events_seen.connect(
+            lambda event_id: self.db.mark_doctor_events_seen(self.current_user_id, event_id))
+        self.doctor_dashboard.history_widget.load_more_requested.connect(
+            lambda: self._load_history_page(self.doctor_dashboard.history_widget, self.doctor_dashboard.history_patient_id))
         
     def _connect_receptionist_signals(self):
         self.receptionist_dashboard.logout_requested.connect(self.show_login_page)
@@ -168,6 +238,41 @@ class MainWindow(QMainWindow):
         self.receptionist_dashboard.edit_patient_requested.connect(self.handle_edit_patient_request)
         self.receptionist_dashboard.delete_patient.connect(self.handle_delete_patient)
         self.receptionist_dashboard.assign_patient.connect(self.handle_assign_patient)
+        self.receptionist_dashboard.search_patients.connect(self.handle_search_patients)
+        self.receptionist_dashboard.patient_query_changed.connect(self.handle_patient_query_changed)
+        self._connect_field_check(self.receptionist_dashboard.patient_phone_check, "patient_phone",
+                                  "find_patients_by_phone", self._describe_patient_phone)
+
+    def _connect_field_check(self, check, key, method_name, describe, *extra_args):
+        """
+        Looks a form field up with db.<method_name>(text, *extra_args) on the
+        lookup thread whenever the user pauses typing (ui/field_checks.py).
+        describe(result) returns the (message, ok) shown under the field.
+        """
+        check.text_edited.connect(lambda: self.lookups.cancel(key))
+        check.lookup_requested.connect(lambda text: self.lookups.submit(
+            key, method_name, text, *extra_args,
+            # Runs on the lookup thread; the signal carries the answer over to the GUI thread
+            callback=lambda generation, result: self.lookup_finished.emit(
+                key, generation, lambda: check.show_result(text, *describe(result)))))
+
+    def _show_lookup_result(self, key, generation, show):
+        if self.lookups.is_current(key, generation): # Not superseded while the signal was queued
+            show()
+
+    @staticmethod
+    def _describe_user_phone(registered):
+        if registered:
+            return "This phone number is already registered.", False
+        return "Phone number available.", True
+
+    @staticmethod
+    def _describe_patient_phone(matches):
+        if not matches:
+            return "", True
+        patients = ", ".join(f"#{match.patient_id} {match.full_name} (DOB {match.date_of_birth})"
+                             for match in matches)
+        return f"Patients with this phone number: {patients}", False
 
     # --- Data Loading ---
 
@@ -176,44 +281,144 @@ class MainWindow(QMainWindow):
         
         # 1. Load Pending Users
         pending_users = self.db.get_pending_registrations()
-        if pending_users != self.cached_pending_users:
+        if self.row_cache.show("pending_users", ("pending_users",), pending_users):
             print("...Refreshing pending users table.")
             self.admin_dashboard.load_pending_registrations(pending_users)
-            self.cached_pending_users = pending_users
         
-        # 2. Load All Users
-        all_users = self.db.get_all_users()
-        if all_users != self.cached_all_users:
+        # 2. Load All Users (sorted by the clicked header)
+        sort_by, descending = self.admin_dashboard.users_sort()
+        all_users = self.db.get_all_users(sort_by, descending)
+        if self.row_cache.show("all_users", ("all_users", sort_by, descending), all_users):
             print("...Refreshing all users table.")
             self.admin_dashboard.load_all_users(all_users)
-            self.cached_all_users = all_users
+
+        clinics = self.db.get_clinics()
+        if self.row_cache.show("clinics", ("clinics",), clinics):
+            self.admin_dashboard.load_clinics(clinics)
+
+        # 3. Patients per doctor (live counters, one row per doctor)
+        workload = self.db.get_doctor_workload()
+        if self.row_cache.show("doctor_workload", ("doctor_workload",), workload):
+            self.admin_dashboard.load_doctor_workload(workload)
+        
+    def refresh_reports(self):
+        """Periodic job: brings the report rollups up to date and redraws the Reports tab."""
+        self.db.refresh_reports()
+        report = self.db.get_reports()
+        if report:
+            self.admin_dashboard.load_reports(report)
         
     def load_doctor_data(self):
-        patients = self.db.get_patients_for_doctor(self.current_user_id)
+        sort_by, descending = self.doctor_dashboard.patient_sort()
+        patients = self.db.get_patients_for_doctor(self.current_user_id, sort_by, descending)
         
-        if patients != self.cached_doctor_patients:
+        key = ("doctor_patients", self.current_user_id, sort_by, descending)
+        if self.row_cache.show("doctor_patients", key, patients):
             print("...Refreshing doctor patients table.")
-            self.doctor_dashboard.load_assigned_patients(patients) # The UI will sort them
-            self.cached_doctor_patients = patients
+            self.doctor_dashboard.load_assigned_patients(patients) # The UI splits them by status
+
+        workload = self.db.get_doctor_workload(self.current_user_id)
+        if self.row_cache.show("own_workload", ("own_workload", self.current_user_id), workload):
+            self.doctor_dashboard.load_workload(workload[0] if workload else None)
+
+    def poll_doctor_events(self, reload_patients=True):
+        """
+        Doctor refresh tick: reads the doctor's new inbox events (one indexed
+        range on a small table) and only reloads the patient list when there
+        are some, or every DOCTOR_FULL_REFRESH_POLLS ticks.
+        """
+        events = self.db.get_doctor_events(self.current_user_id, self.doctor_event_cursor)
+        self.doctor_polls += 1
+        if events:
+            self.doctor_event_cursor = events[-1].id
+            self.doctor_dashboard.add_unseen_events(events)
+            self.notify_doctor_events(events)
+        if reload_patients and (events or self.doctor_polls % self.DOCTOR_FULL_REFRESH_POLLS == 0):
+            print("Auto-refreshing Doctor data...")
+            self.load_doctor_data()
 
-    def load_receptionist_data(self):
-        # 1. Load All Patients
-        patients = self.db.get_all_patients()
-        if patients != self.cached_all_patients:
+    def notify_doctor_events(self, events):
+        """Desktop notification for new inbox events (only while the window is in the background)."""
+        if self.isActiveWindow():
+            return # The badge on the Pending tab is enough
+        assigned = [event for event in events if event.kind == 'assigned']
+        if len(events) == 1:
+            event = events[0]
+            name = event.patient_name or f"Patient #{event.patient_id}"
+            message = f"{name} was assigned to you." if assigned else f"{name} was assigned to another doctor."
+        else:
+            moved = len(events) - len(assigned)
+            message = f"{len(assigned)} new patient(s) assigned to you." + (f" {moved} moved to other doctors." if moved else "")
+        QApplication.alert(self) # Flashes the taskbar entry
+        if QSystemTrayIcon.isSystemTrayAvailable() and QSystemTrayIcon.supportsMessages():
+            if self.tray_icon is None:
+                icon = self.windowIcon()
+                if icon.isNull():
+                    icon = self.style().standardIcon(QStyle.SP_MessageBoxInformation)
+                self.tray_icon = QSystemTrayIcon(icon, self)
+                self.tray_icon.activated.connect(lambda _: (self.showNormal(), self.activateWindow()))
+            self.tray_icon.show()
+            self.tray_icon.showMessage("Hospital Management System", message)
+
+    def load_receptionist_data(self, auto_refresh=False):
+        # 1. Load one page of patients (or the current search results)
+        if self.patient_search_term:
+            key = ("patient_search", self.patient_search_term)
+            shown = self.row_cache.get(key)
+            if auto_refresh and shown is not None and shown[0] and shown[0][0].doctor_status == 'archived':
+                # Archive hits only change when someone archives or restores; refresh the live table only
+                live = self.db.search_patients(self.patient_search_term, include_archive=False)
+                patients, total = live or shown[0], None
+            else:
+                patients, total = self.db.search_patients(self.patient_search_term), None
+        else:
+            query = self.receptionist_dashboard.patient_query()
+            total = self.db.count_patients(query["filters"])
+            if query["offset"] >= total > 0:
+                # Rows were removed since the page was chosen; show the last page instead
+                self.receptionist_dashboard.patient_page = (total - 1) // query["limit"]
+                query = self.receptionist_dashboard.patient_query()
+            patients = self.db.get_patients_page(**query)
+            key = self._patient_page_key(query)
+        if self.row_cache.show("all_patients", key, (patients, total)):
             print("...Refreshing all patients table.")
-            self.receptionist_dashboard.load_all_patients(patients)
-            self.cached_all_patients = patients
+            self.receptionist_dashboard.load_all_patients(patients, total)
             
-        # 2. Load Doctors List
-        doctors = self.db.get_doctors()
-        if doctors != self.cached_doctors_list:
+        # 2. Load Doctors List, with each doctor's current load for the "Assign Doctor" dialog
+        doctors = self.db.get_doctor_workload()
+        if self.row_cache.show("doctors", ("doctors",), doctors):
             print("...Refreshing doctors list.")
             self.receptionist_dashboard.set_doctors_list(doctors)
-            self.cached_doctors_list = doctors
+
+    @staticmethod
+    def _patient_page_key(query):
+        """Row cache key of one page of the receptionist's patient list."""
+        filters = tuple(sorted(query["filters"].items()))
+        return ("patients_page", filters, query["sort_by"], query["descending"], query["limit"], query["offset"])
+
+    def handle_patient_query_changed(self):
+        """
+        Page, sort or filters changed: a page seen before is drawn straight from
+        the row cache, then checked against the database as usual.
+        """
+        if not self.patient_search_term:
+            key = self._patient_page_key(self.receptionist_dashboard.patient_query())
+            cached = self.row_cache.get(key)
+            if cached is not None:
+                self.row_cache.show("all_patients", key, cached)
+                self.receptionist_dashboard.load_all_patients(*cached)
+        self.load_receptionist_data()
+
+    def _load_history_page(self, history_widget, patient_id):
+        """Appends the next page of a patient's visit history to a history widget."""
+        # Fetch one extra row to know whether there is another page
+        encounters = self.db.get_patient_timeline(patient_id, self.HISTORY_PAGE_SIZE + 1, history_widget.last_row_cursor)
+        history_widget.append_page(encounters[:self.HISTORY_PAGE_SIZE], len(encounters) > self.HISTORY_PAGE_SIZE)
 
     # --- Logic Handlers ---
 
     def handle_login(self):
+        self.db.ensure_schema() # No-op unless login happens before the deferred setup ran
         phone = self.login_widget.phone_input.text()
         password = self.login_widget.password_input.text()
         
@@ -225,10 +430,17 @@ class MainWindow(QMainWindow):
         
         if role and user_id:
             self.show_dashboard(role, user_id)
+            return
+        retry_after = self.db.login_retry_after(phone)
+        if retry_after:
+            minutes = -(-retry_after // 60)
+            QMessageBox.warning(self, "Login Failed",
+                f"Too many login attempts. Please try again in {minutes} minute(s).")
         else:
             QMessageBox.warning(self, "Login Failed", "Invalid credentials or account not active.")
 
-    def handle_registration(self, full_name, phone, password, role):
+    def handle_registration(self, full_name, phone, password, role, clinic_name):
+        self.db.ensure_schema()
         if not all([full_name, phone, password]):
             QMessageBox.warning(self, "Registration Failed", "Please fill in all fields.")
             return
@@ -237,7 +449,8 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Registration Failed", "Passwords do not match.")
             return
             
-        if self.db.register_user(full_name, phone, password, role):
+        clinic_id = self._clinic_id(clinic_name, create=False)
+        if self.db.register_user(full_name, phone, password, role, clinic_id):
             QMessageBox.information(self, "Registration Successful",
                 "Your registration is pending approval from an administrator.")
             self.show_login_page()
@@ -273,13 +486,28 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Could not create admin. Phone may already be in use.")
     
     # --- NEW ADMIN HANDLERS ---
-    def handle_add_user(self, name, phone, password, role):
-        if self.db.create_user_by_admin(name, phone, password, role):
+    def _clinic_id(self, clinic_name, create=True):
+        """Returns the id of a clinic by name (None for ""), creating it if needed and allowed."""
+        if not clinic_name:
+            return None
+        for clinic in self.db.get_clinics():
+            if clinic.name == clinic_name:
+                return clinic.id
+        return (self.db.create_clinic(clinic_name) or None) if create else None
+
+    def handle_add_user(self, name, phone, password, role, clinic_name):
+        if self.db.create_user_by_admin(name, phone, password, role, self._clinic_id(clinic_name)):
             QMessageBox.information(self, "Success", f"New {role} user created successfully.")
             self.load_admin_data() # Refresh all admin tables
         else:
             QMessageBox.warning(self, "Error", f"Could not create user. Phone may already be in use.")
             
+    def handle_set_user_clinic(self, user_id, clinic_name):
+        if self.db.set_user_clinic(user_id, self._clinic_id(clinic_name)):
+            self.load_admin_data() # Refresh all admin tables
+        else:
+            QMessageBox.warning(self, "Error", "Could not change the user's clinic.")
+
     def handle_remove_user(self, user_id):
         if user_id == self.current_user_id:
             QMessageBox.warning(self, "Error", "You cannot delete your own account.")
@@ -291,6 +519,13 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.warning(self, "Error", "Could not delete user.")
             
+    def handle_archive_records(self, older_than_days):
+        archived = self.db.archive_patients(older_than_days)
+        if archived is None:
+            QMessageBox.warning(self, "Error", "Could not archive patient records.")
+        else:
+            QMessageBox.information(self, "Success", f"{archived} patient record(s) moved to the archive.")
+            
     # --- Doctor Handlers ---
     def handle_update_patient_status(self, patient_id, status):
         if self.db.update_patient_status_by_doctor(patient_id, status):
@@ -298,11 +533,33 @@ class MainWindow(QMainWindow):
             self.load_doctor_data() # Refresh doctor's tables
         else:
             QMessageBox.warning(self, "Error", "Could not update patient status.")
+
+    def handle_history_request(self, patient_id):
+        self.doctor_dashboard.history_widget.clear()
+        self._load_history_page(self.doctor_dashboard.history_widget, patient_id)
+
+    def handle_add_encounter(self, patient_id, diagnosis, notes):
+        if self.db.add_encounter(patient_id, self.current_user_id, diagnosis, notes):
+            self.doctor_dashboard.clear_visit_form()
+            self.handle_history_request(patient_id) # Show the new visit at the top
+        else:
+            QMessageBox.warning(self, "Error", "Could not save visit.")
             
     # --- Receptionist Handlers ---
     # --- Receptionist Handlers ---
     def handle_create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
-        # All validation is now done in the UI, so we can just call the database.
+        # All validation is now done in the UI, so we only check for duplicates here.
+        duplicates = self.db.find_duplicate_candidates(first_name, last_name, dob, contact_phone)
+        if duplicates:
+            matches = "\n".join(
+                f"#{match.patient_id} {match.full_name} (DOB {match.date_of_birth}, "
+                f"phone {match.contact_phone}) - {match.score:.0%} match"
+                for match in duplicates[:5])
+            confirm = QMessageBox.question(self, "Possible Duplicate",
+                f"This patient may already be registered:\n\n{matches}\n\nCreate a new record anyway?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if confirm != QMessageBox.Yes:
+                return
         
         if self.db.create_patient(first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, self.current_user_id):
             QMessageBox.information(self, "Success", "Patient created successfully.")
@@ -316,28 +573,50 @@ class MainWindow(QMainWindow):
         
         # 1. Fetch current data
         current_data = self.db.get_patient_details(patient_id)
+        if not current_data and self.db.is_patient_archived(patient_id):
+            # Archived patients (found via search) must be restored before editing
+            confirm = QMessageBox.question(self, "Archived Patient",
+                "This patient is archived. Restore them to the active patient list?",
+                QMessageBox.Yes | QMessageBox.No)
+            if confirm != QMessageBox.Yes:
+                return
+            if self.db.restore_patient(patient_id):
+                current_data = self.db.get_patient_details(patient_id)
+                self.load_receptionist_data()
         if not current_data:
             QMessageBox.warning(self, "Error", "Could not find patient data.")
             return
             
         # 2. Open the edit dialog, pre-filled with data
+        from ui.receptionist_dashboard import EditPatientDialog
         dialog = EditPatientDialog(current_data, self)
+        dialog.history_widget.load_more_requested.connect(
+            lambda: self._load_history_page(dialog.history_widget, patient_id))
+        self._load_history_page(dialog.history_widget, patient_id)
+        # Other patients with the same phone number (the dialog's own patient is left out)
+        self._connect_field_check(dialog.phone_check, "edit_patient_phone",
+                                  "find_patients_by_phone", self._describe_patient_phone, patient_id)
+        dialog.phone_check.check_now()
         
         # 3. If the dialog is saved (OK clicked)
-        if dialog.exec_():
+        saved = dialog.exec_()
+        self.lookups.cancel("edit_patient_phone") # An answer arriving now has no dialog to go to
+        if saved:
             # 4. Get the new, edited details
-            (first, last, dob, gender, phone, prob, addr, blood) = dialog.get_details()
+            details = dialog.get_details()
             
             # 5. Run validation (same as creating a patient)
-            if not all([first, last, phone, prob]):
+            if not all([details.first_name, details.last_name, details.contact_phone, details.problem]):
                 QMessageBox.warning(self, "Error", "Please fill in at least First Name, Last Name, Contact Phone, and Problem.")
                 return
-            if not first.isalpha() or not last.isalpha():
+            if not details.first_name.isalpha() or not details.last_name.isalpha():
                 QMessageBox.warning(self, "Error", "First and Last Name must contain only alphabets.")
                 return
 
             # 6. Call the database to update
-            if self.db.update_patient(patient_id, first, last, dob, gender, phone, prob, addr, blood):
+            if self.db.update_patient(patient_id, details.first_name, details.last_name, details.date_of_birth,
+                                      details.gender, details.contact_phone, details.problem,
+                                      details.address, details.blood_type):
                 QMessageBox.information(self, "Success", "Patient details updated successfully.")
                 self.load_receptionist_data() # Refresh the table
             else:
@@ -350,6 +629,10 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.warning(self, "Error", "Could not delete patient.")
 
+    def handle_search_patients(self, term):
+        self.patient_search_term = term
+        self.load_receptionist_data()
+
     def handle_assign_patient(self, patient_id, doctor_id):
         if self.db.assign_patient_to_doctor(patient_id, doctor_id):
             QMessageBox.information(self, "Success", "Patient assigned to doctor.")
@@ -358,6 +641,51 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Could not assign patient.")
 
 
+def report_startup_time(db):
+    """
+    Runs once the login screen has been painted: finishes the deferred
+    database setup and prints how long startup took.
+    Set HMS_STARTUP_LOG to a file path to also append the numbers as CSV
+    (timestamp, import_ms, login_screen_ms) so they can be tracked over time.
+    """
+    login_screen_ms = (time.perf_counter() - _PROCESS_START) * 1000
+    import_ms = (_IMPORTS_DONE - _PROCESS_START) * 1000
+    print(f"Startup: imports {import_ms:.0f} ms, login screen shown after {login_screen_ms:.0f} ms")
+
+    log_path = os.environ.get("HMS_STARTUP_LOG")
+    if log_path:
+        with open(log_path, "a") as log_file:
+            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')},{import_ms:.1f},{login_screen_ms:.1f}\n")
+
+    # Schema checks and the default admin are not needed to draw the login screen
+    db.ensure_schema()
+
+
+def report_sync_conflicts(window, db):
+    """Replica mode: tells the user about local edits the primary database refused."""
+    for method, args, reason in db.take_conflicts():
+        QMessageBox.warning(window, "Change Not Saved",
+                            f"A change made while working offline could not be saved ({method}).\n\n{reason}")
+
+
+class IdleWatcher(QObject):
+    """Application-wide event filter that remembers when the user last typed or clicked."""
+    ACTIVITY_EVENTS = {QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.Wheel}
+
+    def __init__(self):
+        super().__init__()
+        self.last_activity = time.monotonic()
+
+    def eventFilter(self, watched, event):
+        if event.type() in self.ACTIVITY_EVENTS:
+            self.last_activity = time.monotonic()
+        return False # Only watching; the event is delivered as usual
+
+    def idle_seconds(self):
+        # Read from the maintenance thread; a float assignment is atomic
+        return time.monotonic() - self.last_activity
+
+
 if __name__ == "__main__":
     
     try:
@@ -370,11 +698,48 @@ if __name__ == "__main__":
     
     app = QApplication(sys.argv)
     
-    # Initialize database
-    db = DatabaseManager()
+    # Initialize database: a remote HMS server (see server.py) if one is given,
+    # else the local file (schema setup is deferred until after the first paint),
+    server_url = os.environ.get("HMS_SERVER")
+    if "--server" in sys.argv[:-1]:
+        server_url = sys.argv[sys.argv.index("--server") + 1]
+    # or a local replica of a database on a network share (see replica.py)
+    replica_path = os.environ.get("HMS_REPLICA")
+    if "--replica" in sys.argv[:-1]:
+        replica_path = sys.argv[sys.argv.index("--replica") + 1]
+    if server_url:
+        from client import RemoteDatabaseManager
+        db = RemoteDatabaseManager(server_url)
+    elif replica_path:
+        from replica import ReplicaDatabaseManager
+        db = ReplicaDatabaseManager(replica_path, os.environ.get("HMS_LOCAL_DB", "hms_local.db"))
+        db.start_sync()
+    else:
+        db = DatabaseManager(defer_schema=True)
+        # Online snapshots and change archiving in the background (see backup.py)
+        if os.environ.get("HMS_BACKUP_DIR"):
+            from backup import BackupScheduler
+            BackupScheduler(db.db_name, os.environ["HMS_BACKUP_DIR"]).start()
+
+    # ANALYZE, incremental vacuum and integrity checks while the desk sits idle (see maintenance.py);
+    # in server mode the server does this. HMS_MAINTENANCE_HOURS=0 turns it off.
+    maintenance_hours = float(os.environ.get("HMS_MAINTENANCE_HOURS", "24"))
+    if not server_url and maintenance_hours > 0:
+        from maintenance import MaintenanceScheduler
+        idle_watcher = IdleWatcher()
+        app.installEventFilter(idle_watcher)
+        MaintenanceScheduler(db.db_name, idle_watcher.idle_seconds, interval=maintenance_hours * 3600).start()
     
     # Pass the database manager to the main window
     main_window = MainWindow(db)
     main_window.show()
+
+    # A zero-delay timer fires once the event loop has shown the window
+    QTimer.singleShot(0, lambda: report_startup_time(db))
+
+    if replica_path and not server_url:
+        conflict_timer = QTimer(main_window)
+        conflict_timer.timeout.connect(lambda: report_sync_conflicts(main_window, db))
+        conflict_timer.start(5000)
     
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
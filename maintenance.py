@@ -0,0 +1,337 @@
+"""
+Storage compaction and planner upkeep, run while nobody is using the app.
+
+Deleted users, denied registrations, archived patients and pruned log entries
+leave free pages behind, so hms.db keeps growing, and without statistics the
+query planner has to guess how selective each index is. run_maintenance():
+
+- deletes doctors' notification events older than 30 days (see inbox.py);
+- converts the file to auto_vacuum=INCREMENTAL once (a full VACUUM; new
+  databases are created that way, see DatabaseManager.create_tables). The
+  VACUUM rewrites the whole file under an exclusive lock, so only the command
+  line and the server do it (convert=True), never a desk's idle timer;
+- runs ANALYZE the first time, and `PRAGMA optimize` after that, which only
+  re-analyzes tables whose statistics are out of date;
+- returns free pages to the file system with `PRAGMA incremental_vacuum`, a
+  few pages per transaction so other desks are never locked out for long;
+- truncates the WAL file and runs an integrity check, including a check for
+  rows that refer to missing users or patients (repaired with --repair-orphans).
+
+It measures the file size and the latency of a few dashboard queries before
+and after, and records each run in the `maintenance_runs` table. A run claims
+its row ("running") under BEGIN IMMEDIATE before it starts, so when several
+desks share a file only one of them runs it (claim_run).
+MaintenanceScheduler runs it in the background once the app has been idle for
+a while, and stops between steps as soon as someone uses it again. "Idle" only
+means this desk is idle: the other desks may still be writing.
+
+    python maintenance.py hms.db [--full-check] [--repair-orphans]
+"""
+import calendar
+import json
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+import inbox
+import queries
+from db_manager import DatabaseManager
+
+VACUUM_PAGES_PER_STEP = 512 # 2 MB per transaction with 4 KB pages
+ANALYSIS_LIMIT = 1000 # Rows sampled per index by ANALYZE (keeps it fast on large tables)
+LATENCY_ROUNDS = 5 # Each probe's latency is the median of this many runs
+
+STALE_CLAIM_SECONDS = 3600 # A "running" claim this old belongs to a desk that died mid-run
+
+_AUTO_VACUUM_INCREMENTAL = 2
+
+# Queries whose latency is reported: what the dashboards run on every refresh
+LATENCY_PROBES = {
+    "count_patients": lambda db: db.count_patients(),
+    "patients_first_page": lambda db: db.get_patients_page(limit=50),
+    "patients_by_name": lambda db: db.get_patients_page(sort_by="full_name", limit=50, offset=1000),
+    "pending_registrations": lambda db: db.get_pending_registrations(),
+    "doctor_workload": lambda db: db.get_doctor_workload(),
+}
+
+
+def storage_stats(conn):
+    """Returns the file's size, free space (bytes) and auto_vacuum mode."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "size": page_size * page_count,
+        "free": page_size * free_pages,
+        "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+    }
+
+
+def probe_latency(db, rounds=LATENCY_ROUNDS):
+    """Returns {probe: median ms} for LATENCY_PROBES."""
+    latencies = {}
+    for name, probe in LATENCY_PROBES.items():
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            probe(db)
+            timings.append((time.perf_counter() - started) * 1000)
+        latencies[name] = statistics.median(timings)
+    return latencies
+
+
+def _has_statistics(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    return row is not None and conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone() is not None
+
+
+def _create_runs_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ran_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        report TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'completed'
+    )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(maintenance_runs)")}
+    if "status" not in columns: # Earlier versions only recorded finished runs
+        conn.execute("ALTER TABLE maintenance_runs ADD COLUMN status TEXT NOT NULL DEFAULT 'completed'")
+
+
+def claim_run(conn, interval=0):
+    """
+    Claims a maintenance run on a shared file: inserts a "running" row and
+    returns its id, or returns None if another run is still going or one
+    completed less than `interval` seconds ago. The check and the insert happen
+    under one BEGIN IMMEDIATE, so two desks can never both claim a run.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _create_runs_table(conn)
+        busy = conn.execute("""
+            SELECT 1 FROM maintenance_runs
+            WHERE (status = 'running' AND ran_at >= datetime('now', ?))
+               OR (status = 'completed' AND ? > 0 AND ran_at >= datetime('now', ?))
+            LIMIT 1
+        """, (f"-{STALE_CLAIM_SECONDS} seconds", interval, f"-{interval} seconds")).fetchone()
+        if busy:
+            conn.rollback()
+            return None
+        run_id = conn.execute("INSERT INTO maintenance_runs (report, status) VALUES ('{}', 'running')").lastrowid
+        conn.commit()
+        return run_id
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def _finish_run(conn, run_id, report):
+    """Stores the report of a claimed run; only a completed run counts towards the interval."""
+    status = "failed" if report.get("error") else "completed" if report["completed"] else "stopped"
+    conn.rollback() # Whatever a failed step left open
+    conn.execute("UPDATE maintenance_runs SET report = ?, status = ? WHERE id = ?",
+                 (json.dumps(report), status, run_id))
+    conn.commit()
+
+
+def last_run(db_path):
+    """Returns (ran_at, report) of the latest completed maintenance run, or None."""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT ran_at, report FROM maintenance_runs WHERE status = 'completed'"
+                           " ORDER BY id DESC LIMIT 1").fetchone()
+    except sqlite3.Error:
+        return None # Never run (no table yet)
+    finally:
+        conn.close()
+    return (row[0], json.loads(row[1])) if row else None
+
+
+def run_maintenance(db_path, full_check=False, keep_going=None, interval=0, convert=True):
+    """
+    Runs the maintenance steps on db_path and returns a report dict.
+    `keep_going` is checked between steps (and vacuum transactions); when it
+    returns False the remaining steps are skipped. full_check=True runs
+    `PRAGMA integrity_check` instead of the faster quick_check. The run is
+    skipped (report["skipped"]) if another one is going on or one completed
+    less than `interval` seconds ago (see claim_run). convert=False leaves a
+    file that is not in incremental auto_vacuum mode as it is.
+    """
+    keep_going = keep_going or (lambda: True)
+    db = DatabaseManager(db_path, defer_schema=True)
+    conn = db.conn
+    report = {"steps": {}, "completed": False}
+    run_id = None
+    try:
+        run_id = claim_run(conn, interval)
+        if run_id is None:
+            report["skipped"] = True
+            return report
+        report["before"] = dict(storage_stats(conn), latency_ms=probe_latency(db))
+
+        def step(name, action):
+            if not keep_going():
+                return False
+            started = time.perf_counter()
+            action()
+            report["steps"][name] = round(time.perf_counter() - started, 3)
+            return True
+
+        def prune_events():
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'doctor_events'").fetchone(): # Older files
+                report["pruned_events"] = inbox.prune_doctor_events(conn.cursor())
+                conn.commit()
+
+        def convert_to_incremental():
+            # Changing auto_vacuum on an existing file only takes effect after a VACUUM
+            conn.execute(f"PRAGMA auto_vacuum = {_AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+
+        def analyze():
+            conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            conn.execute("PRAGMA optimize" if _has_statistics(conn) else "ANALYZE")
+            conn.commit()
+
+        def incremental_vacuum():
+            if storage_stats(conn)["auto_vacuum"] != _AUTO_VACUUM_INCREMENTAL:
+                return # Not converted yet; the pragma would do nothing
+            while keep_going() and conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+                conn.commit()
+
+        def checkpoint():
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+        def check_integrity():
+            pragma = "integrity_check" if full_check else "quick_check"
+            report["integrity"] = [row[0] for row in conn.execute(f"PRAGMA {pragma}")]
+            report["foreign_key_violations"] = len(conn.execute("PRAGMA foreign_key_check").fetchall())
+
+        # Pruned first, so the vacuum below hands the freed pages back
+        if not step("prune_events", prune_events):
+            return report
+        if report["before"]["auto_vacuum"] != _AUTO_VACUUM_INCREMENTAL:
+            if not convert:
+                report["needs_conversion"] = True
+            elif not step("convert_to_incremental", convert_to_incremental):
+                return report
+        for name, action in (("analyze", analyze), ("incremental_vacuum", incremental_vacuum),
+                             ("checkpoint", checkpoint), ("integrity_check", check_integrity)):
+            if not step(name, action):
+                return report
+
+        # Fresh statistics can change plans: make sure no hot query became a full scan
+        report["full_scans"] = queries.find_full_scans(conn)
+        report["after"] = dict(storage_stats(conn), latency_ms=probe_latency(db))
+        report["completed"] = True
+    except sqlite3.Error as e:
+        print(f"Maintenance error: {e}")
+        report["error"] = str(e)
+    finally:
+        try:
+            if run_id is not None:
+                _finish_run(conn, run_id, report)
+        except sqlite3.Error as e:
+            print(f"Could not record the maintenance run: {e}")
+        finally:
+            conn.close()
+    return report
+
+
+def format_report(report):
+    """Returns a printable summary of a run_maintenance() report."""
+    if report.get("skipped"):
+        return "Skipped: another desk is running maintenance, or it ran recently."
+    lines = []
+    before, after = report.get("before"), report.get("after")
+    if before and after:
+        lines.append(f"File size: {before['size'] / 1048576:.1f} MB -> {after['size'] / 1048576:.1f} MB"
+                     f" (free {before['free'] / 1048576:.1f} MB -> {after['free'] / 1048576:.1f} MB)")
+        for name, ms in before["latency_ms"].items():
+            lines.append(f"  {name:<22} {ms:8.2f} ms -> {after['latency_ms'][name]:8.2f} ms")
+    for name, seconds in report["steps"].items():
+        lines.append(f"Step {name}: {seconds:.2f} s")
+    if report.get("integrity") and report["integrity"] != ["ok"]:
+        lines.extend(f"INTEGRITY: {problem}" for problem in report["integrity"])
+    if report.get("foreign_key_violations"):
+        lines.append(f"FOREIGN KEYS: {report['foreign_key_violations']} row(s) refer to missing users or patients"
+                     f" (fix with: python maintenance.py <database> --repair-orphans)")
+    for query_name, plan_line in report.get("full_scans", []):
+        lines.append(f"FULL SCAN in {query_name}: {plan_line}")
+    if report.get("needs_conversion"):
+        lines.append("Free pages are not handed back until the file is converted to incremental"
+                     " auto_vacuum (run: python maintenance.py <database>)")
+    if report.get("error"):
+        lines.append(f"Failed: {report['error']}")
+    elif not report["completed"]:
+        lines.append("Stopped early (the app is in use again).")
+    return "\n".join(lines)
+
+
+class MaintenanceScheduler:
+    """
+    Background thread that runs run_maintenance() at most every `interval`
+    seconds, once `idle_seconds()` (time since the last user activity, or since
+    the last request on the server) reaches `idle_after`. Desks leave
+    convert=False: only the server, or the command line, runs the full VACUUM.
+    """
+
+    def __init__(self, db_path, idle_seconds, interval=24 * 3600, idle_after=300, check_every=30, convert=False):
+        self.db_path = db_path
+        self.convert = convert
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.idle_after = idle_after
+        self.check_every = check_every
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hms-maintenance", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _idle(self):
+        return not self._stop.is_set() and self.idle_seconds() >= self.idle_after
+
+    def _due(self):
+        previous = last_run(self.db_path)
+        if previous is None:
+            return True
+        ran_at = calendar.timegm(time.strptime(previous[0], "%Y-%m-%d %H:%M:%S")) # Stored in UTC
+        return time.time() - ran_at >= self.interval
+
+    def _run(self):
+        while not self._stop.wait(self.check_every):
+            if not self._idle() or not self._due():
+                continue # _due() is a cheap pre-check; claim_run() decides
+            report = run_maintenance(self.db_path, keep_going=self._idle, interval=self.interval, convert=self.convert)
+            if report.get("skipped"):
+                continue
+            self.last_report = report
+            print("Database maintenance:\n" + format_report(report))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {option for option in ("--full-check", "--repair-orphans") if option in args}
+    args = [arg for arg in args if arg not in options]
+    if len(args) != 1:
+        print("Usage: python maintenance.py <database file> [--full-check] [--repair-orphans]")
+        sys.exit(2)
+    if "--repair-orphans" in options:
+        repaired = DatabaseManager(args[0]).repair_orphans()
+        if repaired is None:
+            sys.exit(1)
+        for statement_name, rows in repaired.items():
+            print(f"{statement_name}: {rows} row(s)")
+    result = run_maintenance(args[0], full_check="--full-check" in options)
+    print(format_report(result))
+    sys.exit(0 if result["completed"] and result.get("integrity") == ["ok"]
+             and not result["foreign_key_violations"] and not result["full_scans"] else 1)
@@ -0,0 +1,278 @@
+"""
+Imports the patients of the legacy Tkinter app (Old_model/hms.py) into hms.db.
+
+The old app kept one `patients` table in hospital.db with (name, age, gender,
+contact, address). Each legacy row becomes a current patient:
+
+- `name` is split on its last space into first and last name;
+- `age` becomes an approximate date of birth: today's date, that many years
+  ago. Missing or impossible ages leave the date of birth empty (no age) until
+  someone corrects it;
+- `gender` is mapped to Male / Female / Other, `contact` becomes the phone;
+- the legacy id is kept in `patients.legacy_id`, and a visit saying where the
+  record came from starts the patient's history;
+- with `--clinic-id N` the patients belong to that clinic (the legacy app
+  served a single site); otherwise to the whole hospital.
+
+Legacy ids are only unique within one hospital.db, and `patients.legacy_id`
+is uniquely indexed across the hospital, so once one legacy file has been
+imported any other file is refused (resuming or re-running the same file is
+fine).
+
+Rows are streamed in id order, `--batch-size` at a time, and each batch is
+inserted together with its checkpoint (last legacy id, row count, running
+checksums) in one transaction, so an interrupted run resumes after the last
+committed batch and never imports a row twice. Running it again later only
+imports rows added to hospital.db since. Afterwards the row count and an
+order-independent checksum of both sides are recomputed and compared.
+
+    python migrate_legacy.py hospital.db hms.db [--batch-size N] [--clinic-id N] [--verify]
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+
+from db_manager import DatabaseManager
+from duplicates import blocking_keys
+
+BATCH_SIZE = 5000 # Legacy rows per transaction
+MAX_AGE = 130 # Older "ages" are typing mistakes; such rows get no date of birth
+GENDERS = {"m": "Male", "male": "Male", "f": "Female", "female": "Female"}
+IMPORT_NOTE = "Imported from the legacy system"
+
+_CHECKSUM_MODULUS = 1 << 64
+
+
+# --- Converting one row ---
+
+def split_name(name):
+    """Returns (first_name, last_name); a single word is a first name with an empty last name."""
+    words = (name or "").split()
+    if len(words) < 2:
+        return (words[0] if words else ""), ""
+    return " ".join(words[:-1]), words[-1]
+
+
+def approximate_dob(age, today):
+    """Returns the ISO date `age` years before `today`, or '' if age is not a plausible age."""
+    try:
+        years = int(float(age))
+    except (TypeError, ValueError):
+        return ""
+    if not 0 <= years <= MAX_AGE:
+        return ""
+    try:
+        return today.replace(year=today.year - years).isoformat()
+    except ValueError:
+        return today.replace(year=today.year - years, day=28).isoformat() # Born on February 29th
+
+
+def convert_row(row, today):
+    """Maps a legacy (id, name, age, gender, contact, address) row to the columns of TARGET_COLUMNS."""
+    legacy_id, name, age, gender, contact, address = row
+    first_name, last_name = split_name(name)
+    dob = approximate_dob(age, today)
+    gender = (gender or "").strip()
+    gender = GENDERS.get(gender.lower(), "Other") if gender else None
+    contact = (str(contact).strip() or None) if contact is not None else None
+    address = (address or "").strip() or None
+    name_key, phone_key = blocking_keys(last_name, dob, contact)
+    return (legacy_id, first_name, last_name, dob, gender, contact, address, name_key, phone_key)
+
+
+TARGET_COLUMNS = ("legacy_id", "first_name", "last_name", "date_of_birth", "gender", "contact_phone",
+                  "address", "dup_name_key", "dup_phone_key")
+# Columns covered by the target checksum (the blocking keys are derived from them)
+CHECKED_COLUMNS = TARGET_COLUMNS[:7]
+LEGACY_COLUMNS = ("id", "name", "age", "gender", "contact", "address")
+
+
+def row_checksum(values):
+    """64-bit hash of one row. Row checksums are added up, so the total does not depend on order or batching."""
+    digest = hashlib.blake2b("\x1f".join(map(repr, values)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+# --- Checkpoints ---
+
+def _create_checkpoint_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS legacy_migrations (
+        source TEXT PRIMARY KEY,
+        last_legacy_id INTEGER NOT NULL DEFAULT 0,
+        rows INTEGER NOT NULL DEFAULT 0,
+        unknown_dob INTEGER NOT NULL DEFAULT 0,
+        source_checksum TEXT NOT NULL DEFAULT '0',
+        target_checksum TEXT NOT NULL DEFAULT '0',
+        started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME
+    )
+    """)
+
+
+def read_checkpoint(conn, source):
+    """Returns the checkpoint dict of a legacy file (zeros if it was never migrated)."""
+    _create_checkpoint_table(conn)
+    row = conn.execute("""
+    SELECT last_legacy_id, rows, unknown_dob, source_checksum, target_checksum, finished_at
+    FROM legacy_migrations WHERE source = ?
+    """, (source,)).fetchone()
+    if row is None:
+        return {"last_legacy_id": 0, "rows": 0, "unknown_dob": 0, "source_checksum": 0,
+                "target_checksum": 0, "finished_at": None}
+    return {"last_legacy_id": row[0], "rows": row[1], "unknown_dob": row[2],
+            "source_checksum": int(row[3], 16), "target_checksum": int(row[4], 16), "finished_at": row[5]}
+
+
+def _save_checkpoint(conn, source, checkpoint):
+    conn.execute("""
+    INSERT INTO legacy_migrations (source, last_legacy_id, rows, unknown_dob, source_checksum, target_checksum)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (source) DO UPDATE SET
+        last_legacy_id = excluded.last_legacy_id, rows = excluded.rows, unknown_dob = excluded.unknown_dob,
+        source_checksum = excluded.source_checksum, target_checksum = excluded.target_checksum, finished_at = NULL
+    """, (source, checkpoint["last_legacy_id"], checkpoint["rows"], checkpoint["unknown_dob"],
+          format(checkpoint["source_checksum"], "x"), format(checkpoint["target_checksum"], "x")))
+
+
+def imported_source(conn, source):
+    """Returns the legacy file already imported into this database if it is not `source`, else None."""
+    row = conn.execute("SELECT source FROM legacy_migrations WHERE source != ? LIMIT 1", (source,)).fetchone()
+    return row[0] if row else None
+
+
+# --- Migration ---
+
+def _open_legacy(legacy_path):
+    if not os.path.exists(legacy_path):
+        raise FileNotFoundError(legacy_path)
+    return sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True) # Never writes to the old file
+
+
+def migrate(legacy_path, target_path, batch_size=BATCH_SIZE, progress=print, clinic_id=None):
+    """
+    Imports the legacy rows not imported yet. Returns the final checkpoint dict,
+    or None on failure (the batches committed so far are kept and resumed next time).
+    """
+    source = os.path.abspath(legacy_path)
+    legacy = _open_legacy(legacy_path)
+    db = DatabaseManager(target_path)
+    conn = db.conn
+    today = date.today()
+    insert_sql = f"""
+    INSERT OR IGNORE INTO patients ({", ".join(TARGET_COLUMNS)}, clinic_id)
+    VALUES ({", ".join("?" * len(TARGET_COLUMNS))}, ?)
+    """
+    try:
+        checkpoint = read_checkpoint(conn, source)
+        conn.commit()
+        other = imported_source(conn, source)
+        if other:
+            print(f"Migration error: {other} was already imported into {target_path}. Legacy ids are only unique"
+                  f" within one legacy database, so patients from a second one cannot be told apart.")
+            return None
+        if checkpoint["last_legacy_id"]:
+            progress(f"Resuming after legacy id {checkpoint['last_legacy_id']} ({checkpoint['rows']} rows imported)")
+        started = time.perf_counter()
+        imported = 0
+        while True:
+            rows = legacy.execute(f"""
+            SELECT {", ".join(LEGACY_COLUMNS)} FROM patients WHERE id > ? ORDER BY id LIMIT ?
+            """, (checkpoint["last_legacy_id"], batch_size)).fetchall()
+            if not rows:
+                break
+            converted = [convert_row(row, today) for row in rows]
+            first_id, last_id = rows[0][0], rows[-1][0]
+            with conn: # One transaction: the batch, its history entries and the checkpoint
+                inserted = conn.executemany(insert_sql, [values + (clinic_id,) for values in converted]).rowcount
+                conn.execute("""
+                INSERT INTO encounters (patient_id, notes)
+                SELECT id, ? || ' (record ' || legacy_id || ')' FROM patients
+                WHERE legacy_id BETWEEN ? AND ?
+                """, (IMPORT_NOTE, first_id, last_id))
+                checkpoint["last_legacy_id"] = last_id
+                checkpoint["rows"] += inserted
+                checkpoint["unknown_dob"] += sum(1 for values in converted if not values[3])
+                checkpoint["source_checksum"] = (checkpoint["source_checksum"]
+                                                 + sum(row_checksum(row) for row in rows)) % _CHECKSUM_MODULUS
+                checkpoint["target_checksum"] = (checkpoint["target_checksum"] + sum(
+                    row_checksum(values[:len(CHECKED_COLUMNS)]) for values in converted)) % _CHECKSUM_MODULUS
+                _save_checkpoint(conn, source, checkpoint)
+            imported += inserted
+            elapsed = time.perf_counter() - started
+            progress(f"{checkpoint['rows']} rows imported (up to legacy id {last_id}, "
+                     f"{imported / elapsed if elapsed else 0:.0f} rows/s)")
+        with conn:
+            conn.execute("UPDATE legacy_migrations SET finished_at = CURRENT_TIMESTAMP WHERE source = ?", (source,))
+        return read_checkpoint(conn, source)
+    except sqlite3.Error as e:
+        print(f"Migration error: {e}")
+        return None
+    finally:
+        legacy.close()
+        conn.close()
+
+
+def verify(legacy_path, target_path):
+    """
+    Recomputes row counts and checksums of the imported range on both sides
+    and compares them with the checkpoint. Returns (report dict, list of problems).
+    Patients archived since the import are no longer in `patients` and show up as missing.
+    """
+    source = os.path.abspath(legacy_path)
+    legacy = _open_legacy(legacy_path)
+    conn = sqlite3.connect(target_path)
+    try:
+        checkpoint = read_checkpoint(conn, source)
+        upto = checkpoint["last_legacy_id"]
+        report = {"legacy_rows": 0, "imported_rows": 0, "source_checksum": 0, "target_checksum": 0}
+        for row in legacy.execute(f"SELECT {', '.join(LEGACY_COLUMNS)} FROM patients WHERE id <= ?", (upto,)):
+            report["legacy_rows"] += 1
+            report["source_checksum"] = (report["source_checksum"] + row_checksum(row)) % _CHECKSUM_MODULUS
+        for values in conn.execute(f"""
+        SELECT {", ".join(CHECKED_COLUMNS)} FROM patients WHERE legacy_id BETWEEN 1 AND ?
+        """, (upto,)):
+            report["imported_rows"] += 1
+            report["target_checksum"] = (report["target_checksum"] + row_checksum(values)) % _CHECKSUM_MODULUS
+    finally:
+        legacy.close()
+        conn.close()
+
+    problems = []
+    if report["legacy_rows"] != checkpoint["rows"]:
+        problems.append(f"the legacy database has {report['legacy_rows']} rows up to id {upto}, {checkpoint['rows']} were imported")
+    if report["imported_rows"] != checkpoint["rows"]:
+        problems.append(f"{report['imported_rows']} imported patients found, {checkpoint['rows']} expected")
+    if report["source_checksum"] != checkpoint["source_checksum"]:
+        problems.append("legacy rows changed since they were imported (source checksum differs)")
+    if report["target_checksum"] != checkpoint["target_checksum"]:
+        problems.append("imported patients differ from what was imported (target checksum differs)")
+    return report, problems
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    verify_only = "--verify" in args
+    options = {"--batch-size": BATCH_SIZE, "--clinic-id": None}
+    for option in options:
+        if option in args:
+            position = args.index(option)
+            options[option] = int(args[position + 1])
+            del args[position:position + 2]
+    args = [arg for arg in args if arg != "--verify"]
+    if len(args) != 2:
+        print("Usage: python migrate_legacy.py <hospital.db> <hms.db> [--batch-size N] [--clinic-id N] [--verify]")
+        sys.exit(2)
+    if not verify_only:
+        result = migrate(args[0], args[1], options["--batch-size"], clinic_id=options["--clinic-id"])
+        if result is None:
+            sys.exit(1)
+        print(f"Imported {result['rows']} patients ({result['unknown_dob']} without a usable age).")
+    _, found = verify(args[0], args[1])
+    for problem in found:
+        print(f"VERIFY: {problem}")
+    print("Verified: row counts and checksums match." if not found else "Verification FAILED.")
+    sys.exit(1 if found else 0)
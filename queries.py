@@ -0,0 +1,407 @@
+"""
+Registry of the SQL statements DatabaseManager runs for its everyday operations.
+
+Each statement is declared once here under a name and executed through
+DatabaseManager._execute(name, params), which:
+- always sends the exact same SQL text, so sqlite3's per-connection statement
+  cache (sized by STATEMENT_CACHE_SIZE) compiles each statement only once;
+- records how often each statement ran and how long it took (QueryTimings).
+
+A few list statements are templates: their {where} / {order_by} parts are
+filled in from whitelisted pieces (see db_manager._patient_filters/_order_by).
+Statements with a {scope} part are limited to the session's clinic
+(DatabaseManager._scope): "AND <table>.clinic_id = ?", or nothing for
+hospital-wide sessions.
+
+Statements in HOT_QUERIES run on every dashboard refresh or click and must be
+answered from an index. Check them against a database with:
+
+    python queries.py hms.db
+
+which prints every hot query plan and exits with status 1 if any of them
+scans a whole table.
+"""
+import re
+import sqlite3
+import sys
+
+# Registered statements plus their sort/filter variants fit comfortably
+STATEMENT_CACHE_SIZE = 256
+
+
+def age_sql(birth_date):
+    """SQL for the whole years from an ISO birth date to today (NULL if the date is NULL)."""
+    return (f"(CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - CAST(strftime('%Y', {birth_date}) AS INTEGER)"
+            f" - (strftime('%m-%d', 'now', 'localtime') < strftime('%m-%d', {birth_date})))")
+
+# Age is worked out in the list queries from the indexed birth_date column (see
+# DatabaseManager.create_tables). It changes daily, so it cannot be stored.
+PATIENT_AGE = age_sql("p.birth_date")
+
+# A few statements write "+deleted_at IS NULL": the unary + keeps SQLite from
+# using idx_patients_deleted_at for that term (nearly every row matches it),
+# so the selective index on the other condition is chosen instead.
+QUERIES = {
+    # --- Users ---
+    "register_user": """
+        INSERT INTO users (full_name, phone, password, role, status, clinic_id)
+        VALUES (?, ?, ?, ?, 'pending', ?)
+    """,
+    # Logins (see login_limits.py): one lookup on the UNIQUE phone index, the
+    # password hash is compared in Python
+    "login_lookup": """
+        SELECT u.id, u.role, u.password, u.status, a.failures, a.locked_until
+        FROM users u
+        LEFT JOIN login_attempts a ON a.phone = u.phone
+        WHERE u.phone = ?
+    """,
+    # Counted in SQL, so concurrent wrong passwords can never lose an increment
+    "record_login_failure": """
+        INSERT INTO login_attempts (phone, failures, last_failure_at) VALUES (?, 1, ?)
+        ON CONFLICT (phone) DO UPDATE SET failures = failures + 1, last_failure_at = excluded.last_failure_at
+        RETURNING failures
+    """,
+    "lock_login": "UPDATE login_attempts SET failures = 0, locked_until = ? WHERE phone = ?",
+    "clear_login_failures": "DELETE FROM login_attempts WHERE phone = ?",
+    "get_login_lock": "SELECT locked_until FROM login_attempts WHERE phone = ?",
+    "get_pending_registrations": """
+        SELECT id, full_name, phone, role, created_at FROM users WHERE status = 'pending' {scope}
+    """,
+    "approve_registration": "UPDATE users SET status = 'active' WHERE id = ? {scope}",
+    "deny_registration": "DELETE FROM users WHERE id = ? AND status = 'pending' {scope}",
+    # Phone numbers are unique across the hospital, so this is never scoped to a clinic
+    "phone_registered": "SELECT 1 FROM users WHERE phone = ?",
+    "create_admin_user": """
+        INSERT INTO users (full_name, phone, password, role, status)
+        VALUES (?, ?, ?, 'admin', 'active')
+    """,
+    "get_doctors": """
+        SELECT id, full_name FROM users WHERE role = 'doctor' AND status = 'active' {scope}
+    """,
+    # Live counters kept by the triggers in workload.py (a doctor with no patients has no row yet)
+    "get_doctor_workload": """
+        SELECT u.id, u.full_name, COALESCE(w.pending, 0), COALESCE(w.accepted, 0), COALESCE(w.denied, 0)
+        FROM users u
+        LEFT JOIN doctor_workload w ON w.doctor_id = u.id
+        WHERE u.role = 'doctor' AND u.status = 'active' {scope}
+        ORDER BY u.full_name
+    """,
+    "get_one_doctor_workload": """
+        SELECT u.id, u.full_name, COALESCE(w.pending, 0), COALESCE(w.accepted, 0), COALESCE(w.denied, 0)
+        FROM users u
+        LEFT JOIN doctor_workload w ON w.doctor_id = u.id
+        WHERE u.id = ? {scope}
+    """,
+    # Notification inbox (see inbox.py). The doctor is looked up once (a scalar
+    # subquery on the primary key) so that {scope} can limit it to the session's clinic.
+    "get_doctor_events": """
+        SELECT e.id, e.kind, e.patient_id, p.full_name, e.created_at
+        FROM doctor_events e
+        LEFT JOIN patients p ON p.id = e.patient_id
+        WHERE e.doctor_id = (SELECT u.id FROM users u WHERE u.id = ? {scope}) AND e.id > ?
+        ORDER BY e.id
+        LIMIT ?
+    """,
+    "get_last_seen_event": """
+        SELECT last_seen_id FROM doctor_inbox
+        WHERE doctor_id = (SELECT u.id FROM users u WHERE u.id = ? {scope})
+    """,
+    "mark_doctor_events_seen": """
+        INSERT INTO doctor_inbox (doctor_id, last_seen_id)
+        SELECT u.id, ? FROM users u WHERE u.id = ? {scope}
+        ON CONFLICT (doctor_id) DO UPDATE SET last_seen_id = MAX(last_seen_id, excluded.last_seen_id)
+    """,
+    "get_all_users": """
+        SELECT u.id, u.full_name, u.phone, u.role, u.status, u.created_at, c.name
+        FROM users u
+        LEFT JOIN clinics c ON c.id = u.clinic_id
+        {scope}
+        {order_by}
+    """,
+    "delete_user": "DELETE FROM users WHERE id = ?",
+    # What happens to a deleted user's rows (see delete_user_by_admin): patients of a
+    # deleted doctor go back to 'pending' with no doctor; other references are cleared
+    "unassign_doctor_patients": """
+        UPDATE patients SET assigned_doctor_id = NULL, doctor_status = 'pending'
+        WHERE assigned_doctor_id = ?
+    """,
+    "clear_patient_creator": """
+        UPDATE patients SET created_by_receptionist_id = NULL WHERE created_by_receptionist_id = ?
+    """,
+    "clear_encounter_doctor": "UPDATE encounters SET doctor_id = NULL WHERE doctor_id = ?",
+    "create_user_by_admin": """
+        INSERT INTO users (full_name, phone, password, role, status, clinic_id)
+        VALUES (?, ?, ?, ?, 'active', ?)
+    """,
+
+    # --- Clinics ---
+    "get_clinics": "SELECT id, name FROM clinics ORDER BY name",
+    "create_clinic": "INSERT INTO clinics (name) VALUES (?)",
+    # Admins always see the whole hospital
+    "get_user_clinic": "SELECT clinic_id FROM users WHERE id = ? AND role != 'admin'",
+    "set_user_clinic": "UPDATE users SET clinic_id = ? WHERE id = ?",
+    # Patients a user registered or treats before clinics existed move with them
+    "move_creator_patients": """
+        UPDATE patients SET clinic_id = ? WHERE created_by_receptionist_id = ? AND clinic_id IS NULL
+    """,
+    "move_doctor_patients": """
+        UPDATE patients SET clinic_id = ? WHERE assigned_doctor_id = ? AND clinic_id IS NULL
+    """,
+
+    # --- Patients ---
+    # A patient belongs to the clinic of the receptionist who registered them
+    "create_patient": """
+        INSERT INTO patients (first_name, last_name, date_of_birth, gender, contact_phone, problem, address, blood_type, created_by_receptionist_id, dup_name_key, dup_phone_key, clinic_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT clinic_id FROM users WHERE id = ?))
+    """,
+    "duplicate_candidates": """
+        SELECT id, first_name, last_name, date_of_birth, contact_phone
+        FROM patients
+        WHERE (dup_name_key = ? OR dup_phone_key = ?) AND +deleted_at IS NULL {scope}
+    """,
+    # Same normalized phone (the dup_phone_key index), as the receptionist types it
+    "patients_by_phone": """
+        SELECT id, full_name, date_of_birth
+        FROM patients
+        WHERE dup_phone_key = ? AND +deleted_at IS NULL AND id IS NOT ? {scope}
+        ORDER BY id LIMIT ?
+    """,
+    "delete_patient": """
+        UPDATE patients SET deleted_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND deleted_at IS NULL {scope}
+    """,
+    "get_all_patients": f"""
+        SELECT p.id, p.full_name, p.date_of_birth, p.contact_phone, p.problem, u.full_name, p.doctor_status, p.created_at, p.blood_type,
+               {PATIENT_AGE}
+        FROM patients p
+        LEFT JOIN users u ON p.assigned_doctor_id = u.id
+        WHERE p.deleted_at IS NULL {{scope}}
+    """,
+    "get_patients_page": f"""
+        SELECT p.id, p.full_name, p.date_of_birth, p.contact_phone, p.problem, u.full_name, p.doctor_status, p.created_at, p.blood_type,
+               {PATIENT_AGE}
+        FROM patients p
+        LEFT JOIN users u ON p.assigned_doctor_id = u.id
+        {{where}}
+        {{order_by}}
+        LIMIT ? OFFSET ?
+    """,
+    "count_patients": "SELECT COUNT(*) FROM patients p {where}",
+    "assign_patient": """
+        UPDATE patients
+        SET assigned_doctor_id = ?, doctor_status = 'pending', status_changed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND deleted_at IS NULL {scope}
+    """,
+    "get_patients_for_doctor": f"""
+        SELECT p.id, p.full_name, p.date_of_birth, p.gender, p.contact_phone, p.problem, p.doctor_status, p.created_at, p.blood_type,
+               {PATIENT_AGE}
+        FROM patients p
+        WHERE p.assigned_doctor_id = ? AND +p.deleted_at IS NULL {{scope}}
+        {{order_by}}
+    """,
+    "update_patient_status": """
+        UPDATE patients SET doctor_status = ?, status_changed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND deleted_at IS NULL {scope}
+    """,
+    "get_patient_details": """
+        SELECT first_name, last_name, date_of_birth, gender,
+               contact_phone, problem, address, blood_type
+        FROM patients
+        WHERE id = ? AND deleted_at IS NULL {scope}
+    """,
+    "get_patient_problem": "SELECT problem FROM patients WHERE id = ? AND deleted_at IS NULL {scope}",
+    "update_patient": """
+        UPDATE patients SET
+            first_name = ?,
+            last_name = ?,
+            date_of_birth = ?,
+            gender = ?,
+            contact_phone = ?,
+            problem = ?,
+            address = ?,
+            blood_type = ?,
+            dup_name_key = ?,
+            dup_phone_key = ?,
+            row_version = row_version + 1
+        WHERE id = ? AND deleted_at IS NULL {scope}
+    """,
+    "search_patients": f"""
+        SELECT p.id, p.full_name, p.date_of_birth, p.contact_phone, p.problem, u.full_name, p.doctor_status, p.created_at, p.blood_type,
+               {PATIENT_AGE}
+        FROM patients p
+        LEFT JOIN users u ON p.assigned_doctor_id = u.id
+        WHERE p.deleted_at IS NULL
+          AND (p.id = ? OR p.full_name LIKE ? OR p.contact_phone LIKE ?) {{scope}}
+    """,
+    # Only valid while the archive database is ATTACHed (DatabaseManager._archive_attached)
+    "search_archived_patients": f"""
+        SELECT a.id, a.first_name || ' ' || a.last_name, a.date_of_birth, a.contact_phone, a.problem, u.full_name, 'archived', a.created_at, a.blood_type,
+               {age_sql("date(a.date_of_birth)")}
+        FROM archive.patients a
+        LEFT JOIN main.users u ON a.assigned_doctor_id = u.id
+        WHERE (a.id = ? OR a.first_name || ' ' || a.last_name LIKE ? OR a.contact_phone LIKE ?) {{scope}}
+    """,
+
+    # --- Orphan repair (databases written before foreign keys were enforced) ---
+    "repair_patient_doctors": """
+        UPDATE patients SET assigned_doctor_id = NULL, doctor_status = 'pending'
+        WHERE assigned_doctor_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM users WHERE users.id = patients.assigned_doctor_id)
+    """,
+    "repair_patient_creators": """
+        UPDATE patients SET created_by_receptionist_id = NULL
+        WHERE created_by_receptionist_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM users WHERE users.id = patients.created_by_receptionist_id)
+    """,
+    "repair_encounter_doctors": """
+        UPDATE encounters SET doctor_id = NULL
+        WHERE doctor_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM users WHERE users.id = encounters.doctor_id)
+    """,
+    "delete_orphan_encounters": """
+        DELETE FROM encounters
+        WHERE NOT EXISTS (SELECT 1 FROM patients WHERE patients.id = encounters.patient_id)
+    """,
+
+    # --- Visit history ---
+    # Only for a current patient the session may see; inserts nothing otherwise
+    "add_encounter": """
+        INSERT INTO encounters (patient_id, visit_date, doctor_id, diagnosis, notes)
+        SELECT p.id, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ? FROM patients p
+        WHERE p.id = ? AND p.deleted_at IS NULL {scope}
+    """,
+    "add_system_encounter": """
+        INSERT INTO encounters (patient_id, diagnosis, notes)
+        VALUES (?, ?, ?)
+    """,
+    "timeline_first_page": """
+        SELECT e.id, e.visit_date, u.full_name, e.diagnosis, e.notes
+        FROM encounters e
+        LEFT JOIN users u ON e.doctor_id = u.id
+        WHERE e.patient_id = (SELECT p.id FROM patients p WHERE p.id = ? {scope})
+        ORDER BY e.visit_date DESC, e.id DESC
+        LIMIT ?
+    """,
+    "timeline_next_page": """
+        SELECT e.id, e.visit_date, u.full_name, e.diagnosis, e.notes
+        FROM encounters e
+        LEFT JOIN users u ON e.doctor_id = u.id
+        WHERE e.patient_id = (SELECT p.id FROM patients p WHERE p.id = ? {scope}) AND (e.visit_date, e.id) < (?, ?)
+        ORDER BY e.visit_date DESC, e.id DESC
+        LIMIT ?
+    """,
+}
+
+# Statements run on every refresh or click: they must never scan a whole table.
+# (get_all_users, get_all_patients and search_patients list or LIKE-match
+# everything by design, so they are not held to this.)
+HOT_QUERIES = {
+    "login_lookup", "record_login_failure", "lock_login", "clear_login_failures", "get_login_lock",
+    "get_pending_registrations", "approve_registration",
+    "deny_registration", "get_doctors", "get_doctor_workload", "get_one_doctor_workload", "delete_user",
+    "get_doctor_events", "get_last_seen_event", "get_user_clinic", "mark_doctor_events_seen", "unassign_doctor_patients",
+    "clear_patient_creator", "clear_encounter_doctor", "duplicate_candidates", "phone_registered", "patients_by_phone",
+    "delete_patient", "get_patients_page", "count_patients", "assign_patient",
+    "get_patients_for_doctor", "update_patient_status", "get_patient_details",
+    "get_patient_problem", "update_patient", "timeline_first_page", "timeline_next_page",
+}
+
+# Template parts used when explaining templates (the default list view of a hospital-wide session)
+EXPLAIN_PARTS = {
+    "where": "WHERE p.deleted_at IS NULL",
+    "order_by": "ORDER BY p.id ASC",
+    "scope": "",
+}
+
+# "SCAN patients" is a full table scan; "SCAN p USING INDEX ..." walks an index
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# Once ANALYZE has run (see maintenance.py) the planner knows when a table is so
+# small that reading all of it beats an index lookup; such scans are not reported.
+SMALL_TABLE_ROWS = 1000
+
+
+def sql(name, **parts):
+    """Returns the SQL of a registered statement, filling in template parts."""
+    statement = QUERIES[name]
+    return statement.format(**parts) if parts else statement
+
+
+class QueryTimings:
+    """Per-statement call counts and execution times."""
+
+    def __init__(self):
+        self.stats = {} # name -> [calls, total_seconds, max_seconds]
+
+    def record(self, name, seconds):
+        entry = self.stats.get(name)
+        if entry is None:
+            self.stats[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def summary(self):
+        """Returns [(name, calls, total_ms, avg_ms, max_ms)], slowest total first."""
+        rows = [(name, calls, total * 1000, total * 1000 / calls, longest * 1000)
+                for name, (calls, total, longest) in self.stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def explain(conn, name):
+    """Returns the EXPLAIN QUERY PLAN detail lines of a registered statement."""
+    statement = QUERIES[name]
+    if "{" in statement:
+        statement = statement.format(**{part: EXPLAIN_PARTS[part] for part in EXPLAIN_PARTS
+                                        if "{" + part + "}" in statement})
+    # The plan does not depend on the values, so bind NULLs
+    params = (None,) * statement.count("?")
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, params)]
+
+
+def analyzed_row_counts(conn):
+    """Returns {table: row count} as recorded by ANALYZE ({} if it never ran)."""
+    try:
+        # The first number of each sqlite_stat1 entry is the table's row count
+        return dict(conn.execute("SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"))
+    except sqlite3.Error:
+        return {}
+
+
+def find_full_scans(conn, names=None):
+    """
+    Returns [(name, plan line)] for every full table scan in the (hot)
+    statements, except scans of tables ANALYZE found to be small.
+    """
+    row_counts = analyzed_row_counts(conn)
+    scans = []
+    for name in sorted(names or HOT_QUERIES):
+        for detail in explain(conn, name):
+            match = _FULL_SCAN.match(detail)
+            if not match:
+                continue
+            # Plans name a table by its alias ("SCAN p" for "FROM patients p")
+            table = match.group(1)
+            aliased = re.search(rf"(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?{table}\b", QUERIES[name], re.IGNORECASE)
+            if aliased:
+                table = aliased.group(1)
+            if row_counts.get(table, SMALL_TABLE_ROWS) >= SMALL_TABLE_ROWS:
+                scans.append((name, detail))
+    return scans
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python queries.py <database file>")
+        sys.exit(2)
+    from db_manager import DatabaseManager
+    db = DatabaseManager(sys.argv[1]) # Makes sure the schema and indexes exist
+    for query_name in sorted(HOT_QUERIES):
+        print(f"{query_name}:")
+        for plan_line in explain(db.conn, query_name):
+            print(f"    {plan_line}")
+    full_scans = find_full_scans(db.conn)
+    for query_name, plan_line in full_scans:
+        print(f"FULL SCAN in {query_name}: {plan_line}")
+    sys.exit(1 if full_scans else 0)
@@ -0,0 +1,85 @@
+"""
+Typed row records returned by every HospitalRepository implementation.
+
+They are named tuples, so code can use `patient.doctor_status` instead of
+`patient[6]`, while old positional code and tuple comparisons keep working.
+Named tuples define `__slots__ = ()`, so a record costs no more memory than a
+plain tuple row. DatabaseManager builds them straight from the cursor through a
+row_factory; widgets keep the record on their table rows (Qt.UserRole) and read
+fields by name rather than by column position.
+"""
+from collections import namedtuple
+from datetime import date, datetime
+
+# One row of the admin "pending registrations" table
+PendingUser = namedtuple("PendingUser", "id full_name phone role created_at")
+
+# One row of the admin "all users" table (clinic_name is None for hospital-wide users)
+User = namedtuple("User", "id full_name phone role status created_at clinic_name")
+
+# A clinic (site or department) that users and patients can belong to (see DatabaseManager.start_session)
+Clinic = namedtuple("Clinic", "id name")
+
+# An active doctor, as listed in the "Assign Doctor" dialog
+Doctor = namedtuple("Doctor", "id full_name")
+
+# An active doctor with their current patient counts (see workload.py)
+DoctorWorkload = namedtuple("DoctorWorkload", "id full_name pending accepted denied")
+
+# One entry of a doctor's notification inbox (see inbox.py); kind is 'assigned' or 'unassigned'
+# and patient_name is None once the patient has been archived
+DoctorEvent = namedtuple("DoctorEvent", "id kind patient_id patient_name created_at")
+
+# One row of the receptionist's patient list (doctor_name is None if unassigned,
+# age is None if the date of birth is not a valid date)
+PatientSummary = namedtuple(
+    "PatientSummary",
+    "id full_name date_of_birth contact_phone problem doctor_name doctor_status created_at blood_type age")
+
+# One row of a doctor's patient lists
+Patient = namedtuple(
+    "Patient",
+    "id full_name date_of_birth gender contact_phone problem doctor_status created_at blood_type age")
+
+# The editable fields of one patient (EditPatientDialog)
+PatientDetails = namedtuple(
+    "PatientDetails",
+    "first_name last_name date_of_birth gender contact_phone problem address blood_type")
+
+# One visit in a patient's history
+Encounter = namedtuple("Encounter", "id visit_date doctor_name diagnosis notes")
+
+# A likely duplicate of a patient being registered
+DuplicateCandidate = namedtuple("DuplicateCandidate", "score patient_id full_name date_of_birth contact_phone")
+
+# A patient already on file with the phone number typed into a patient form
+PhoneMatch = namedtuple("PhoneMatch", "patient_id full_name date_of_birth")
+
+
+# --- Field formats ---
+
+# Dates of birth are stored as ISO 'YYYY-MM-DD'. Other spellings (day first) are converted.
+DOB_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+
+def normalize_dob(value):
+    """Returns a date of birth as 'YYYY-MM-DD'. Raises ValueError if it is not a past date."""
+    for date_format in DOB_FORMATS:
+        try:
+            parsed = datetime.strptime(value.strip(), date_format).date()
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"Invalid date of birth: {value!r}")
+    if parsed > date.today():
+        raise ValueError(f"Date of birth is in the future: {value!r}")
+    return parsed.isoformat()
+
+def age_on(dob, today=None):
+    """Whole years from an ISO date of birth to `today`, or None if it is not a valid date."""
+    try:
+        born = date.fromisoformat(dob)
+    except (TypeError, ValueError):
+        return None
+    today = today or date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
@@ -0,0 +1,484 @@
+"""
+Offline-first local replica for workstations that reach hms.db over a
+network share.
+
+ReplicaDatabaseManager is a DatabaseManager on a local copy of the database
+(hms_local.db), so every read and every refresh poll is answered locally and
+never waits on the share. Patient writes are applied to the local copy and,
+in the same local transaction, journaled in `replica_outbox`. A background
+thread then syncs with the primary:
+
+1. push: the journaled writes are replayed on the primary in one transaction.
+   Each is recorded in the primary's `replica_pushes` table, so a write is
+   never applied twice even if the workstation dies half-way through a sync.
+   An update_patient() carries the row_version the edit was based on; if the
+   primary's row has moved on (someone else edited the patient meanwhile) the
+   edit is not applied and is reported as a conflict instead.
+2. pull: the rows changed on the primary since the last sync are read from its
+   revision log (change_log.py) and copied into the local copy, together with
+   every row this workstation changed (so rejected writes are undone locally
+   and rows created offline are replaced by the primary's).
+
+Rows created offline get ids from TENTATIVE_ID_BASE up, so they can never be
+confused with primary rows; later journaled writes that refer to such a patient
+are pointed at the primary's id when they are pushed.
+
+User-account and clinic changes and archiving only run while the primary is reachable
+(they are sent to it directly); report rollups are computed locally. Doctors'
+notification events are written locally by the inbox.py triggers as the
+assignments are copied in, and what a doctor has seen is kept per workstation.
+Logins are checked against the local copy, so failed-login counts and lockouts
+(login_limits.py) are kept per workstation too.
+
+    db = ReplicaDatabaseManager(r"\\\\server\\hms\\hms.db", "hms_local.db")
+    db.start_sync() # Push/pull every 10 seconds in the background
+
+    python replica.py PRIMARY.db LOCAL.db   # One sync round from the command line
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import change_log
+from db_manager import DatabaseManager
+
+# Rows inserted into the local copy get ids from here up (primary ids never get this high)
+TENTATIVE_ID_BASE = 1 << 40
+# Written locally and journaled for the primary
+JOURNALED_METHODS = {
+    "create_patient", "delete_patient", "assign_patient_to_doctor",
+    "update_patient_status_by_doctor", "update_patient", "add_encounter",
+}
+# Argument position of the patient id, re-pointed when the patient was created offline
+PATIENT_ID_ARG = {
+    "delete_patient": 0, "assign_patient_to_doctor": 0, "update_patient_status_by_doctor": 0,
+    "update_patient": 0, "add_encounter": 0,
+}
+
+
+class ReplicaOffline(Exception):
+    """The primary database cannot be reached."""
+
+
+class ReplicaDatabaseManager(DatabaseManager):
+    """A DatabaseManager on a local copy of the database, kept in sync with the primary."""
+
+    def __init__(self, primary_path, local_path="hms_local.db"):
+        super().__init__(local_path)
+        self.primary_path = primary_path
+        self.local_path = local_path
+        self.last_sync_at = None
+        self.last_sync_error = None
+        self._primary_ready = False
+        self._sync_lock = threading.Lock() # One sync round at a time
+        self._journal_lock = threading.Lock() # Held by local writes, and while the whole copy is replaced
+        self._sync_thread = None
+        self._wake = threading.Event()
+        self._stopping = False
+        try:
+            # WAL: the sync thread can update the copy while the UI keeps reading it
+            self.cursor.execute("PRAGMA journal_mode=WAL").fetchone()
+            self._create_replica_tables(self.cursor)
+            _reserve_tentative_ids(self.cursor)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error preparing local replica: {e}")
+
+    def _create_replica_tables(self, cursor):
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replica_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            method TEXT NOT NULL,
+            args TEXT NOT NULL,
+            base_version INTEGER,
+            local_result TEXT,
+            queued_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        cursor.execute("CREATE TABLE IF NOT EXISTS replica_state (key TEXT PRIMARY KEY, value TEXT)")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replica_id_map (
+            local_id INTEGER PRIMARY KEY,
+            primary_id INTEGER NOT NULL
+        );
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replica_conflicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            method TEXT NOT NULL,
+            args TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            reported INTEGER NOT NULL DEFAULT 0,
+            detected_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        cursor.execute("INSERT OR IGNORE INTO replica_state (key, value) VALUES ('replica_id', ?)", (uuid.uuid4().hex,))
+        cursor.execute("INSERT OR IGNORE INTO replica_state (key, value) VALUES ('last_revision', '0')")
+
+    # --- Journaled writes ---
+
+    def _journal(self, method_name, *args, base_version=None):
+        """Applies a write to the local copy and journals it for the primary, in one local transaction."""
+        if method_name not in JOURNALED_METHODS:
+            raise ValueError(f"'{method_name}' is not a journaled write")
+        with self._journal_lock, self.batch():
+            self.cursor.execute("SAVEPOINT batch_item")
+            try:
+                result = getattr(DatabaseManager, method_name)(self, *args)
+            finally:
+                self.cursor.execute("RELEASE batch_item")
+            if result:
+                self.cursor.execute("""
+                INSERT INTO replica_outbox (method, args, base_version, local_result) VALUES (?, ?, ?, ?)
+                """, (method_name, json.dumps(args), base_version, json.dumps(result)))
+        self.request_sync()
+        return result
+
+    def create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id):
+        return self._journal("create_patient", first_name, last_name, dob, gender, contact_phone,
+                             problem, address, blood_type, receptionist_id)
+
+    def delete_patient(self, patient_id):
+        return self._journal("delete_patient", patient_id)
+
+    def assign_patient_to_doctor(self, patient_id, doctor_id):
+        return self._journal("assign_patient_to_doctor", patient_id, doctor_id)
+
+    def update_patient_status_by_doctor(self, patient_id, new_status):
+        return self._journal("update_patient_status_by_doctor", patient_id, new_status)
+
+    def update_patient(self, patient_id, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
+        # The version this edit is based on; the push refuses it if the primary's row has moved on
+        row = self.cursor.execute("SELECT row_version FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        return self._journal("update_patient", patient_id, first_name, last_name, dob, gender,
+                             contact_phone, problem, address, blood_type,
+                             base_version=row[0] if row else None)
+
+    def add_encounter(self, patient_id, doctor_id, diagnosis, notes, visit_date=None):
+        return self._journal("add_encounter", patient_id, doctor_id, diagnosis, notes, visit_date)
+
+    # --- Online-only operations ---
+
+    def _open_primary(self):
+        if not os.path.exists(self.primary_path):
+            raise ReplicaOffline(f"{self.primary_path} is not reachable")
+        primary = DatabaseManager(self.primary_path, defer_schema=True)
+        if not self._primary_ready:
+            primary.ensure_schema()
+            primary.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS replica_pushes (
+                replica_id TEXT NOT NULL,
+                outbox_id INTEGER NOT NULL,
+                result TEXT,
+                PRIMARY KEY (replica_id, outbox_id)
+            );
+            """)
+            primary.conn.commit()
+            self._primary_ready = True
+        return primary
+
+    def _on_primary(self, method_name, *args, default=False):
+        """Runs a method directly on the primary (e.g. user accounts, archiving), then syncs."""
+        try:
+            primary = self._open_primary()
+        except ReplicaOffline as e:
+            print(f"Not available offline ({method_name}): {e}")
+            return default
+        try:
+            with primary.scoped(self.clinic_id):
+                result = getattr(primary, method_name)(*args)
+        finally:
+            primary.conn.close()
+        self.request_sync()
+        return result
+
+    def register_user(self, full_name, phone, password, role, clinic_id=None):
+        return self._on_primary("register_user", full_name, phone, password, role, clinic_id)
+
+    def approve_registration(self, user_id):
+        return self._on_primary("approve_registration", user_id)
+
+    def deny_registration(self, user_id):
+        return self._on_primary("deny_registration", user_id)
+
+    def create_admin_user(self, full_name, phone, password):
+        return self._on_primary("create_admin_user", full_name, phone, password)
+
+    def delete_user_by_admin(self, user_id, admin_id):
+        return self._on_primary("delete_user_by_admin", user_id, admin_id)
+
+    def create_user_by_admin(self, full_name, phone, password, role, clinic_id=None):
+        return self._on_primary("create_user_by_admin", full_name, phone, password, role, clinic_id)
+
+    def create_clinic(self, name):
+        return self._on_primary("create_clinic", name)
+
+    def set_user_clinic(self, user_id, clinic_id):
+        return self._on_primary("set_user_clinic", user_id, clinic_id)
+
+    def archive_patients(self, older_than_days=365, batch_size=500):
+        return self._on_primary("archive_patients", older_than_days, batch_size, default=None)
+
+    def restore_patient(self, patient_id):
+        return self._on_primary("restore_patient", patient_id)
+
+    def is_patient_archived(self, patient_id):
+        return self._on_primary("is_patient_archived", patient_id)
+
+    def search_patients(self, term, include_archive=True):
+        """Searches the local copy; the archive lives next to the primary, so it is only searched online."""
+        results = super().search_patients(term, include_archive=False)
+        if results or not include_archive:
+            return results
+        return self._on_primary("search_patients", term, True, default=[])
+
+    # --- Sync ---
+
+    def start_sync(self, interval=10):
+        """Starts the background thread that syncs every `interval` seconds (and after every local write)."""
+        if self._sync_thread is None:
+            self._sync_interval = interval
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="hms-replica-sync", daemon=True)
+            self._sync_thread.start()
+
+    def request_sync(self):
+        """Asks the background thread to sync now instead of at its next interval."""
+        self._wake.set()
+
+    def stop_sync(self):
+        if self._sync_thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._sync_thread.join()
+            self._sync_thread = None
+            self._stopping = False
+
+    def _sync_loop(self):
+        while not self._stopping:
+            try:
+                self.sync()
+            except (ReplicaOffline, sqlite3.Error) as e:
+                self.last_sync_error = str(e)
+                print(f"Replica sync failed: {e}")
+            self._wake.wait(self._sync_interval)
+            self._wake.clear()
+
+    def pending_writes(self):
+        """Number of local writes not yet pushed to the primary."""
+        try:
+            return self.cursor.execute("SELECT COUNT(*) FROM replica_outbox").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error reading replica outbox: {e}")
+            return 0
+
+    def take_conflicts(self):
+        """Returns [(method, args, reason)] for writes the primary refused that were not reported yet."""
+        try:
+            rows = self.cursor.execute("""
+            SELECT id, method, args, reason FROM replica_conflicts WHERE reported = 0 ORDER BY id
+            """).fetchall()
+            if rows:
+                self.cursor.execute("UPDATE replica_conflicts SET reported = 1 WHERE id <= ?", (rows[-1][0],))
+                self.conn.commit()
+            return [(method, json.loads(args), reason) for _, method, args, reason in rows]
+        except sqlite3.Error as e:
+            print(f"Error reading sync conflicts: {e}")
+            return []
+
+    def sync(self):
+        """
+        Runs one sync round (push, then pull) on its own connections.
+        Returns {"pushed", "pulled", "conflicts", "full_copy"}; raises
+        ReplicaOffline or sqlite3.Error if the primary cannot be reached.
+        """
+        with self._sync_lock:
+            primary = self._open_primary()
+            local = sqlite3.connect(self.local_path, timeout=30)
+            try:
+                outbox_upto, dirty_upto, pushed, conflicts, new_ids = self._push(primary, local)
+                pulled, full_copy = self._pull(primary.conn, local, outbox_upto, dirty_upto, conflicts, new_ids)
+            finally:
+                local.close()
+                primary.conn.close()
+        self.last_sync_at = time.time()
+        self.last_sync_error = None
+        return {"pushed": pushed, "pulled": pulled, "conflicts": len(conflicts), "full_copy": full_copy}
+
+    def _push(self, primary, local):
+        """
+        Replays the journaled writes on the primary in one transaction.
+        Returns (last outbox id, last local revision, pushed, conflicts, new id mappings).
+        """
+        # One snapshot of the outbox and of the rows those writes touched
+        local.execute("BEGIN")
+        replica_id = _state(local, "replica_id")
+        entries = local.execute("""
+        SELECT id, method, args, base_version, local_result FROM replica_outbox ORDER BY id
+        """).fetchall()
+        dirty_upto = change_log.current_revision(local.cursor())
+        id_map = dict(local.execute("SELECT local_id, primary_id FROM replica_id_map"))
+        local.commit()
+
+        conflicts = []
+        new_ids = {}
+        if not entries:
+            return 0, dirty_upto, 0, conflicts, new_ids
+        with primary.batch():
+            for outbox_id, method, args, base_version, local_result in entries:
+                applied = primary.cursor.execute("""
+                SELECT result FROM replica_pushes WHERE replica_id = ? AND outbox_id = ?
+                """, (replica_id, outbox_id)).fetchone()
+                if applied:
+                    result = json.loads(applied[0]) # Pushed by an earlier round that did not finish
+                else:
+                    args = json.loads(args)
+                    position = PATIENT_ID_ARG.get(method)
+                    if position is not None and args[position] in id_map:
+                        args[position] = id_map[args[position]]
+                    result, reason = self._apply_on_primary(primary, method, args, base_version)
+                    if reason:
+                        conflicts.append((method, json.dumps(args), reason))
+                    primary.cursor.execute("""
+                    INSERT INTO replica_pushes (replica_id, outbox_id, result) VALUES (?, ?, ?)
+                    """, (replica_id, outbox_id, json.dumps(result)))
+                if method == "create_patient" and result:
+                    id_map[json.loads(local_result)] = new_ids[json.loads(local_result)] = result
+        return entries[-1][0], dirty_upto, len(entries), conflicts, new_ids
+
+    def _apply_on_primary(self, primary, method, args, base_version):
+        """Runs one journaled write on the primary. Returns (result, conflict reason or None)."""
+        if method == "update_patient" and base_version is not None:
+            row = primary.cursor.execute("SELECT row_version FROM patients WHERE id = ?", (args[0],)).fetchone()
+            if row and row[0] != base_version:
+                return False, (f"Patient {args[0]} was edited on another workstation (version {row[0]}); "
+                               f"this edit was based on version {base_version} and was not saved.")
+        result = primary.call_in_batch(method, *args)
+        if not result:
+            return result, "The primary database rejected this change."
+        return result, None
+
+    def _pull(self, primary_conn, local, outbox_upto, dirty_upto, conflicts, new_ids):
+        """
+        Copies the primary's changed rows, and the rows this workstation
+        changed, into the local copy. Returns (rows copied, whether the whole database was copied).
+        """
+        primary = primary_conn.cursor()
+        last_revision = int(_state(local, "last_revision"))
+        oldest = change_log.oldest_revision(primary)
+        if last_revision == 0 or (oldest is not None and oldest > last_revision + 1):
+            # Never copied, or the changes since the last sync were pruned from the log
+            with self._journal_lock:
+                if local.execute("SELECT COUNT(*) FROM replica_outbox WHERE id > ?", (outbox_upto,)).fetchone()[0]:
+                    return 0, False # Wait until every local write is pushed
+                self._copy_all(primary_conn, local, conflicts)
+            return None, True
+
+        local.execute("BEGIN IMMEDIATE")
+        try:
+            mark = change_log.current_revision(local.cursor())
+            dirty = set(local.execute("SELECT table_name, row_id FROM change_log WHERE revision <= ?", (dirty_upto,)))
+            # Rows changed locally after the push snapshot are left alone until the next round
+            newer = set(local.execute("SELECT table_name, row_id FROM change_log WHERE revision > ?", (dirty_upto,)))
+            changed, newest = change_log.changes_since(primary, last_revision)
+            rows = (dirty | set(changed)) - newer
+            for table in change_log.REPLICATED_TABLES:
+                columns = _copy_columns(primary, local, table)
+                for row_id in sorted(row_id for row_table, row_id in rows if row_table == table):
+                    _copy_row(primary, local, table, columns, row_id)
+            # Patients created offline were replaced by the primary's rows, which brought their own events
+            local.execute("DELETE FROM doctor_events WHERE patient_id >= ?", (TENTATIVE_ID_BASE,))
+
+            local.execute("UPDATE replica_state SET value = ? WHERE key = 'last_revision'", (str(newest),))
+            # Forget what was synced, and the log entries this copy itself just made
+            local.execute("DELETE FROM change_log WHERE revision <= ? OR revision > ?", (dirty_upto, mark))
+            local.execute("DELETE FROM replica_outbox WHERE id <= ?", (outbox_upto,))
+            local.executemany("INSERT OR REPLACE INTO replica_id_map (local_id, primary_id) VALUES (?, ?)",
+                              new_ids.items())
+            local.executemany("INSERT INTO replica_conflicts (method, args, reason) VALUES (?, ?, ?)", conflicts)
+            local.commit()
+        except Exception:
+            local.rollback()
+            raise
+        return len(rows), False
+
+    def _copy_all(self, primary_conn, local, conflicts):
+        """Replaces the local copy with the whole primary database, keeping the replica's own bookkeeping."""
+        state = local.execute("SELECT key, value FROM replica_state").fetchall()
+        # Outbox ids must never be reused: the primary remembers which ones it has applied
+        outbox_seq = local.execute("SELECT seq FROM sqlite_sequence WHERE name = 'replica_outbox'").fetchone()
+        kept_conflicts = local.execute("SELECT method, args, reason, reported, detected_at FROM replica_conflicts").fetchall()
+        primary_conn.backup(local)
+        cursor = local.cursor()
+        self._create_replica_tables(cursor)
+        cursor.executemany("INSERT OR REPLACE INTO replica_state (key, value) VALUES (?, ?)", state)
+        cursor.execute("UPDATE replica_state SET value = ? WHERE key = 'last_revision'",
+                       (str(change_log.current_revision(cursor)),))
+        cursor.execute("DELETE FROM replica_outbox")
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'replica_outbox'")
+        if outbox_seq:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('replica_outbox', ?)", outbox_seq)
+        cursor.execute("DROP TABLE IF EXISTS replica_pushes") # The primary's, copied along
+        cursor.execute("DELETE FROM change_log") # The primary's history; nothing here is a local change
+        cursor.executemany("""
+        INSERT INTO replica_conflicts (method, args, reason, reported, detected_at) VALUES (?, ?, ?, ?, ?)
+        """, kept_conflicts)
+        cursor.executemany("INSERT INTO replica_conflicts (method, args, reason) VALUES (?, ?, ?)", conflicts)
+        _reserve_tentative_ids(cursor)
+        local.commit()
+
+
+# --- Helpers (sync thread) ---
+
+def _state(conn, key):
+    return conn.execute("SELECT value FROM replica_state WHERE key = ?", (key,)).fetchone()[0]
+
+
+def _reserve_tentative_ids(cursor):
+    """Makes AUTOINCREMENT hand out ids from TENTATIVE_ID_BASE up for rows inserted locally."""
+    for table in change_log.REPLICATED_TABLES:
+        cursor.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT ?, 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        """, (table, table))
+        cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?",
+                       (TENTATIVE_ID_BASE, table, TENTATIVE_ID_BASE))
+
+
+def _copy_columns(primary, local, table):
+    """Stored columns present in both copies (PRAGMA table_info leaves out generated columns)."""
+    local_columns = {row[1] for row in local.execute(f"PRAGMA table_info({table})")}
+    return [row[1] for row in primary.execute(f"PRAGMA table_info({table})") if row[1] in local_columns]
+
+
+def _copy_row(primary, local, table, columns, row_id):
+    """Makes the local row match the primary's: upserted, or deleted if the primary has no such row."""
+    column_list = ", ".join(columns)
+    row = primary.execute(f"SELECT {column_list} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+    if row is None:
+        local.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        return
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "id")
+    local.execute(f"""
+    INSERT INTO {table} ({column_list}) VALUES ({", ".join("?" * len(columns))})
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    """, row)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python replica.py <primary database> <local replica>")
+        sys.exit(2)
+    replica = ReplicaDatabaseManager(sys.argv[1], sys.argv[2])
+    try:
+        summary = replica.sync()
+    except (ReplicaOffline, sqlite3.Error) as e:
+        print(f"Sync failed: {e}")
+        sys.exit(1)
+    print(f"Pushed {summary['pushed']} write(s), {summary['conflicts']} conflict(s); "
+          + ("copied the whole database." if summary["full_copy"] else f"pulled {summary['pulled']} row(s)."))
+    for method, args, reason in replica.take_conflicts():
+        print(f"CONFLICT {method}: {reason}")
@@ -0,0 +1,192 @@
+"""
+Pre-aggregated report rollups for the admin "Reports" tab.
+
+Rollup tables are refreshed by a periodic job (DatabaseManager.refresh_reports).
+Daily registration counts are incremental: only days at or after the last
+watermark are recomputed, so a refresh touches recent rows only. Each age band
+is one range count on the birth_date index. The blood-type distribution is not
+refreshed at all: like the per-doctor counters (workload.py), triggers on
+`patients` keep it up to date in the same transaction as each change. All
+aggregation runs inside SQLite as set-based statements rather than row by row
+in Python.
+
+Reading a report only reads the (small) rollup tables, so the Reports tab
+costs the same no matter how many patients there are.
+"""
+
+REPORT_DAYS = 30 # Days of registration history shown in the Reports tab
+
+# Age bands of the Reports tab and the patient list filter: (label, youngest, oldest or None)
+AGE_BANDS = (
+    ("Children (0-17)", 0, 17),
+    ("Adults (18-64)", 18, 64),
+    ("Seniors (65+)", 65, None),
+)
+
+
+def create_rollup_tables(cursor):
+    """Creates the rollup tables and the index the incremental refresh relies on."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_daily_registrations (
+        day TEXT PRIMARY KEY,
+        patients INTEGER NOT NULL DEFAULT 0,
+        users INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    # Replaced by the live doctor_workload counters (see workload.py)
+    cursor.execute("DROP TABLE IF EXISTS rollup_doctor_patients")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_blood_types (
+        blood_type TEXT PRIMARY KEY,
+        patients INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    create_blood_type_triggers(cursor)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_age_bands (
+        position INTEGER PRIMARY KEY,
+        band TEXT NOT NULL,
+        patients INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_created_at ON patients (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)")
+
+
+def create_blood_type_triggers(cursor):
+    """Creates the triggers that keep rollup_blood_types current; recounts it the first time."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_patients_blood_types_insert'")
+    exists = cursor.fetchone() is not None
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_blood_types_insert AFTER INSERT ON patients
+    WHEN NEW.deleted_at IS NULL
+    BEGIN
+        INSERT INTO rollup_blood_types (blood_type, patients) VALUES (COALESCE(NEW.blood_type, 'Unknown'), 1)
+        ON CONFLICT(blood_type) DO UPDATE SET patients = patients + 1;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_blood_types_delete AFTER DELETE ON patients
+    WHEN OLD.deleted_at IS NULL
+    BEGIN
+        UPDATE rollup_blood_types SET patients = patients - 1 WHERE blood_type = COALESCE(OLD.blood_type, 'Unknown');
+    END
+    """)
+    # A changed blood type or a soft delete: take the old row out, put the new one in
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_blood_types_update AFTER UPDATE OF blood_type, deleted_at ON patients
+    WHEN OLD.blood_type IS NOT NEW.blood_type OR (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+    BEGIN
+        UPDATE rollup_blood_types SET patients = patients - 1
+        WHERE blood_type = COALESCE(OLD.blood_type, 'Unknown') AND OLD.deleted_at IS NULL;
+        INSERT INTO rollup_blood_types (blood_type, patients)
+        SELECT COALESCE(NEW.blood_type, 'Unknown'), 1 WHERE NEW.deleted_at IS NULL
+        ON CONFLICT(blood_type) DO UPDATE SET patients = patients + 1;
+    END
+    """)
+    if not exists:
+        rebuild_blood_types(cursor)
+
+
+def rebuild_blood_types(cursor):
+    """Recounts the blood-type distribution from scratch (one GROUP BY). The caller commits."""
+    cursor.execute("DELETE FROM rollup_blood_types")
+    cursor.execute("""
+    INSERT INTO rollup_blood_types (blood_type, patients)
+    SELECT COALESCE(blood_type, 'Unknown'), COUNT(*) FROM patients
+    WHERE deleted_at IS NULL
+    GROUP BY COALESCE(blood_type, 'Unknown')
+    """)
+
+
+def refresh_rollups(cursor, full=False):
+    """
+    Brings the rollup tables up to date. With full=True the daily rollup and the
+    blood-type counts are rebuilt from scratch; otherwise only days since the
+    last refresh are recomputed (blood types are kept current by triggers).
+    The caller commits.
+    """
+    since_day = None
+    if not full:
+        cursor.execute("SELECT value FROM rollup_state WHERE name = 'daily_watermark'")
+        row = cursor.fetchone()
+        since_day = row[0] if row else None
+
+    # 1. Registrations per day (the watermark day itself is recomputed, it may have grown)
+    if since_day is None:
+        cursor.execute("DELETE FROM rollup_daily_registrations")
+        since_day = "0000-00-00"
+    else:
+        cursor.execute("DELETE FROM rollup_daily_registrations WHERE day >= ?", (since_day,))
+    cursor.execute("""
+    INSERT INTO rollup_daily_registrations (day, patients)
+    SELECT date(created_at), COUNT(*) FROM patients
+    WHERE created_at >= ?
+    GROUP BY date(created_at)
+    """, (since_day,))
+    cursor.execute("""
+    INSERT INTO rollup_daily_registrations (day, users)
+    SELECT date(created_at), COUNT(*) FROM users
+    WHERE created_at >= ?
+    GROUP BY date(created_at)
+    ON CONFLICT(day) DO UPDATE SET users = excluded.users
+    """, (since_day,))
+
+    # 2. Blood-type distribution: maintained by triggers, only rebuilt on request
+    if full:
+        rebuild_blood_types(cursor)
+
+    # 3. Age bands: each is a range count on the (birth_date, deleted_at) index, without reading rows
+    cursor.execute("DELETE FROM rollup_age_bands")
+    for position, (band, youngest, oldest) in enumerate(AGE_BANDS):
+        cursor.execute("""
+        INSERT INTO rollup_age_bands (position, band, patients)
+        SELECT ?, ?, COUNT(*) FROM patients
+        WHERE birth_date <= date('now', 'localtime', ?)
+          AND birth_date > COALESCE(date('now', 'localtime', ?), '')
+          AND +deleted_at IS NULL
+        """, (position, band, f"-{youngest} years", f"-{oldest + 1} years" if oldest is not None else None))
+    cursor.execute("""
+    INSERT INTO rollup_age_bands (position, band, patients)
+    SELECT ?, 'Unknown', COUNT(*) FROM patients WHERE birth_date IS NULL AND +deleted_at IS NULL
+    """, (len(AGE_BANDS),))
+
+    cursor.execute("""
+    INSERT INTO rollup_state (name, value)
+    VALUES ('daily_watermark', date('now')), ('refreshed_at', datetime('now'))
+    ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """)
+
+
+def read_report(cursor, days=REPORT_DAYS):
+    """
+    Reads the rollups into a dict for the Reports tab:
+    {'daily': [(day, patients, users)], 'blood_types': [(blood_type, patients)],
+     'age_bands': [(band, patients)], 'refreshed_at': str or None}
+    """
+    cursor.execute("""
+    SELECT day, patients, users FROM rollup_daily_registrations
+    ORDER BY day DESC LIMIT ?
+    """, (days,))
+    daily = cursor.fetchall()
+
+    cursor.execute("SELECT blood_type, patients FROM rollup_blood_types WHERE patients > 0 ORDER BY patients DESC")
+    blood_types = cursor.fetchall()
+
+    cursor.execute("SELECT band, patients FROM rollup_age_bands ORDER BY position")
+    age_bands = cursor.fetchall()
+
+    cursor.execute("SELECT value FROM rollup_state WHERE name = 'refreshed_at'")
+    row = cursor.fetchone()
+    return {
+        "daily": daily,
+        "blood_types": blood_types,
+        "age_bands": age_bands,
+        "refreshed_at": row[0] if row else None,
+    }
@@ -0,0 +1,876 @@
+"""
+The data-source interface used by MainWindow, plus an in-memory implementation.
+
+MainWindow only calls the methods declared on HospitalRepository and only
+relies on the record types in records.py, so any implementation can be
+plugged in without touching the UI:
+
+- DatabaseManager       (db_manager.py) - the local SQLite file
+- RemoteDatabaseManager (client.py)     - an HMS server (server.py)
+- InMemoryRepository    (this file)     - no database at all; for tests and benchmarks
+
+HospitalRepository is an abstract base class, so an implementation that misses
+a method cannot be created. `python repository.py` runs one shared scenario
+(run_scenario) on InMemoryRepository, on a DatabaseManager and on a
+RemoteDatabaseManager talking to an in-process server, and fails if any of
+them observes something different.
+"""
+import hashlib
+import hmac
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+
+import login_limits
+from duplicates import blocking_keys, match_score, normalize_phone, DUPLICATE_THRESHOLD
+from reports import REPORT_DAYS, AGE_BANDS
+from records import (
+    PendingUser, User, Clinic, Doctor, DoctorWorkload, DoctorEvent, PatientSummary, Patient, PatientDetails,
+    Encounter, DuplicateCandidate, PhoneMatch, normalize_dob, age_on
+)
+
+
+class HospitalRepository(ABC):
+    """Everything the application needs from a data store."""
+
+    def _hash_password(self, password):
+        """Hashes a password for secure storage."""
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def ensure_schema(self):
+        """Prepares the store for use. Only does work the first time."""
+
+    def reader_for_thread(self):
+        """
+        Returns a repository a background thread can read from (see
+        background_lookups.py): a new connection for stores that need one.
+        """
+        return self
+
+    # --- Session ---
+
+    @abstractmethod
+    def start_session(self, user_id):
+        """
+        Scopes every following call to the clinic of the user who logged in:
+        lists, searches and patient edits only see that clinic's users and
+        patients. Admins and users without a clinic see the whole hospital.
+        Returns the session's clinic id (None if hospital-wide).
+        """
+
+    @abstractmethod
+    def get_user_clinic(self, user_id):
+        """Returns the clinic start_session() would limit this user to."""
+
+    @abstractmethod
+    def end_session(self):
+        """Drops the clinic scope (on logout)."""
+
+    # --- Clinics ---
+
+    @abstractmethod
+    def get_clinics(self):
+        """Returns a list of Clinic, by name."""
+
+    @abstractmethod
+    def create_clinic(self, name):
+        """Returns the new clinic's id, or False if the name is taken."""
+
+    @abstractmethod
+    def set_user_clinic(self, user_id, clinic_id):
+        """
+        Moves a user to a clinic (None: hospital-wide), together with the
+        clinic-less patients they registered or are assigned.
+        """
+
+    # --- Users ---
+
+    @abstractmethod
+    def register_user(self, full_name, phone, password, role, clinic_id=None):
+        """Registers a 'pending' doctor/receptionist. Returns True on success."""
+
+    @abstractmethod
+    def check_credentials(self, phone, password, workstation=login_limits.LOCAL_WORKSTATION):
+        """
+        Returns (role, user_id) for an active user, else (None, None).
+        Too many attempts (per phone or per workstation) and locked accounts are refused.
+        """
+
+    @abstractmethod
+    def login_retry_after(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        """Whole seconds until `phone` may try to log in again (0 if it may now)."""
+
+    @abstractmethod
+    def is_phone_registered(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        """
+        True if a user (of any clinic, in any status) already has this phone number.
+        Rate limited per workstation like logins (False when over the limit).
+        """
+
+    @abstractmethod
+    def get_pending_registrations(self):
+        """Returns a list of PendingUser."""
+
+    @abstractmethod
+    def approve_registration(self, user_id):
+        pass
+
+    @abstractmethod
+    def deny_registration(self, user_id):
+        pass
+
+    @abstractmethod
+    def create_admin_user(self, full_name, phone, password):
+        pass
+
+    @abstractmethod
+    def get_doctors(self):
+        """Returns a list of active Doctor records."""
+
+    @abstractmethod
+    def get_doctor_workload(self, doctor_id=None):
+        """
+        Returns DoctorWorkload records (current patients per status) for every
+        active doctor sorted by name, or a one-item list for doctor_id.
+        """
+
+    # --- Doctor notifications ---
+
+    @abstractmethod
+    def get_doctor_events(self, doctor_id, after_id=0, limit=100):
+        """
+        Returns up to `limit` DoctorEvent records of the doctor with an id above
+        after_id, oldest first. Ids only grow, so the newest id seen is a cursor.
+        """
+
+    @abstractmethod
+    def get_last_seen_event(self, doctor_id):
+        """Returns the id of the newest event the doctor has looked at (0 if none)."""
+
+    @abstractmethod
+    def mark_doctor_events_seen(self, doctor_id, event_id):
+        """Records that the doctor has looked at their events up to event_id."""
+
+    @abstractmethod
+    def get_all_users(self, sort_by="id", descending=False):
+        """Returns a list of User, sorted by one of its fields."""
+
+    @abstractmethod
+    def delete_user_by_admin(self, user_id, admin_id):
+        """
+        Deletes a user (not admin_id itself). A deleted doctor's patients are
+        unassigned and set back to 'pending'; other references to the user are cleared.
+        """
+
+    @abstractmethod
+    def create_user_by_admin(self, full_name, phone, password, role, clinic_id=None):
+        pass
+
+    # --- Patients ---
+
+    @abstractmethod
+    def create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id):
+        """
+        Returns the new patient's id, or False on failure (including a `dob`
+        that is not a past date; see records.normalize_dob).
+        """
+
+    @abstractmethod
+    def find_duplicate_candidates(self, first_name, last_name, dob, contact_phone, threshold=DUPLICATE_THRESHOLD, exclude_id=None):
+        """Returns a list of DuplicateCandidate, best first."""
+
+    @abstractmethod
+    def find_patients_by_phone(self, contact_phone, exclude_id=None, limit=5):
+        """Returns up to `limit` PhoneMatch: current patients with the same (normalized) phone number."""
+
+    @abstractmethod
+    def delete_patient(self, patient_id):
+        pass
+
+    @abstractmethod
+    def get_all_patients(self):
+        """Returns a list of PatientSummary."""
+
+    @abstractmethod
+    def get_patients_page(self, filters=None, sort_by="id", descending=False, limit=50, offset=0):
+        """
+        Returns one page of PatientSummary, filtered and sorted by the store.
+        filters: {"doctor_id", "status", "blood_type", "created_from", "created_to", "age_min", "age_max"}
+        (all optional; dates are 'YYYY-MM-DD', and dates and ages are inclusive).
+        """
+
+    @abstractmethod
+    def count_patients(self, filters=None):
+        """Returns how many patients get_patients_page() would page through."""
+
+    @abstractmethod
+    def assign_patient_to_doctor(self, patient_id, doctor_id):
+        pass
+
+    @abstractmethod
+    def get_patients_for_doctor(self, doctor_id, sort_by="id", descending=False):
+        """Returns a list of Patient, sorted by one of its fields."""
+
+    @abstractmethod
+    def update_patient_status_by_doctor(self, patient_id, new_status):
+        pass
+
+    @abstractmethod
+    def get_patient_details(self, patient_id):
+        """Returns PatientDetails, or None if there is no such (current) patient."""
+
+    @abstractmethod
+    def update_patient(self, patient_id, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
+        pass
+
+    @abstractmethod
+    def search_patients(self, term, include_archive=True):
+        """Returns a list of PatientSummary matching an ID, name or phone."""
+
+    # --- Visit history ---
+
+    @abstractmethod
+    def add_encounter(self, patient_id, doctor_id, diagnosis, notes, visit_date=None):
+        pass
+
+    @abstractmethod
+    def get_patient_timeline(self, patient_id, limit=20, before=None):
+        """Returns up to `limit` Encounter records, newest first, older than the `before` cursor."""
+
+    def iter_patient_timeline(self, patient_id, page_size=50):
+        """Yields a patient's full history page by page (lists of Encounter)."""
+        before = None
+        while True:
+            page = self.get_patient_timeline(patient_id, page_size, before)
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            before = (page[-1].visit_date, page[-1].id)
+
+    # --- Reports ---
+
+    @abstractmethod
+    def refresh_reports(self, full=False):
+        pass
+
+    @abstractmethod
+    def get_reports(self):
+        """Returns the report dict described in reports.read_report()."""
+
+    # --- Archive ---
+
+    @abstractmethod
+    def archive_patients(self, older_than_days=365, batch_size=500):
+        """
+        Archives soft-deleted patients, and patients not waiting on a doctor
+        with no registration, assignment, status change or visit for
+        `older_than_days`. Returns the number archived, or None on failure.
+        """
+
+    @abstractmethod
+    def is_patient_archived(self, patient_id):
+        pass
+
+    @abstractmethod
+    def restore_patient(self, patient_id):
+        pass
+
+
+def _sorted_records(records, sort_by, descending):
+    """Sorts records like the SQL lists do: by a field (NULLs first), then by id."""
+    if not records:
+        return []
+    if sort_by not in records[0]._fields:
+        sort_by = "id"
+    def key(record):
+        value = getattr(record, sort_by)
+        return (value is not None, value if value is not None else 0, record[0])
+    return sorted(records, key=key, reverse=descending)
+
+
+def _now():
+    """Current UTC time in SQLite's CURRENT_TIMESTAMP format."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class InMemoryRepository(HospitalRepository):
+    """
+    A HospitalRepository that keeps everything in Python dicts.
+    Behaves like DatabaseManager (same records, same rules) but needs no
+    database file, which makes it handy for tests, demos and benchmarks.
+    """
+
+    def __init__(self):
+        self.clinics = {} # id -> name
+        self.clinic_id = None # Session scope (see start_session)
+        self.users = {} # id -> dict
+        self.patients = {} # id -> dict (current and soft-deleted patients)
+        self.archived_patients = {} # id -> dict
+        self.encounters = [] # dicts, in insertion order
+        self.doctor_events = [] # DoctorEvent-like dicts with a doctor_id, in id order
+        self.last_seen_events = {} # doctor id -> newest event id looked at
+        self.login_attempts = {} # phone -> [failures, locked_until]
+        self.login_limiter = login_limits.LoginLimiter()
+        self.report = None
+        self._next_user_id = 1
+        self._next_patient_id = 1
+        self._next_encounter_id = 1
+        self._next_event_id = 1
+        self._next_clinic_id = 1
+        self._add_user("Default Admin", "admin", "admin123", "admin", "active")
+
+    def _add_user(self, full_name, phone, password, role, status, clinic_id=None):
+        if any(user["phone"] == phone for user in self.users.values()):
+            return False # Phone already exists
+        self.users[self._next_user_id] = {
+            "full_name": full_name, "phone": phone, "password": self._hash_password(password),
+            "role": role, "status": status, "created_at": _now(), "clinic_id": clinic_id,
+        }
+        self._next_user_id += 1
+        self.login_limiter.forget_unknown(phone)
+        return True
+
+    def _in_scope(self, row):
+        """True if a user or patient dict belongs to the session's clinic (or the session is hospital-wide)."""
+        return self.clinic_id is None or row.get("clinic_id") == self.clinic_id
+
+    def _current_patients(self):
+        return [(patient_id, p) for patient_id, p in self.patients.items() if p["deleted_at"] is None]
+
+    def _visible_patient(self, patient_id):
+        """The patient's dict if the session may see it, else None."""
+        p = self.patients.get(patient_id)
+        return p if p is not None and self._in_scope(p) else None
+
+    def _visible_patients(self):
+        return [(patient_id, p) for patient_id, p in self._current_patients() if self._in_scope(p)]
+
+    # --- Session ---
+
+    def start_session(self, user_id):
+        self.clinic_id = self.get_user_clinic(user_id)
+        return self.clinic_id
+
+    def get_user_clinic(self, user_id):
+        user = self.users.get(user_id)
+        return user["clinic_id"] if user and user["role"] != "admin" else None
+
+    def end_session(self):
+        self.clinic_id = None
+
+    # --- Clinics ---
+
+    def get_clinics(self):
+        return sorted((Clinic(clinic_id, name) for clinic_id, name in self.clinics.items()), key=lambda c: c.name)
+
+    def create_clinic(self, name):
+        if name in self.clinics.values():
+            return False
+        clinic_id = self._next_clinic_id
+        self._next_clinic_id += 1
+        self.clinics[clinic_id] = name
+        return clinic_id
+
+    def set_user_clinic(self, user_id, clinic_id):
+        if user_id not in self.users:
+            return True # Matches SQL: updating no rows is not an error
+        self.users[user_id]["clinic_id"] = clinic_id
+        if clinic_id is not None:
+            for p in self.patients.values():
+                if p["clinic_id"] is None and user_id in (p["created_by_receptionist_id"], p["assigned_doctor_id"]):
+                    p["clinic_id"] = clinic_id
+        return True
+
+    def _summary(self, patient_id, p, doctor_status=None):
+        doctor = self.users.get(p["assigned_doctor_id"])
+        return PatientSummary(
+            patient_id, f"{p['first_name']} {p['last_name']}", p["date_of_birth"], p["contact_phone"],
+            p["problem"], doctor["full_name"] if doctor else None, doctor_status or p["doctor_status"],
+            p["created_at"], p["blood_type"], age_on(p["date_of_birth"]))
+
+    # --- Users ---
+
+    def register_user(self, full_name, phone, password, role, clinic_id=None):
+        if role == "admin":
+            return False # Admins can only be created by other admins
+        return self._add_user(full_name, phone, password, role, "pending", clinic_id)
+
+    def check_credentials(self, phone, password, workstation=login_limits.LOCAL_WORKSTATION):
+        if not self.login_limiter.allow(phone, workstation):
+            return (None, None)
+        user_id = next((user_id for user_id, u in self.users.items() if u["phone"] == phone), None)
+        if user_id is None:
+            self.login_limiter.remember_unknown(phone)
+            return (None, None)
+        user = self.users[user_id]
+        now = time.time()
+        attempts = self.login_attempts.get(phone)
+        if attempts and attempts[1] > now:
+            return (None, None)
+        if not hmac.compare_digest(user["password"], self._hash_password(password)):
+            attempts = self.login_attempts.setdefault(phone, [0, 0])
+            attempts[0] += 1
+            if attempts[0] >= login_limits.MAX_FAILURES:
+                self.login_attempts[phone] = [0, now + login_limits.LOCKOUT_SECONDS]
+            return (None, None)
+        self.login_attempts.pop(phone, None)
+        return (user["role"], user_id) if user["status"] == "active" else (None, None)
+
+    def login_retry_after(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        if not self.login_limiter.allow_lookup(workstation):
+            return max(1, math.ceil(self.login_limiter.wait(phone, workstation)))
+        attempts = self.login_attempts.get(phone)
+        locked_for = attempts[1] - time.time() if attempts else 0
+        return max(0, math.ceil(max(locked_for, self.login_limiter.wait(phone))))
+
+    def is_phone_registered(self, phone, workstation=login_limits.LOCAL_WORKSTATION):
+        if not self.login_limiter.allow_lookup(workstation):
+            return False
+        return any(user["phone"] == phone for user in self.users.values())
+
+    def get_pending_registrations(self):
+        return [PendingUser(user_id, u["full_name"], u["phone"], u["role"], u["created_at"])
+                for user_id, u in self.users.items() if u["status"] == "pending" and self._in_scope(u)]
+
+    def _visible_user(self, user_id):
+        """The user's dict if the session may see it, else None."""
+        u = self.users.get(user_id)
+        return u if u is not None and self._in_scope(u) else None
+
+    def approve_registration(self, user_id):
+        if self._visible_user(user_id) is None:
+            return False
+        self.users[user_id]["status"] = "active"
+        return True
+
+    def deny_registration(self, user_id):
+        if (self._visible_user(user_id) or {}).get("status") == "pending":
+            del self.users[user_id]
+        return True
+
+    def create_admin_user(self, full_name, phone, password):
+        return self._add_user(full_name, phone, password, "admin", "active")
+
+    def get_doctors(self):
+        return [Doctor(user_id, u["full_name"]) for user_id, u in self.users.items()
+                if u["role"] == "doctor" and u["status"] == "active" and self._in_scope(u)]
+
+    def get_doctor_workload(self, doctor_id=None):
+        counts = {}
+        for _, p in self._current_patients():
+            if p["assigned_doctor_id"] is not None:
+                doctor_counts = counts.setdefault(p["assigned_doctor_id"], {"pending": 0, "accepted": 0, "denied": 0})
+                doctor_counts[p["doctor_status"]] += 1
+        if doctor_id is None:
+            doctor_ids = [user_id for user_id, u in self.users.items()
+                          if u["role"] == "doctor" and u["status"] == "active" and self._in_scope(u)]
+        else:
+            doctor_ids = [doctor_id] if self._visible_user(doctor_id) else []
+        workload = []
+        for user_id in doctor_ids:
+            c = counts.get(user_id, {"pending": 0, "accepted": 0, "denied": 0})
+            workload.append(DoctorWorkload(user_id, self.users[user_id]["full_name"], c["pending"], c["accepted"], c["denied"]))
+        return sorted(workload, key=lambda record: record.full_name)
+
+    def get_all_users(self, sort_by="id", descending=False):
+        return _sorted_records([User(user_id, u["full_name"], u["phone"], u["role"], u["status"], u["created_at"],
+                                     self.clinics.get(u["clinic_id"]))
+                                for user_id, u in self.users.items() if self._in_scope(u)], sort_by, descending)
+
+    def delete_user_by_admin(self, user_id, admin_id):
+        if user_id == admin_id:
+            return False # Admin cannot delete themselves
+        self.users.pop(user_id, None)
+        self.doctor_events = [event for event in self.doctor_events if event["doctor_id"] != user_id]
+        self.last_seen_events.pop(user_id, None)
+        for p in self.patients.values():
+            if p["assigned_doctor_id"] == user_id:
+                p.update(assigned_doctor_id=None, doctor_status="pending")
+            if p["created_by_receptionist_id"] == user_id:
+                p["created_by_receptionist_id"] = None
+        for encounter in self.encounters:
+            if encounter["doctor_id"] == user_id:
+                encounter["doctor_id"] = None
+        return True
+
+    def create_user_by_admin(self, full_name, phone, password, role, clinic_id=None):
+        if role not in ('admin', 'doctor', 'receptionist'):
+            return False
+        return self._add_user(full_name, phone, password, role, "active", clinic_id)
+
+    # --- Patients ---
+
+    def create_patient(self, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type, receptionist_id):
+        try:
+            dob = normalize_dob(dob)
+        except ValueError:
+            return False
+        patient_id = self._next_patient_id
+        self._next_patient_id += 1
+        self.patients[patient_id] = {
+            "first_name": first_name, "last_name": last_name, "date_of_birth": dob, "gender": gender,
+            "contact_phone": contact_phone, "problem": problem, "address": address, "blood_type": blood_type,
+            "assigned_doctor_id": None, "doctor_status": "pending",
+            "created_by_receptionist_id": receptionist_id, "created_at": _now(), "deleted_at": None,
+            "status_changed_at": None,
+            "clinic_id": self.users.get(receptionist_id, {}).get("clinic_id"),
+        }
+        self.add_encounter(patient_id, None, problem, "Registered")
+        return patient_id
+
+    def find_duplicate_candidates(self, first_name, last_name, dob, contact_phone, threshold=DUPLICATE_THRESHOLD, exclude_id=None):
+        name_key, phone_key = blocking_keys(last_name, dob, contact_phone)
+        candidates = []
+        for patient_id, p in self._visible_patients():
+            if patient_id == exclude_id:
+                continue
+            other_name_key, other_phone_key = blocking_keys(p["last_name"], p["date_of_birth"], p["contact_phone"])
+            if (name_key and name_key == other_name_key) or (phone_key and phone_key == other_phone_key):
+                score = match_score((first_name, last_name, dob, contact_phone),
+                                    (p["first_name"], p["last_name"], p["date_of_birth"], p["contact_phone"]))
+                if score >= threshold:
+                    candidates.append(DuplicateCandidate(
+                        score, patient_id, f"{p['first_name']} {p['last_name']}", p["date_of_birth"], p["contact_phone"]))
+        candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+        return candidates
+
+    def find_patients_by_phone(self, contact_phone, exclude_id=None, limit=5):
+        phone_key = normalize_phone(contact_phone)
+        if phone_key is None:
+            return []
+        matches = [PhoneMatch(patient_id, f"{p['first_name']} {p['last_name']}", p["date_of_birth"])
+                   for patient_id, p in self._visible_patients()
+                   if patient_id != exclude_id and normalize_phone(p["contact_phone"]) == phone_key]
+        return matches[:limit]
+
+    def delete_patient(self, patient_id):
+        patient = self._visible_patient(patient_id)
+        if patient and patient["deleted_at"] is None:
+            patient["deleted_at"] = _now()
+        return True
+
+    def get_all_patients(self):
+        return [self._summary(patient_id, p) for patient_id, p in self._visible_patients()]
+
+    def _filtered_patients(self, filters):
+        filters = filters or {}
+        for patient_id, p in self._visible_patients():
+            if filters.get("doctor_id") is not None and p["assigned_doctor_id"] != filters["doctor_id"]:
+                continue
+            if filters.get("status") and p["doctor_status"] != filters["status"]:
+                continue
+            if filters.get("blood_type") and p["blood_type"] != filters["blood_type"]:
+                continue
+            if filters.get("created_from") and p["created_at"][:10] < filters["created_from"]:
+                continue
+            if filters.get("created_to") and p["created_at"][:10] > filters["created_to"]:
+                continue
+            age_min, age_max = filters.get("age_min"), filters.get("age_max")
+            if age_min is not None or age_max is not None:
+                age = age_on(p["date_of_birth"])
+                if age is None or (age_min is not None and age < age_min) or (age_max is not None and age > age_max):
+                    continue
+            yield patient_id, p
+
+    def get_patients_page(self, filters=None, sort_by="id", descending=False, limit=50, offset=0):
+        patients = [self._summary(patient_id, p) for patient_id, p in self._filtered_patients(filters)]
+        return _sorted_records(patients, sort_by, descending)[offset:offset + limit]
+
+    def count_patients(self, filters=None):
+        return sum(1 for _ in self._filtered_patients(filters))
+
+    def assign_patient_to_doctor(self, patient_id, doctor_id):
+        p = self._visible_patient(patient_id)
+        if p is None or p["deleted_at"] is not None:
+            return False
+        # The same events the inbox.py triggers write
+        if p["assigned_doctor_id"] != doctor_id or p["doctor_status"] != "pending":
+            if p["assigned_doctor_id"] is not None and p["assigned_doctor_id"] != doctor_id:
+                self._add_doctor_event(p["assigned_doctor_id"], "unassigned", patient_id)
+            self._add_doctor_event(doctor_id, "assigned", patient_id)
+        p.update(assigned_doctor_id=doctor_id, doctor_status="pending", status_changed_at=_now())
+        return True
+
+    def _add_doctor_event(self, doctor_id, kind, patient_id):
+        self.doctor_events.append({"id": self._next_event_id, "doctor_id": doctor_id, "kind": kind,
+                                   "patient_id": patient_id, "created_at": _now()})
+        self._next_event_id += 1
+
+    def get_doctor_events(self, doctor_id, after_id=0, limit=100):
+        if self._visible_user(doctor_id) is None:
+            return []
+        events = []
+        for event in self.doctor_events:
+            if event["doctor_id"] == doctor_id and event["id"] > after_id:
+                p = self.patients.get(event["patient_id"])
+                name = f"{p['first_name']} {p['last_name']}" if p else None
+                events.append(DoctorEvent(event["id"], event["kind"], event["patient_id"], name, event["created_at"]))
+        return events[:limit]
+
+    def get_last_seen_event(self, doctor_id):
+        if self._visible_user(doctor_id) is None:
+            return 0
+        return self.last_seen_events.get(doctor_id, 0)
+
+    def mark_doctor_events_seen(self, doctor_id, event_id):
+        if self._visible_user(doctor_id) is None:
+            return False
+        self.last_seen_events[doctor_id] = max(self.last_seen_events.get(doctor_id, 0), event_id)
+        return True
+
+    def get_patients_for_doctor(self, doctor_id, sort_by="id", descending=False):
+        patients = [Patient(patient_id, f"{p['first_name']} {p['last_name']}", p["date_of_birth"], p["gender"],
+                            p["contact_phone"], p["problem"], p["doctor_status"], p["created_at"], p["blood_type"],
+                            age_on(p["date_of_birth"]))
+                    for patient_id, p in self._visible_patients() if p["assigned_doctor_id"] == doctor_id]
+        return _sorted_records(patients, sort_by, descending)
+
+    def update_patient_status_by_doctor(self, patient_id, new_status):
+        if new_status not in ('accepted', 'denied'):
+            return False
+        p = self._visible_patient(patient_id)
+        if p is None or p["deleted_at"] is not None:
+            return False
+        p.update(doctor_status=new_status, status_changed_at=_now())
+        return True
+
+    def get_patient_details(self, patient_id):
+        p = self._visible_patient(patient_id)
+        if p is None or p["deleted_at"] is not None:
+            return None
+        return PatientDetails(p["first_name"], p["last_name"], p["date_of_birth"], p["gender"],
+                              p["contact_phone"], p["problem"], p["address"], p["blood_type"])
+
+    def update_patient(self, patient_id, first_name, last_name, dob, gender, contact_phone, problem, address, blood_type):
+        p = self._visible_patient(patient_id)
+        if p is None or p["deleted_at"] is not None:
+            return False # Not a current patient of this session
+        try:
+            dob = normalize_dob(dob)
+        except ValueError:
+            return False
+        if p["problem"] != problem:
+            self.add_encounter(patient_id, None, problem, "Problem updated")
+        p.update(first_name=first_name, last_name=last_name, date_of_birth=dob, gender=gender,
+                 contact_phone=contact_phone, problem=problem, address=address, blood_type=blood_type)
+        return True
+
+    def search_patients(self, term, include_archive=True):
+        term = term.strip()
+        patient_id = int(term) if term.isdigit() else -1
+        needle = term.lower()
+
+        def matches(candidate_id, p):
+            return (candidate_id == patient_id
+                    or needle in f"{p['first_name']} {p['last_name']}".lower()
+                    or needle in (p["contact_phone"] or ""))
+
+        results = [self._summary(pid, p) for pid, p in self._visible_patients() if matches(pid, p)]
+        if results or not include_archive:
+            return results
+        return [self._summary(pid, p, "archived") for pid, p in self.archived_patients.items()
+                if self._in_scope(p) and matches(pid, p)]
+
+    # --- Visit history ---
+
+    def add_encounter(self, patient_id, doctor_id, diagnosis, notes, visit_date=None):
+        p = self._visible_patient(patient_id)
+        if p is None or p["deleted_at"] is not None:
+            return False
+        self.encounters.append({
+            "id": self._next_encounter_id, "patient_id": patient_id, "visit_date": visit_date or _now(),
+            "doctor_id": doctor_id, "diagnosis": diagnosis, "notes": notes,
+        })
+        self._next_encounter_id += 1
+        return True
+
+    def get_patient_timeline(self, patient_id, limit=20, before=None):
+        if self._visible_patient(patient_id) is None:
+            return []
+        history = [e for e in self.encounters if e["patient_id"] == patient_id
+                   and (before is None or (e["visit_date"], e["id"]) < tuple(before))]
+        history.sort(key=lambda e: (e["visit_date"], e["id"]), reverse=True)
+        return [Encounter(e["id"], e["visit_date"], self.users.get(e["doctor_id"], {}).get("full_name"),
+                          e["diagnosis"], e["notes"]) for e in history[:limit]]
+
+    # --- Reports ---
+
+    def refresh_reports(self, full=False):
+        """Recomputes the whole report (there are no rollup tables to maintain in memory)."""
+        daily = {} # day -> [new patients, new users]
+        for p in list(self.patients.values()) + list(self.archived_patients.values()):
+            daily.setdefault(p["created_at"][:10], [0, 0])[0] += 1
+        for u in self.users.values():
+            daily.setdefault(u["created_at"][:10], [0, 0])[1] += 1
+
+        blood_types = {}
+        age_bands = dict.fromkeys([band for band, _, _ in AGE_BANDS] + ["Unknown"], 0)
+        for _, p in self._current_patients():
+            blood_type = p["blood_type"] or "Unknown"
+            blood_types[blood_type] = blood_types.get(blood_type, 0) + 1
+            age = age_on(p["date_of_birth"])
+            age_bands[next((band for band, youngest, oldest in AGE_BANDS
+                            if age is not None and youngest <= age and (oldest is None or age <= oldest)), "Unknown")] += 1
+
+        self.report = {
+            "daily": sorted(((day, patients, users) for day, (patients, users) in daily.items()), reverse=True)[:REPORT_DAYS],
+            "blood_types": sorted(blood_types.items(), key=lambda item: item[1], reverse=True),
+            "age_bands": list(age_bands.items()),
+            "refreshed_at": _now(),
+        }
+        return True
+
+    def get_reports(self):
+        if self.report is None:
+            self.refresh_reports()
+        return self.report
+
+    # --- Archive ---
+
+    def archive_patients(self, older_than_days=365, batch_size=500):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+        last_visits = {}
+        for e in self.encounters:
+            last_visits[e["patient_id"]] = max(last_visits.get(e["patient_id"], ""), e["visit_date"])
+        def last_activity(patient_id, p):
+            return max(p["created_at"], p["status_changed_at"] or "", last_visits.get(patient_id, ""))
+        to_archive = [patient_id for patient_id, p in self.patients.items()
+                      if p["deleted_at"] is not None
+                      or (p["doctor_status"] != "pending" and last_activity(patient_id, p) < cutoff)]
+        for patient_id in to_archive:
+            self.archived_patients[patient_id] = self.patients.pop(patient_id)
+        return len(to_archive)
+
+    def is_patient_archived(self, patient_id):
+        p = self.archived_patients.get(patient_id)
+        return p is not None and self._in_scope(p)
+
+    def restore_patient(self, patient_id):
+        if not self.is_patient_archived(patient_id):
+            return False
+        patient = self.archived_patients.pop(patient_id)
+        patient["deleted_at"] = None
+        self.patients[patient_id] = patient
+        return True
+
+
+# --- Shared scenario ---
+
+def run_scenario(repo):
+    """
+    Drives a repository through one day of the admin, receptionist and doctor
+    desks (clinics, logins, patients, visits, reports, archive) using only the
+    interface above, each call made by the role whose dashboard makes it, and
+    returns what it observed as plain tuples. Every implementation must observe
+    the same.
+    """
+    seen = []
+    def note(step, value):
+        seen.append((step, value))
+
+    def log_in(phone):
+        role, user_id = repo.check_credentials(phone, "pass1234" if phone != "admin" else "admin123")
+        repo.start_session(user_id)
+        return user_id
+
+    note("wrong_password", repo.check_credentials("admin", "wrong"))
+    note("admin_login", repo.check_credentials("admin", "admin123"))
+    clinic_id = repo.create_clinic("North")
+    note("clinics", [clinic.name for clinic in repo.get_clinics()])
+    note("register", repo.register_user("Dr Ada Stone", "0711000001", "pass1234", "doctor", clinic_id))
+    note("phone_registered", (repo.is_phone_registered("0711000001"), repo.is_phone_registered("0711999999")))
+    pending = repo.get_pending_registrations()
+    note("pending", [user.full_name for user in pending])
+    repo.approve_registration(pending[0].id)
+    note("receptionist", repo.create_user_by_admin("Rita Desk", "0711000002", "pass1234", "receptionist", clinic_id))
+    note("users", [(user.full_name, user.role) for user in repo.get_all_users(sort_by="full_name")])
+    repo.end_session()
+
+    receptionist_id = log_in("0711000002")
+    note("session_clinic", repo.get_user_clinic(receptionist_id) == clinic_id)
+    first = repo.create_patient("John", "Smith", "1980-05-01", "Male", "0722 000 001", "Cough", "1 Road", "A+",
+                                receptionist_id)
+    second = repo.create_patient("Jon", "Smyth", "1980-05-01", "Male", "0722000001", "Fever", "2 Road", "O-",
+                                 receptionist_id)
+    note("bad_dob", repo.create_patient("Ann", "Lee", "2999-01-01", "Female", "0733000001", "-", "-", "B+",
+                                        receptionist_id))
+    note("by_phone", [match.full_name for match in repo.find_patients_by_phone("0722-000-001", exclude_id=second)])
+    note("duplicates", [candidate.patient_id for candidate in
+                        repo.find_duplicate_candidates("John", "Smith", "1980-05-01", "0722000001")])
+    doctor = repo.get_doctors()[0]
+    repo.assign_patient_to_doctor(first, doctor.id)
+    note("page", [patient.full_name for patient in repo.get_patients_page(sort_by="full_name")])
+    note("count", (repo.count_patients(), repo.count_patients({"blood_type": "O-"})))
+    note("update", repo.update_patient(second, "Jon", "Smyth", "1980-05-01", "Male", "0722000001", "Flu", "2 Road",
+                                       "AB+"))
+    note("details", repo.get_patient_details(second).blood_type)
+    repo.end_session()
+
+    doctor_id = log_in("0711000001")
+    note("status", repo.update_patient_status_by_doctor(first, "accepted"))
+    note("workload", [tuple(workload)[1:] for workload in repo.get_doctor_workload(doctor_id)])
+    note("doctor_patients", [patient.full_name for patient in repo.get_patients_for_doctor(doctor_id)])
+    repo.add_encounter(first, doctor_id, "Bronchitis", "Rest", "2024-01-02 10:00:00")
+    note("timeline", [encounter.diagnosis for encounter in repo.get_patient_timeline(first)])
+    repo.end_session()
+
+    log_in("0711000002")
+    note("delete", repo.delete_patient(second))
+    note("search", [patient.full_name for patient in repo.search_patients("Sm", include_archive=False)])
+    repo.end_session()
+
+    log_in("admin")
+    repo.refresh_reports(full=True)
+    note("blood_types", sorted(tuple(row) for row in repo.get_reports()["blood_types"]))
+    note("age_bands", repo.get_reports()["age_bands"]) # Compared as returned: rows are tuples everywhere
+    note("archived", (repo.archive_patients(older_than_days=365), repo.is_patient_archived(second)))
+    note("restored", (repo.restore_patient(second), repo.is_patient_archived(second)))
+    note("all_patients", sorted(patient.full_name for patient in repo.get_all_patients()))
+    repo.end_session()
+    return seen
+
+
+def _compare_scenarios(name, expected, observed):
+    """Prints each step whose result differs from InMemoryRepository's. Returns True if none does."""
+    mismatches = [(step, want, got) for (step, want), (_, got) in zip(expected, observed) if want != got]
+    for step, want, got in mismatches:
+        print(f"{name}: {step}: expected {want!r}, got {got!r}")
+    print(f"{name}: {'same as InMemoryRepository' if not mismatches else f'{len(mismatches)} step(s) differ'}")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    # python repository.py: runs the shared scenario on every implementation and compares the results
+    import asyncio
+    import os
+    import socket
+    import sys
+    import tempfile
+    import threading
+    from db_manager import DatabaseManager
+    from client import RemoteDatabaseManager
+    from server import HMSServer
+
+    expected = run_scenario(InMemoryRepository())
+    with tempfile.TemporaryDirectory() as work_dir:
+        same = _compare_scenarios("DatabaseManager", expected,
+                                  run_scenario(DatabaseManager(os.path.join(work_dir, "local.db"))))
+
+        with socket.socket() as probe: # A free port for the server
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        hms_server = HMSServer(os.path.join(work_dir, "server.db"))
+        threading.Thread(target=asyncio.run, args=(hms_server.serve("127.0.0.1", port),), daemon=True).start()
+        remote = RemoteDatabaseManager(f"http://127.0.0.1:{port}")
+        for _ in range(50): # Wait for the server to listen
+            try:
+                remote.get_clinics()
+                break
+            except OSError:
+                time.sleep(0.1)
+        same = _compare_scenarios("RemoteDatabaseManager", expected, run_scenario(remote)) and same
+        hms_server.writer.close()
+    sys.exit(0 if same else 1)
@@ -0,0 +1,143 @@
+"""
+Memory-bounded cache of the rows MainWindow has fetched.
+
+Every table view (pending users, all users, the doctor's patients, each page
+of the receptionist's patient list, ...) stores the rows it shows here under a
+key describing what was fetched. The cache:
+- accounts the approximate size of every entry (estimate_size);
+- keeps what is currently on screen (one key per view) and evicts the least
+  recently used off-screen entries once the total exceeds its budget;
+- counts hits, misses and evictions for diagnostics (stats / describe).
+
+The records are the same objects the tables hold under Qt.UserRole, so they
+are not copied; the cache only decides how long they stay alive.
+
+    cache = RowCache(budget_bytes=32 * 1024 * 1024)
+    if cache.show("doctor_patients", ("doctor_patients", 7, "id", False), patients):
+        dashboard.load_assigned_patients(patients) # Only redraw when something changed
+"""
+import os
+import sys
+from collections import OrderedDict
+
+DEFAULT_BUDGET_MB = 32 # Override with the HMS_CACHE_MB environment variable
+
+
+def estimate_size(value):
+    """Approximate bytes held by a value and everything it contains (shared objects counted once)."""
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
+class RowCache:
+    """LRU cache of fetched rows with a memory budget; on-screen entries are never evicted."""
+
+    def __init__(self, budget_bytes=None):
+        if budget_bytes is None:
+            budget_bytes = int(float(os.environ.get("HMS_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (value, size), least recently used first
+        self._visible = {} # view -> key it currently shows
+
+    def get(self, key, default=None):
+        """Returns the cached value for key (marking it recently used), or default."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        """Stores a value, then evicts off-screen entries until the cache fits its budget."""
+        self._remove(key)
+        size = estimate_size(value)
+        self._entries[key] = (value, size)
+        self.size_bytes += size
+        self._evict()
+
+    def show(self, view, key, value):
+        """
+        Records that `view` now shows `value` (fetched for `key`).
+        Returns True if the view must be redrawn: it showed another key, or the rows changed.
+        """
+        # Read _entries directly: a refresh poll is not a cache lookup, so it counts no hit or miss
+        entry = self._entries.get(key)
+        changed = self._visible.get(view) != key or entry is None or entry[0] != value
+        self._visible[view] = key
+        if changed:
+            self.put(key, value)
+        else:
+            self._entries.move_to_end(key)
+        return changed
+
+    def visible_key(self, view):
+        return self._visible.get(view)
+
+    def discard(self, key):
+        self._remove(key)
+
+    def clear(self):
+        """Drops every entry (e.g. on logout). Counters are kept."""
+        self._entries.clear()
+        self._visible.clear()
+        self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "visible": len(set(self._visible.values())),
+            "size_bytes": self.size_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def describe(self):
+        """One-line summary for diagnostics output."""
+        stats = self.stats()
+        return (f"Row cache: {stats['entries']} entries ({stats['visible']} on screen), "
+                f"{stats['size_bytes'] / 1024:.0f} KB of {stats['budget_bytes'] / 1024:.0f} KB; "
+                f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+
+    def _evict(self):
+        if self.size_bytes <= self.budget_bytes:
+            return
+        on_screen = set(self._visible.values())
+        for key in list(self._entries):
+            if self.size_bytes <= self.budget_bytes:
+                break
+            if key in on_screen:
+                continue # Shown right now; the table holds these records anyway
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,304 @@
+"""
+Headless service mode: serves DatabaseManager operations over a small HTTP/JSON API.
+
+    python server.py --db hms.db --host 127.0.0.1 --port 8765
+
+Workstations then start the GUI with `python main.py --server http://HOST:8765`
+(or HMS_SERVER=http://HOST:8765) and talk to this process instead of opening
+hms.db themselves (see client.py).
+
+Every call is `POST /api/<method>` with a JSON body `{"args": [...]}` and
+answers `{"result": ...}`. A successful check_credentials also answers a
+`"session"` token, and every later call must carry it in its body (except the
+PUBLIC_METHODS a desk needs before login); without one it gets 401. The call
+is scoped to the clinic of the user the token belongs to (get_user_clinic,
+see DatabaseManager.start_session), never to a clinic named by the client.
+Each method is only open to the roles in METHOD_ROLES, and arguments that name
+the acting user (SESSION_USER_ARGS) are taken from the session.
+`POST /api/end_session` drops the token. `GET /health` reports queue depth and
+batch stats.
+
+Logins are rate limited per client address and per phone number, and
+accounts lock after repeated wrong passwords (see login_limits.py). The other
+pre-login lookups (is_phone_registered, login_retry_after) share the
+per-address limit.
+
+Concurrency model:
+- Reads run on a pool of reader threads, each with its own SQLite connection
+  (WAL mode lets them read while the writer writes).
+- Writes go through a queue to a single writer thread (group_commit.py). Writes
+  that arrive close together are applied in one transaction with one commit
+  (group commit); each caller is answered only after that commit.
+
+Tokens travel in plain HTTP, so bind it to localhost or a trusted hospital
+network only.
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backup import BackupScheduler
+from maintenance import MaintenanceScheduler
+from db_manager import DatabaseManager
+from group_commit import GroupCommitWriter, WRITE_METHODS
+
+# Methods that only read. They run concurrently on the reader connections.
+READ_METHODS = {
+    "login_retry_after", "is_phone_registered",
+    "get_pending_registrations", "get_doctors", "get_doctor_workload",
+    "get_doctor_events", "get_last_seen_event", "get_clinics", "get_user_clinic",
+    "get_all_patients", "get_patients_page", "count_patients",
+    "get_patients_for_doctor", "get_all_users",
+    "get_patient_details", "get_patient_timeline", "search_patients",
+    "is_patient_archived", "find_duplicate_candidates", "find_patients_by_phone", "get_reports",
+}
+# Methods that write (group_commit.WRITE_METHODS) run on the single writer connection.
+# check_credentials is one of them: it counts wrong passwords (see login_limits.py).
+
+# Methods the login and registration screens call before there is a session. They run unscoped.
+PUBLIC_METHODS = {
+    "check_credentials", "login_retry_after", "is_phone_registered", "register_user", "get_clinics",
+}
+# Roles whose session may call each method (what their dashboard does); anything else gets 403
+ADMIN, DOCTOR, RECEPTIONIST = "admin", "doctor", "receptionist"
+ANY_ROLE = {ADMIN, DOCTOR, RECEPTIONIST}
+METHOD_ROLES = {
+    # Admin dashboard
+    "get_pending_registrations": {ADMIN}, "approve_registration": {ADMIN}, "deny_registration": {ADMIN},
+    "create_admin_user": {ADMIN}, "create_user_by_admin": {ADMIN}, "delete_user_by_admin": {ADMIN},
+    "get_all_users": {ADMIN}, "set_user_clinic": {ADMIN}, "create_clinic": {ADMIN},
+    "archive_patients": {ADMIN}, "refresh_reports": {ADMIN}, "get_reports": {ADMIN},
+    "get_all_patients": {ADMIN},
+    # The receptionist restores an archived patient by opening it from a search
+    "restore_patient": {ADMIN, RECEPTIONIST},
+    # Receptionist dashboard
+    "create_patient": {RECEPTIONIST}, "delete_patient": {RECEPTIONIST}, "update_patient": {RECEPTIONIST},
+    "assign_patient_to_doctor": {RECEPTIONIST}, "get_patients_page": {RECEPTIONIST},
+    "count_patients": {RECEPTIONIST}, "search_patients": {RECEPTIONIST},
+    "find_duplicate_candidates": {RECEPTIONIST}, "find_patients_by_phone": {RECEPTIONIST},
+    "is_patient_archived": {ADMIN, RECEPTIONIST},
+    # Doctor dashboard
+    "get_patients_for_doctor": {DOCTOR}, "update_patient_status_by_doctor": {DOCTOR},
+    "add_encounter": {DOCTOR}, "get_doctor_events": {DOCTOR}, "get_last_seen_event": {DOCTOR},
+    "mark_doctor_events_seen": {DOCTOR},
+    # Shared
+    "get_user_clinic": ANY_ROLE, "get_doctors": ANY_ROLE, "get_doctor_workload": ANY_ROLE,
+    "get_patient_details": {DOCTOR, RECEPTIONIST}, "get_patient_timeline": {DOCTOR, RECEPTIONIST},
+}
+# Position of the argument naming the acting user (admin, receptionist or doctor): always the session's user
+SESSION_USER_ARGS = {
+    "delete_user_by_admin": 1, "create_patient": 8, "add_encounter": 1, "get_patients_for_doctor": 0,
+    "get_doctor_events": 0, "get_last_seen_event": 0, "mark_doctor_events_seen": 0, "get_user_clinic": 0,
+}
+# Position of the workstation argument of the public methods that are rate limited per
+# client address (see login_limits.py): always the address, never a key the client picks
+WORKSTATION_ARGS = {"check_credentials": 2, "login_retry_after": 1, "is_phone_registered": 1}
+SESSION_IDLE_SECONDS = 12 * 3600 # A session token unused for this long has to log in again
+
+
+class HMSServer:
+    """Asyncio HTTP server wrapping a single writer and a pool of reader connections."""
+
+    def __init__(self, db_path="hms.db", readers=4, batch_max=64, batch_delay=0.0):
+        self.db_path = db_path
+        # Writer: one thread, one connection, created (and schema checked) up front
+        self.writer = GroupCommitWriter(db_path, batch_max=batch_max, batch_delay=batch_delay)
+
+        # Readers: each thread lazily opens its own connection
+        self.reader_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="hms-reader")
+        self._reader_local = threading.local()
+        self.sessions = {} # token -> {"user_id", "clinic_id", "last_used"}; only touched on the event loop
+        self.last_request = time.monotonic() # For idle-time maintenance (see maintenance.py)
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_request
+
+    def _reader_db(self):
+        db = getattr(self._reader_local, "db", None)
+        if db is None:
+            db = DatabaseManager(self.db_path, defer_schema=True)
+            self._reader_local.db = db
+        return db
+
+    def _run_read(self, method_name, args, clinic_id):
+        db = self._reader_db()
+        with db.scoped(clinic_id):
+            return getattr(db, method_name)(*args)
+
+    async def call(self, method_name, args, clinic_id=None):
+        """Runs one DatabaseManager method, scoped to clinic_id, through the reader pool or the writer queue."""
+        loop = asyncio.get_running_loop()
+        if method_name in READ_METHODS:
+            return await loop.run_in_executor(self.reader_executor, self._run_read, method_name, args, clinic_id)
+        return await asyncio.wrap_future(self.writer.submit(method_name, *args, clinic_id=clinic_id))
+
+    # --- Sessions ---
+
+    async def _start_session(self, user_id, role):
+        """Returns a new token for `user_id` (logged in as `role`), scoped to the user's clinic."""
+        token = secrets.token_urlsafe(32)
+        clinic_id = await self.call("get_user_clinic", [user_id])
+        self.sessions[token] = {"user_id": user_id, "role": role, "clinic_id": clinic_id,
+                                "last_used": time.monotonic()}
+        return token
+
+    def _session(self, token):
+        """Returns the live session of `token`, or None if it is unknown or expired."""
+        session = self.sessions.get(token) if isinstance(token, str) else None
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session["last_used"] > SESSION_IDLE_SECONDS:
+            del self.sessions[token]
+            return None
+        session["last_used"] = now
+        return session
+
+    async def _session_changes(self, method_name, args, result):
+        """Keeps open sessions in line with an admin's change to their user."""
+        if not result or not args:
+            return
+        user_id = args[0]
+        if method_name == "set_user_clinic":
+            clinic_id = await self.call("get_user_clinic", [user_id])
+            for session in self.sessions.values():
+                if session["user_id"] == user_id:
+                    session["clinic_id"] = clinic_id
+        elif method_name == "delete_user_by_admin":
+            for token in [t for t, session in self.sessions.items() if session["user_id"] == user_id]:
+                del self.sessions[token]
+
+    async def _dispatch(self, http_method, path, body, peer=None):
+        """Returns (status line, JSON payload) for one request from the client address `peer`."""
+        self.last_request = time.monotonic()
+        if http_method == "GET" and path == "/health":
+            return "200 OK", {
+                "status": "ok",
+                "queued_writes": self.writer.queued(),
+                "batches_committed": self.writer.batches_committed,
+                "writes_committed": self.writer.writes_committed,
+            }
+        if http_method != "POST" or not path.startswith("/api/"):
+            return "404 Not Found", {"error": "Unknown endpoint"}
+        method_name = path[len("/api/"):]
+        if method_name not in READ_METHODS and method_name not in WRITE_METHODS and method_name != "end_session":
+            return "404 Not Found", {"error": f"Unknown method '{method_name}'"}
+        try:
+            request = json.loads(body or b"{}")
+            args = request.get("args", [])
+            token = request.get("session")
+        except (ValueError, AttributeError):
+            return "400 Bad Request", {"error": "Body must be a JSON object"}
+        if not isinstance(args, list):
+            return "400 Bad Request", {"error": "'args' must be a list"}
+        if method_name == "end_session":
+            self.sessions.pop(token, None)
+            return "200 OK", {"result": True}
+        clinic_id = None
+        if method_name not in PUBLIC_METHODS:
+            session = self._session(token)
+            if session is None:
+                return "401 Unauthorized", {"error": "Not logged in (or the session has expired)"}
+            clinic_id = session["clinic_id"] # Never a clinic the client names itself
+            if session["role"] not in METHOD_ROLES.get(method_name, ()):
+                return "403 Forbidden", {"error": f"'{method_name}' is not allowed for role '{session['role']}'"}
+            position = SESSION_USER_ARGS.get(method_name)
+            if position is not None and len(args) > position:
+                args = args[:position] + [session["user_id"]] + args[position + 1:]
+        position = WORKSTATION_ARGS.get(method_name)
+        if position is not None:
+            args = args[:position] + [peer or "unknown"]
+        try:
+            result = await self.call(method_name, args, clinic_id)
+            if method_name == "check_credentials":
+                role, user_id = result
+                payload = {"result": result}
+                if role is not None:
+                    payload["session"] = await self._start_session(user_id, role)
+                return "200 OK", payload
+            await self._session_changes(method_name, args, result)
+            return "200 OK", {"result": result}
+        except TypeError as e: # Wrong number of arguments
+            return "400 Bad Request", {"error": str(e)}
+        except Exception as e: # Any other failure still gets an answer, and the connection stays usable
+            print(f"Error in {method_name}: {e!r}")
+            return "500 Internal Server Error", {"error": f"{type(e).__name__}: {e}"}
+
+    async def _handle_connection(self, reader, writer):
+        """Serves HTTP/1.1 requests (with keep-alive) on one client connection."""
+        peername = writer.get_extra_info("peername")
+        peer = peername[0] if peername else None
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                http_method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self._dispatch(http_method, path, body, peer)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass # Client went away or sent garbage
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"HMS server listening on http://{host}:{port} (database: {self.db_path})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the HMS database as a headless HTTP/JSON service.")
+    parser.add_argument("--db", default="hms.db", help="SQLite database file (default: hms.db)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--readers", type=int, default=4, help="Number of reader connections (default: 4)")
+    parser.add_argument("--backup-dir", help="Take online snapshots and archive changes here (see backup.py)")
+    parser.add_argument("--snapshot-hours", type=float, default=6, help="Hours between snapshots (default: 6)")
+    parser.add_argument("--maintenance-hours", type=float, default=24,
+                        help="Hours between idle-time VACUUM/ANALYZE runs, 0 to disable (default: 24)")
+    options = parser.parse_args()
+
+    hms_server = HMSServer(options.db, readers=options.readers)
+    backups = None
+    if options.backup_dir:
+        backups = BackupScheduler(options.db, options.backup_dir, snapshot_interval=options.snapshot_hours * 3600)
+        backups.start()
+    maintenance = None
+    if options.maintenance_hours > 0:
+        maintenance = MaintenanceScheduler(options.db, hms_server.idle_seconds,
+                                           interval=options.maintenance_hours * 3600, convert=True)
+        maintenance.start()
+    try:
+        asyncio.run(hms_server.serve(options.host, options.port))
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    finally:
+        if backups:
+            backups.stop()
+        if maintenance:
+            maintenance.stop()
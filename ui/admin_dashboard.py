@@ -2,10 +2,20 @@ from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
     QPushButton, QFormLayout, QTableWidget, 
     QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox,
-    QTabWidget, QGroupBox, QDialog, QDialogButtonBox, QComboBox
+    QTabWidget, QGroupBox, QDialog, QDialogButtonBox, QComboBox, QSpinBox, QInputDialog
 )
 from PyQt5.QtCore import pyqtSignal, Qt
 
+# Table columns: (header, field of the records.PendingUser / records.User row)
+PENDING_USER_COLUMNS = [
+    ("ID", "id"), ("Full Name", "full_name"), ("Phone", "phone"), ("Role", "role"), ("Registered At", "created_at"),
+]
+USER_COLUMNS = [
+    ("ID", "id"), ("Full Name", "full_name"), ("Phone", "phone"), ("Role", "role"),
+    ("Status", "status"), ("Created At", "created_at"), ("Clinic", "clinic_name"),
+]
+HOSPITAL_WIDE = "(whole hospital)" # Clinic choice for users who are not limited to one clinic
+
 class AdminDashboardWidget(QWidget):
     """Admin Dashboard UI."""
     logout_requested = pyqtSignal()
@@ -16,11 +26,16 @@ class AdminDashboardWidget(QWidget):
     create_admin = pyqtSignal(str, str, str)
     
     # --- NEW SIGNALS ---
-    add_user = pyqtSignal(str, str, str, str) # name, phone, password, role
+    add_user = pyqtSignal(str, str, str, str, str) # name, phone, password, role, clinic name ("" for none)
     remove_user = pyqtSignal(int) # user_id
+    set_user_clinic = pyqtSignal(int, str) # user_id, clinic name ("" for the whole hospital)
+    archive_records = pyqtSignal(int) # archive patients inactive for N days
+    refresh_reports = pyqtSignal()
+    users_sort_changed = pyqtSignal() # "All Users" header clicked (see users_sort())
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.clinic_names = [] # Offered by the clinic pickers (see load_clinics)
         
         layout = QVBoxLayout(self)
         self.tabs = QTabWidget()
@@ -31,7 +46,7 @@ class AdminDashboardWidget(QWidget):
         
         approve_label = QLabel("Pending User Registrations")
         approve_label.setStyleSheet("font-size: 16px; font-weight: bold;")
-        self.pending_table = self._create_table(["ID", "Full Name", "Phone", "Role", "Registered At"])
+        self.pending_table = self._create_table([header for header, _ in PENDING_USER_COLUMNS])
         
         approve_btn_layout = QHBoxLayout()
         self.approve_button = QPushButton("Approve Selected")
@@ -70,22 +85,81 @@ class AdminDashboardWidget(QWidget):
         manage_label = QLabel("All Users")
         manage_label.setStyleSheet("font-size: 16px; font-weight: bold;")
         
-        headers = ["ID", "Full Name", "Phone", "Role", "Status", "Created At"]
-        self.all_users_table = self._create_table(headers)
+        self.all_users_table = self._create_table([header for header, _ in USER_COLUMNS])
+        # Clicking a header re-sorts in the database (the table itself never sorts)
+        users_header = self.all_users_table.horizontalHeader()
+        users_header.setSectionsClickable(True)
+        users_header.setSortIndicatorShown(True)
+        users_header.setSortIndicator(0, Qt.AscendingOrder)
         
         manage_btn_layout = QHBoxLayout()
         self.add_user_button = QPushButton("Add New User")
         self.remove_user_button = QPushButton("Remove Selected User")
+        self.user_clinic_button = QPushButton("Set Clinic...")
         manage_btn_layout.addWidget(self.add_user_button)
         manage_btn_layout.addWidget(self.remove_user_button)
+        manage_btn_layout.addWidget(self.user_clinic_button)
         
         manage_layout.addWidget(manage_label)
         manage_layout.addWidget(self.all_users_table)
         manage_layout.addLayout(manage_btn_layout)
 
+        # --- Tab 4: Patient Records (archival) ---
+        self.records_tab = QWidget()
+        records_layout = QVBoxLayout(self.records_tab)
+        records_layout.setAlignment(Qt.AlignTop)
+
+        archive_box = QGroupBox("Archive Old Patient Records")
+        archive_box.setFixedWidth(400)
+        archive_form = QFormLayout()
+        archive_info = QLabel("Moves deleted patients, and patients not waiting on a doctor\n"
+                              "with no visit or status change for the given time, into the\n"
+                              "archive file. Archived patients can still be found with the\n"
+                              "receptionist's patient search.")
+        self.archive_days_input = QSpinBox()
+        self.archive_days_input.setRange(1, 3650)
+        self.archive_days_input.setValue(365)
+        self.archive_days_input.setSuffix(" days")
+        self.archive_button = QPushButton("Archive Now")
+        archive_form.addRow(archive_info)
+        archive_form.addRow(QLabel("Inactive for:"), self.archive_days_input)
+        archive_form.addRow(self.archive_button)
+        archive_box.setLayout(archive_form)
+        records_layout.addWidget(archive_box)
+
+        # --- Tab 5: Reports ---
+        self.reports_tab = QWidget()
+        reports_layout = QVBoxLayout(self.reports_tab)
+
+        reports_header = QHBoxLayout()
+        reports_label = QLabel("Hospital Statistics")
+        reports_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        self.reports_updated_label = QLabel("Not refreshed yet")
+        self.refresh_reports_button = QPushButton("Refresh Now")
+        reports_header.addWidget(reports_label)
+        reports_header.addStretch()
+        reports_header.addWidget(self.reports_updated_label)
+        reports_header.addWidget(self.refresh_reports_button)
+
+        self.daily_report_table = self._create_table(["Day", "New Patients", "New Users"])
+        self.doctor_report_table = self._create_table(["Doctor", "Pending", "Accepted", "Denied", "Acceptance Rate"])
+        self.blood_report_table = self._create_table(["Blood Type", "Patients"])
+        self.age_report_table = self._create_table(["Age", "Patients"])
+
+        report_tables = QHBoxLayout()
+        report_tables.addWidget(self._titled(QLabel("Registrations per Day"), self.daily_report_table))
+        report_tables.addWidget(self._titled(QLabel("Blood Types"), self.blood_report_table))
+        report_tables.addWidget(self._titled(QLabel("Age Groups"), self.age_report_table))
+
+        reports_layout.addLayout(reports_header)
+        reports_layout.addLayout(report_tables)
+        reports_layout.addWidget(self._titled(QLabel("Patients per Doctor (live)"), self.doctor_report_table))
+
         # --- Add all tabs ---
         self.tabs.addTab(self.approve_tab, "Approve Registrations")
         self.tabs.addTab(self.manage_users_tab, "Manage All Users")
+        self.tabs.addTab(self.reports_tab, "Reports")
+        self.tabs.addTab(self.records_tab, "Patient Records")
         self.tabs.addTab(self.create_admin_tab, "Create Admin (Legacy)")
 
         self.logout_button = QPushButton("Logout")
@@ -103,6 +177,10 @@ class AdminDashboardWidget(QWidget):
         # Connect new signals
         self.add_user_button.clicked.connect(self._show_add_user_dialog)
         self.remove_user_button.clicked.connect(self._emit_remove_user_signal)
+        self.user_clinic_button.clicked.connect(self._emit_set_clinic_signal)
+        self.archive_button.clicked.connect(self._emit_archive_signal)
+        self.refresh_reports_button.clicked.connect(self.refresh_reports.emit)
+        users_header.sortIndicatorChanged.connect(lambda *args: self.users_sort_changed.emit())
 
     def _create_table(self, headers):
         """Helper to create a standard table widget."""
@@ -114,6 +192,15 @@ class AdminDashboardWidget(QWidget):
         table.setSelectionMode(QAbstractItemView.SingleSelection)
         table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         return table
+
+    def _titled(self, title_label, widget):
+        """Helper to stack a small title above a widget."""
+        box = QWidget()
+        box_layout = QVBoxLayout(box)
+        box_layout.setContentsMargins(0, 0, 0, 0)
+        box_layout.addWidget(title_label)
+        box_layout.addWidget(widget)
+        return box
         
     def _emit_approve_signal(self):
         user_id = self._get_selected_table_id(self.pending_table)
@@ -143,46 +230,96 @@ class AdminDashboardWidget(QWidget):
                 self.remove_user.emit(user_id)
     
     def _show_add_user_dialog(self):
-        dialog = AddUserDialog(self)
+        dialog = AddUserDialog(self.clinic_names, self)
         if dialog.exec_():
-            name, phone, password, role = dialog.get_details()
+            name, phone, password, role, clinic = dialog.get_details()
             if not all([name, phone, password, role]):
                 QMessageBox.warning(self, "Error", "All fields are required.")
                 return
-            self.add_user.emit(name, phone, password, role)
+            self.add_user.emit(name, phone, password, role, clinic)
+
+    def _emit_set_clinic_signal(self):
+        user_id = self._get_selected_table_id(self.all_users_table)
+        if user_id:
+            # Typing a name that is not in the list creates that clinic
+            clinic, ok = QInputDialog.getItem(self, "Set Clinic", "Clinic (the user only sees its patients):",
+                                              [HOSPITAL_WIDE] + self.clinic_names, 0, True)
+            if ok:
+                clinic = clinic.strip()
+                self.set_user_clinic.emit(user_id, "" if clinic == HOSPITAL_WIDE else clinic)
+
+    def _emit_archive_signal(self):
+        days = self.archive_days_input.value()
+        confirm = QMessageBox.question(self, "Confirm Archive",
+            f"Archive deleted patients and finished patients older than {days} days?",
+            QMessageBox.Yes | QMessageBox.No)
+        if confirm == QMessageBox.Yes:
+            self.archive_records.emit(days)
 
     # --- END NEW METHODS ---
 
     def _get_selected_table_id(self, table):
-        """Gets the ID (stored in column 0) of the selected row."""
+        """Gets the ID of the selected row's user record."""
         selected_rows = table.selectionModel().selectedRows()
         if not selected_rows:
             QMessageBox.warning(self, "No Selection", "Please select a user from the table.")
             return None
         selected_row = selected_rows[0].row()
-        # ID is in the first column (index 0)
-        user_id_item = table.item(selected_row, 0)
-        return int(user_id_item.text())
+        # The row's record is stored on its first cell
+        return table.item(selected_row, 0).data(Qt.UserRole).id
+
+    def users_sort(self):
+        """Returns (sort_by, descending) for get_all_users()."""
+        header = self.all_users_table.horizontalHeader()
+        return USER_COLUMNS[header.sortIndicatorSection()][1], header.sortIndicatorOrder() == Qt.DescendingOrder
+
+    def _fill_record_table(self, table, records, columns):
+        """Fills a table from records, one column per (header, field) and the record on column 0."""
+        table.setRowCount(0) # Clear table
+        for row_num, record in enumerate(records):
+            table.insertRow(row_num)
+            for col_num, (_, field) in enumerate(columns):
+                value = getattr(record, field)
+                item = QTableWidgetItem(str(value) if value is not None else "")
+                if col_num == 0:
+                    item.setData(Qt.UserRole, record)
+                table.setItem(row_num, col_num, item)
+
+    def load_clinics(self, clinics):
+        """Sets the clinics (records.Clinic) offered when adding a user or setting a user's clinic."""
+        self.clinic_names = [clinic.name for clinic in clinics]
 
     def load_pending_registrations(self, users):
-        """Populates the pending users table."""
-        self.pending_table.setRowCount(0) # Clear table
-        for row_num, user_data in enumerate(users):
-            self.pending_table.insertRow(row_num)
-            # user_data = (id, full_name, phone, role)
-            for col_num, data in enumerate(user_data):
-                self.pending_table.setItem(row_num, col_num, QTableWidgetItem(str(data)))
+        """Populates the pending users table from records.PendingUser rows."""
+        self._fill_record_table(self.pending_table, users, PENDING_USER_COLUMNS)
     
     # --- NEW LOADER ---
     def load_all_users(self, users):
-        """Populates the all users table."""
-        self.all_users_table.setRowCount(0) # Clear table
-        for row_num, user_data in enumerate(users):
-            self.all_users_table.insertRow(row_num)
-            # user_data = (id, full_name, phone, role, status)
-            for col_num, data in enumerate(user_data):
-                self.all_users_table.setItem(row_num, col_num, QTableWidgetItem(str(data)))
+        """Populates the all users table from records.User rows."""
+        self._fill_record_table(self.all_users_table, users, USER_COLUMNS)
                 
+    def load_reports(self, report):
+        """Fills the Reports tab from the pre-aggregated rollups (see reports.read_report)."""
+        self._fill_table(self.daily_report_table, report["daily"])
+        self._fill_table(self.blood_report_table, report["blood_types"])
+        self._fill_table(self.age_report_table, report["age_bands"])
+        self.reports_updated_label.setText(f"Last updated: {report['refreshed_at'] or 'never'} (UTC)")
+
+    def load_doctor_workload(self, workload):
+        """Fills "Patients per Doctor" from records.DoctorWorkload rows (live counters, not a rollup)."""
+        self._fill_table(self.doctor_report_table, [
+            (doctor.full_name, doctor.pending, doctor.accepted, doctor.denied,
+             f"{doctor.accepted / (doctor.accepted + doctor.denied):.0%}" if doctor.accepted + doctor.denied else "N/A")
+            for doctor in workload
+        ])
+
+    def _fill_table(self, table, rows):
+        table.setRowCount(0) # Clear table
+        for row_num, row_data in enumerate(rows):
+            table.insertRow(row_num)
+            for col_num, data in enumerate(row_data):
+                table.setItem(row_num, col_num, QTableWidgetItem(str(data)))
+
     def clear_admin_form(self):
         self.admin_name_input.clear()
         self.admin_phone_input.clear()
@@ -192,7 +329,7 @@ class AdminDashboardWidget(QWidget):
 # --- NEW DIALOG CLASS ---
 class AddUserDialog(QDialog):
     """A dialog to add a new user."""
-    def __init__(self, parent=None):
+    def __init__(self, clinic_names=(), parent=None):
         super().__init__(parent)
         self.setWindowTitle("Add New User")
         
@@ -205,11 +342,16 @@ class AddUserDialog(QDialog):
         self.password_input.setEchoMode(QLineEdit.Password)
         self.role_input = QComboBox()
         self.role_input.addItems(["admin", "doctor", "receptionist"])
+        # Editable: typing a new name creates that clinic
+        self.clinic_input = QComboBox()
+        self.clinic_input.setEditable(True)
+        self.clinic_input.addItems([HOSPITAL_WIDE] + list(clinic_names))
         
         form_layout.addRow(QLabel("Full Name:"), self.name_input)
         form_layout.addRow(QLabel("Phone:"), self.phone_input)
         form_layout.addRow(QLabel("Password:"), self.password_input)
         form_layout.addRow(QLabel("Role:"), self.role_input)
+        form_layout.addRow(QLabel("Clinic:"), self.clinic_input)
         
         layout.addLayout(form_layout)
         
@@ -222,10 +364,12 @@ class AddUserDialog(QDialog):
         layout.addWidget(self.buttons)
 
     def get_details(self):
-        """Returns the details from the form."""
+        """Returns the details from the form (clinic "" for the whole hospital)."""
+        clinic = self.clinic_input.currentText().strip()
         return (
             self.name_input.text(),
             self.phone_input.text(),
             self.password_input.text(),
-            self.role_input.currentText()
+            self.role_input.currentText(),
+            "" if clinic == HOSPITAL_WIDE else clinic
         )
\ No newline at end of file
@@ -3,6 +3,7 @@ from PyQt5.QtWidgets import (
     QPushButton, QComboBox, QFormLayout, QGroupBox
 )
 from PyQt5.QtCore import pyqtSignal, Qt
+from ui.field_checks import FieldCheck
 
 class LoginWidget(QWidget):
     """Login Page UI."""
@@ -54,7 +55,7 @@ class LoginWidget(QWidget):
 
 class RegisterWidget(QWidget):
     """Registration Page UI."""
-    registration_submitted = pyqtSignal(str, str, str, str)
+    registration_submitted = pyqtSignal(str, str, str, str, str) # ..., role, clinic name ("" for none)
     back_to_login = pyqtSignal()
 
     def __init__(self, *args, **kwargs):
@@ -74,12 +75,18 @@ class RegisterWidget(QWidget):
         self.confirm_password_input.setEchoMode(QLineEdit.Password)
         self.role_input = QComboBox()
         self.role_input.addItems(["doctor", "receptionist"])
+        self.clinic_input = QComboBox() # Filled by set_clinics()
 
         form_layout.addRow(QLabel("Full Name:"), self.full_name_input)
         form_layout.addRow(QLabel("Phone:"), self.phone_input)
+        # "Already registered" shows up while typing, before the form is submitted
+        self.phone_status = QLabel()
+        self.phone_check = FieldCheck(self.phone_input, self.phone_status)
+        form_layout.addRow(self.phone_status)
         form_layout.addRow(QLabel("Password:"), self.password_input)
         form_layout.addRow(QLabel("Confirm Password:"), self.confirm_password_input)
         form_layout.addRow(QLabel("Role:"), self.role_input)
+        form_layout.addRow(QLabel("Clinic:"), self.clinic_input)
 
         self.submit_button = QPushButton("Submit Registration")
         self.back_button = QPushButton("Back to Login")
@@ -107,12 +114,19 @@ class RegisterWidget(QWidget):
             self.full_name_input.text(),
             self.phone_input.text(),
             self.password_input.text(),
-            self.role_input.currentText()
+            self.role_input.currentText(),
+            self.clinic_input.currentText() if self.clinic_input.currentIndex() > 0 else ""
         )
 
+    def set_clinics(self, clinic_names):
+        """Offers the hospital's clinics; the first entry means no particular clinic."""
+        self.clinic_input.clear()
+        self.clinic_input.addItems(["(whole hospital)"] + list(clinic_names))
+
     def clear_fields(self):
         self.full_name_input.clear()
         self.phone_input.clear()
+        self.phone_check.reset()
         self.password_input.clear()
         self.confirm_password_input.clear()
         
@@ -1,21 +1,39 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-    QPushButton, QTableWidget, 
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
+    QPushButton, QTableWidget, QFormLayout, QGroupBox, QTextEdit,
     QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox,
     QTabWidget
 )
 from PyQt5.QtCore import pyqtSignal, Qt
+from ui.patient_history import PatientHistoryWidget
+
+# Columns of both patient tables: (header, field of records.Patient)
+PATIENT_COLUMNS = [
+    ("ID", "id"), ("Full Name", "full_name"), ("Date of Birth", "date_of_birth"), ("Age", "age"),
+    ("Gender", "gender"), ("Contact Phone", "contact_phone"), ("Problem", "problem"),
+    ("Status", "doctor_status"), ("Created At", "created_at"), ("Blood Type", "blood_type"),
+]
 
 class DoctorDashboardWidget(QWidget):
     """Doctor Dashboard UI."""
     logout_requested = pyqtSignal()
     update_patient_status = pyqtSignal(int, str) # patient_id, status ("accepted" or "denied")
+    history_requested = pyqtSignal(int) # patient_id
+    add_encounter = pyqtSignal(int, str, str) # patient_id, diagnosis, notes
+    sort_changed = pyqtSignal() # a table header was clicked (see patient_sort())
+    events_seen = pyqtSignal(int) # id of the newest notification the doctor has now seen
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.history_patient_id = None # Patient shown on the history tab
+        self.unseen_events = [] # records.DoctorEvent not looked at yet (badge on the Pending tab)
         
         layout = QVBoxLayout(self)
         self.tabs = QTabWidget()
+
+        # Live patient counts (see load_workload)
+        self.workload_label = QLabel()
+        self.workload_label.setStyleSheet("font-size: 14px;")
         
         # --- Create Pending Tab ---
         self.pending_tab = QWidget()
@@ -24,7 +42,7 @@ class DoctorDashboardWidget(QWidget):
         pending_label = QLabel("Patients Awaiting Your Approval")
         pending_label.setStyleSheet("font-size: 16px; font-weight: bold;")
         
-        headers = ["ID", "Full Name", "Date of Birth", "Gender", "Contact Phone", "Problem", "Status", "Created At", "Blood Type"]
+        headers = [header for header, _ in PATIENT_COLUMNS]
         self.pending_table = self._create_table(headers)
         
         pending_btn_layout = QHBoxLayout()
@@ -32,6 +50,8 @@ class DoctorDashboardWidget(QWidget):
         self.deny_pending_button = QPushButton("Deny Selected")
         pending_btn_layout.addWidget(self.accept_pending_button)
         pending_btn_layout.addWidget(self.deny_pending_button)
+        self.pending_history_button = QPushButton("View History")
+        pending_btn_layout.addWidget(self.pending_history_button)
         
         pending_layout.addWidget(pending_label)
         pending_layout.addWidget(self.pending_table)
@@ -54,18 +74,45 @@ class DoctorDashboardWidget(QWidget):
         self.deny_accepted_button = QPushButton("Deny Selected")
         accepted_btn_layout.addWidget(self.accept_accepted_button)
         accepted_btn_layout.addWidget(self.deny_accepted_button)
+        self.accepted_history_button = QPushButton("View History")
+        accepted_btn_layout.addWidget(self.accepted_history_button)
         
         accepted_layout.addWidget(accepted_label)
         accepted_layout.addWidget(self.accepted_table)
         accepted_layout.addLayout(accepted_btn_layout)
 
+        # --- Create History Tab ---
+        self.history_tab = QWidget()
+        history_layout = QVBoxLayout(self.history_tab)
+
+        self.history_label = QLabel("Select a patient and click \"View History\"")
+        self.history_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        self.history_widget = PatientHistoryWidget()
+
+        visit_box = QGroupBox("Record a Visit")
+        visit_form = QFormLayout()
+        self.diagnosis_input = QLineEdit()
+        self.notes_input = QTextEdit()
+        self.notes_input.setFixedHeight(60)
+        self.add_visit_button = QPushButton("Save Visit")
+        visit_form.addRow(QLabel("Diagnosis:"), self.diagnosis_input)
+        visit_form.addRow(QLabel("Notes:"), self.notes_input)
+        visit_form.addRow(self.add_visit_button)
+        visit_box.setLayout(visit_form)
+
+        history_layout.addWidget(self.history_label)
+        history_layout.addWidget(self.history_widget)
+        history_layout.addWidget(visit_box)
+
         # --- Add tabs ---
         self.tabs.addTab(self.pending_tab, "Pending Patients")
         self.tabs.addTab(self.accepted_tab, "Accepted Patients")
+        self.tabs.addTab(self.history_tab, "Patient History")
         
         self.logout_button = QPushButton("Logout")
         self.logout_button.setFixedWidth(100)
         
+        layout.addWidget(self.workload_label)
         layout.addWidget(self.tabs)
         layout.addWidget(self.logout_button, alignment=Qt.AlignRight)
 
@@ -80,6 +127,23 @@ class DoctorDashboardWidget(QWidget):
         self.accept_accepted_button.clicked.connect(lambda: self._emit_update_status("accepted", self.accepted_table))
         self.deny_accepted_button.clicked.connect(lambda: self._emit_update_status("denied", self.accepted_table))
 
+        # Opening the Pending tab, or clicking in it, counts as seeing the new assignments
+        self.tabs.currentChanged.connect(self._tab_changed)
+        self.pending_table.clicked.connect(self.mark_events_seen)
+
+        # History buttons
+        self.pending_history_button.clicked.connect(lambda: self._emit_history_request(self.pending_table))
+        self.accepted_history_button.clicked.connect(lambda: self._emit_history_request(self.accepted_table))
+        self.add_visit_button.clicked.connect(self._emit_add_encounter)
+
+        # Clicking a header re-sorts in the database; both tables share one sort
+        for table in (self.pending_table, self.accepted_table):
+            header = table.horizontalHeader()
+            header.setSectionsClickable(True)
+            header.setSortIndicatorShown(True)
+            header.setSortIndicator(0, Qt.AscendingOrder)
+            header.sortIndicatorChanged.connect(self._sort_indicator_changed)
+
     def _create_table(self, headers):
         """Helper to create a standard table widget."""
         table = QTableWidget()
@@ -91,52 +155,125 @@ class DoctorDashboardWidget(QWidget):
         table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         return table
 
+    def _sort_indicator_changed(self, section, order):
+        # Mirror the sort onto the other table without triggering a second query
+        for table in (self.pending_table, self.accepted_table):
+            header = table.horizontalHeader()
+            header.blockSignals(True)
+            header.setSortIndicator(section, order)
+            header.blockSignals(False)
+        self.sort_changed.emit()
+
+    def patient_sort(self):
+        """Returns (sort_by, descending) for get_patients_for_doctor()."""
+        header = self.pending_table.horizontalHeader()
+        return PATIENT_COLUMNS[header.sortIndicatorSection()][1], header.sortIndicatorOrder() == Qt.DescendingOrder
+
+    # --- Notification badge ---
+
+    def _tab_changed(self, index):
+        if self.tabs.widget(index) is self.pending_tab:
+            self.mark_events_seen()
+
+    def add_unseen_events(self, events):
+        """Adds records.DoctorEvent rows to the badge on the Pending tab."""
+        self.unseen_events.extend(events)
+        new_patients = sum(1 for event in self.unseen_events if event.kind == 'assigned')
+        title = "Pending Patients"
+        self.tabs.setTabText(self.tabs.indexOf(self.pending_tab), f"{title} ({new_patients} new)" if new_patients else title)
+
+    def mark_events_seen(self):
+        """Clears the badge and reports the newest event as seen."""
+        if self.unseen_events:
+            newest_id = self.unseen_events[-1].id
+            self.reset_inbox()
+            self.events_seen.emit(newest_id)
+
+    def reset_inbox(self):
+        self.unseen_events = []
+        self.tabs.setTabText(self.tabs.indexOf(self.pending_tab), "Pending Patients")
+
     def _emit_update_status(self, status, table_widget):
         """Helper to emit the update signal from the correct table."""
-        patient_id = self._get_selected_patient_id(table_widget)
-        if patient_id:
+        patient = self._get_selected_patient(table_widget)
+        if patient:
             # Check if status is already set
-            current_status = table_widget.item(table_widget.currentRow(), 5).text()
-            if current_status == status:
+            if patient.doctor_status == status:
                 QMessageBox.information(self, "Status", f"Patient is already {status}.")
                 return
-            self.update_patient_status.emit(patient_id, status)
+            self.update_patient_status.emit(patient.id, status)
             
-    def _get_selected_patient_id(self, table_widget):
-        """Gets the patient ID from the currently selected row of the given table."""
+    def _emit_history_request(self, table_widget):
+        """Switches to the history tab for the selected patient."""
+        patient = self._get_selected_patient(table_widget)
+        if patient:
+            self.history_patient_id = patient.id
+            self.history_label.setText(f"Visit History: {patient.full_name}")
+            self.history_widget.clear()
+            self.tabs.setCurrentWidget(self.history_tab)
+            self.history_requested.emit(patient.id)
+
+    def _emit_add_encounter(self):
+        if self.history_patient_id is None:
+            QMessageBox.warning(self, "No Patient", "Please open a patient's history first.")
+            return
+        diagnosis = self.diagnosis_input.text().strip()
+        if not diagnosis:
+            QMessageBox.warning(self, "Error", "Please enter a diagnosis.")
+            return
+        self.add_encounter.emit(self.history_patient_id, diagnosis, self.notes_input.toPlainText())
+
+    def reset_history(self):
+        """Clears the history tab (e.g. on logout)."""
+        self.history_patient_id = None
+        self.history_label.setText("Select a patient and click \"View History\"")
+        self.history_widget.clear()
+        self.clear_visit_form()
+
+    def clear_visit_form(self):
+        self.diagnosis_input.clear()
+        self.notes_input.clear()
+
+    def _get_selected_patient(self, table_widget):
+        """Returns the Patient record of the selected row of the given table."""
         selected_rows = table_widget.selectionModel().selectedRows()
         if not selected_rows:
             QMessageBox.warning(self, "No Selection", "Please select a patient from the table.")
             return None
         selected_row = selected_rows[0].row()
-        patient_id_item = table_widget.item(selected_row, 0)
-        return int(patient_id_item.text())
+        # The row's record is stored on its first cell
+        return table_widget.item(selected_row, 0).data(Qt.UserRole)
+
+    def _append_patient_row(self, table_widget, patient):
+        row_num = table_widget.rowCount()
+        table_widget.insertRow(row_num)
+        for col_num, (_, field) in enumerate(PATIENT_COLUMNS):
+            value = getattr(patient, field)
+            item = QTableWidgetItem(str(value) if value is not None else "N/A")
+            if col_num == 0:
+                item.setData(Qt.UserRole, patient)
+            table_widget.setItem(row_num, col_num, item)
+
+    def load_workload(self, workload):
+        """Shows the doctor's patient counts (a records.DoctorWorkload, or None if unknown)."""
+        if workload is None:
+            self.workload_label.clear()
+            return
+        self.workload_label.setText(
+            f"Pending: {workload.pending}    Accepted: {workload.accepted}    Denied: {workload.denied}")
 
     def load_assigned_patients(self, patients):
         """
-        Populates both patient tables by sorting the full list of patients.
+        Populates both patient tables by splitting the list of patients
+        (records.Patient, already sorted by the database) by their status.
         """
         # Clear both tables
         self.pending_table.setRowCount(0)
         self.accepted_table.setRowCount(0)
         
-        pending_row = 0
-        accepted_row = 0
-        
-        for patient_data in patients:
-            # patient_data = (id, full_name, age, gender, problem, doctor_status)
-            status = patient_data[6]
-            
-            if status == 'pending':
-                self.pending_table.insertRow(pending_row)
-                for col_num, data in enumerate(patient_data):
-                    self.pending_table.setItem(pending_row, col_num, QTableWidgetItem(str(data)))
-                pending_row += 1
-                
-            elif status == 'accepted':
-                self.accepted_table.insertRow(accepted_row)
-                for col_num, data in enumerate(patient_data):
-                    self.accepted_table.setItem(accepted_row, col_num, QTableWidgetItem(str(data)))
-                accepted_row += 1
-            
-            # Patients with 'denied' status are not shown in either table
\ No newline at end of file
+        for patient in patients:
+            if patient.doctor_status == 'pending':
+                self._append_patient_row(self.pending_table, patient)
+            elif patient.doctor_status == 'accepted':
+                self._append_patient_row(self.accepted_table, patient)
+            # Patients with 'denied' status are not shown in either table
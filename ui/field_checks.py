@@ -0,0 +1,54 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+DEBOUNCE_MS = 350 # Pause in typing before a field is looked up
+
+
+class FieldCheck(QObject):
+    """
+    As-you-type check of one QLineEdit, with its answer shown in a QLabel.
+
+    Once the user has stopped typing for DEBOUNCE_MS, a complete value (one
+    the field's validator accepts) is handed out through lookup_requested.
+    MainWindow looks it up in the background (background_lookups.py) and
+    calls show_result(); typing again emits text_edited so the lookup still
+    in flight can be cancelled, and an answer for older text is ignored.
+    """
+    lookup_requested = pyqtSignal(str) # the value to look up
+    text_edited = pyqtSignal() # the pending lookup (if any) is now out of date
+
+    def __init__(self, line_edit, status_label, parent=None):
+        super().__init__(parent or line_edit)
+        self.line_edit = line_edit
+        self.status_label = status_label
+        self.status_label.setWordWrap(True)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self._settled)
+        line_edit.textEdited.connect(self._edited)
+
+    def _edited(self, text):
+        self.status_label.clear()
+        self.text_edited.emit()
+        self.timer.start() # Restarts the wait on every keystroke
+
+    def _settled(self):
+        text = self.line_edit.text().strip()
+        if text and self.line_edit.hasAcceptableInput():
+            self.lookup_requested.emit(text)
+
+    def check_now(self):
+        """Looks up the current value straight away (e.g. a form opened pre-filled)."""
+        self.timer.stop()
+        self._settled()
+
+    def show_result(self, text, message, ok):
+        """Shows the answer for `text`, unless the field has changed since it was asked."""
+        if text != self.line_edit.text().strip():
+            return
+        self.status_label.setText(message)
+        self.status_label.setStyleSheet("color: green;" if ok else "color: #c0392b;")
+
+    def reset(self):
+        self.timer.stop()
+        self.status_label.clear()
@@ -0,0 +1,54 @@
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QPushButton, QTableWidget,
+    QTableWidgetItem, QHeaderView, QAbstractItemView
+)
+from PyQt5.QtCore import pyqtSignal
+
+class PatientHistoryWidget(QWidget):
+    """
+    Shows a patient's visit history (newest first), one page at a time.
+    The owner fetches pages from the database and feeds them in with append_page().
+    """
+    load_more_requested = pyqtSignal()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_row_cursor = None # (visit_date, encounter_id) of the last row shown
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.history_table = QTableWidget()
+        headers = ["Visit Date", "Doctor", "Diagnosis", "Notes"]
+        self.history_table.setColumnCount(len(headers))
+        self.history_table.setHorizontalHeaderLabels(headers)
+        self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.history_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self.load_more_button = QPushButton("Load Older Visits")
+        self.load_more_button.setEnabled(False)
+
+        layout.addWidget(self.history_table)
+        layout.addWidget(self.load_more_button)
+
+        self.load_more_button.clicked.connect(self.load_more_requested.emit)
+
+    def clear(self):
+        self.history_table.setRowCount(0)
+        self.last_row_cursor = None
+        self.load_more_button.setEnabled(False)
+
+    def append_page(self, encounters, has_more):
+        """
+        Appends one page of encounters below the rows already shown.
+        encounters = [records.Encounter, ...]
+        """
+        for encounter in encounters:
+            row_num = self.history_table.rowCount()
+            self.history_table.insertRow(row_num)
+            values = (encounter.visit_date, encounter.doctor_name or "N/A", encounter.diagnosis or "", encounter.notes or "")
+            for col_num, value in enumerate(values):
+                self.history_table.setItem(row_num, col_num, QTableWidgetItem(str(value)))
+            self.last_row_cursor = (encounter.visit_date, encounter.id)
+        self.load_more_button.setEnabled(has_more)
@@ -3,11 +3,23 @@ from PyQt5.QtWidgets import (
     QPushButton, QComboBox, QFormLayout, QTableWidget, 
     QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox,
     QTabWidget, QGroupBox, QDialog, QDialogButtonBox,
-    QDateEdit, QTextEdit
+    QDateEdit, QTextEdit, QCheckBox
 )
 from PyQt5.QtCore import pyqtSignal, Qt, QRegExp, QDate
 from PyQt5.QtGui import QRegExpValidator
-from datetime import datetime
+from ui.patient_history import PatientHistoryWidget
+from ui.field_checks import FieldCheck
+from records import PatientDetails, age_on
+from reports import AGE_BANDS
+
+# Columns of the "All Patients" table: (header, field of records.PatientSummary)
+PATIENT_COLUMNS = [
+    ("ID", "id"), ("Full Name", "full_name"), ("Date of Birth", "date_of_birth"), ("Age", "age"),
+    ("Contact Phone", "contact_phone"), ("Problem", "problem"), ("Assigned Doctor", "doctor_name"),
+    ("Doctor Status", "doctor_status"), ("Created At", "created_at"), ("Blood Type", "blood_type"),
+]
+PATIENT_PAGE_SIZE = 50 # Rows fetched per page of the "All Patients" table
+BLOOD_TYPES = ["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"]
 
 class ReceptionistDashboardWidget(QWidget):
     """Receptionist Dashboard UI."""
@@ -16,10 +28,13 @@ class ReceptionistDashboardWidget(QWidget):
     delete_patient = pyqtSignal(int) # patient_id
     assign_patient = pyqtSignal(int, int) # patient_id, doctor_id
     edit_patient_requested = pyqtSignal(int) # patient_id
+    search_patients = pyqtSignal(str) # search term ("" clears the search)
+    patient_query_changed = pyqtSignal() # sort, filters or page changed (see patient_query())
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.doctors_list = [] # To store (id, name) tuples
+        self.doctors_list = [] # records.DoctorWorkload
+        self.patient_page = 0 # Current page of the "All Patients" table
         
         layout = QVBoxLayout(self)
         self.tabs = QTabWidget()
@@ -70,10 +85,14 @@ class ReceptionistDashboardWidget(QWidget):
         self.patient_phone_input.setMaxLength(10) # Physically limit to 10 chars
         self.patient_phone_input.setPlaceholderText("Enter 10-digit number")
         patient_form.addRow(QLabel("Contact Phone:"), self.patient_phone_input)
+        # Patients already on file with this number, found while typing
+        self.patient_phone_status = QLabel()
+        self.patient_phone_check = FieldCheck(self.patient_phone_input, self.patient_phone_status)
+        patient_form.addRow(self.patient_phone_status)
 
         # 6. Blood Type
         self.patient_blood_type_input = QComboBox()
-        self.patient_blood_type_input.addItems(["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"])
+        self.patient_blood_type_input.addItems(BLOOD_TYPES)
         patient_form.addRow(QLabel("Blood Type:"), self.patient_blood_type_input)
 
         # 7. Address
@@ -97,9 +116,64 @@ class ReceptionistDashboardWidget(QWidget):
         manage_label = QLabel("All Patients")
         manage_label.setStyleSheet("font-size: 16px; font-weight: bold;")
         
-        # Update headers
-        headers = ["ID", "Full Name", "Date of Birth", "Contact Phone", "Problem", "Assigned Doctor", "Doctor Status", "Created At", "Blood Type"]
+        headers = [header for header, _ in PATIENT_COLUMNS]
         self.all_patients_table = self._create_table(headers)
+        # Clicking a header re-sorts in the database (the table itself never sorts)
+        patients_header = self.all_patients_table.horizontalHeader()
+        patients_header.setSectionsClickable(True)
+        patients_header.setSortIndicatorShown(True)
+        patients_header.setSortIndicator(0, Qt.AscendingOrder)
+
+        # Filters (applied in the database, together with the sort and the page)
+        filter_layout = QHBoxLayout()
+        self.doctor_filter = QComboBox()
+        self.doctor_filter.addItem("All Doctors", None)
+        self.status_filter = QComboBox()
+        self.status_filter.addItem("All Statuses", None)
+        for status in ("pending", "accepted", "denied"):
+            self.status_filter.addItem(status.capitalize(), status)
+        self.blood_type_filter = QComboBox()
+        self.blood_type_filter.addItem("All Blood Types", None)
+        for blood_type in BLOOD_TYPES:
+            self.blood_type_filter.addItem(blood_type, blood_type)
+        self.age_filter = QComboBox()
+        self.age_filter.addItem("All Ages", None)
+        for band, youngest, oldest in AGE_BANDS:
+            self.age_filter.addItem(band, (youngest, oldest))
+        self.date_filter_check = QCheckBox("Created from")
+        self.created_from_filter = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.created_to_filter = QDateEdit(QDate.currentDate())
+        for date_edit in (self.created_from_filter, self.created_to_filter):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            date_edit.setEnabled(False)
+        filter_layout.addWidget(self.doctor_filter)
+        filter_layout.addWidget(self.status_filter)
+        filter_layout.addWidget(self.blood_type_filter)
+        filter_layout.addWidget(self.age_filter)
+        filter_layout.addWidget(self.date_filter_check)
+        filter_layout.addWidget(self.created_from_filter)
+        filter_layout.addWidget(QLabel("to"))
+        filter_layout.addWidget(self.created_to_filter)
+
+        # Paging
+        page_layout = QHBoxLayout()
+        self.previous_page_button = QPushButton("< Previous")
+        self.next_page_button = QPushButton("Next >")
+        self.page_label = QLabel("")
+        page_layout.addWidget(self.previous_page_button)
+        page_layout.addWidget(self.page_label, alignment=Qt.AlignCenter)
+        page_layout.addWidget(self.next_page_button)
+
+        # Search (also looks in the archive when nothing current matches)
+        search_layout = QHBoxLayout()
+        self.patient_search_input = QLineEdit()
+        self.patient_search_input.setPlaceholderText("Search by ID, name or phone (includes archived records)")
+        self.patient_search_button = QPushButton("Search")
+        self.clear_search_button = QPushButton("Clear")
+        search_layout.addWidget(self.patient_search_input)
+        search_layout.addWidget(self.patient_search_button)
+        search_layout.addWidget(self.clear_search_button)
         
         manage_btn_layout = QHBoxLayout()
         self.assign_patient_button = QPushButton("Assign Selected Patient")
@@ -110,7 +184,10 @@ class ReceptionistDashboardWidget(QWidget):
         manage_btn_layout.addWidget(self.delete_patient_button)
         
         manage_layout.addWidget(manage_label)
+        manage_layout.addLayout(search_layout)
+        manage_layout.addLayout(filter_layout)
         manage_layout.addWidget(self.all_patients_table)
+        manage_layout.addLayout(page_layout)
         manage_layout.addLayout(manage_btn_layout)
 
         self.tabs.addTab(self.create_patient_tab, "Create Patient")
@@ -128,6 +205,19 @@ class ReceptionistDashboardWidget(QWidget):
         self.delete_patient_button.clicked.connect(self._emit_delete_patient)
         self.assign_patient_button.clicked.connect(self._show_assign_dialog)
         self.edit_patient_button.clicked.connect(self._emit_edit_request)
+        self.patient_search_button.clicked.connect(self._emit_search)
+        self.patient_search_input.returnPressed.connect(self._emit_search)
+        self.clear_search_button.clicked.connect(self._clear_search)
+        patients_header.sortIndicatorChanged.connect(self._query_changed)
+        for combo in (self.doctor_filter, self.status_filter, self.blood_type_filter, self.age_filter):
+            combo.currentIndexChanged.connect(self._query_changed)
+        self.date_filter_check.toggled.connect(self.created_from_filter.setEnabled)
+        self.date_filter_check.toggled.connect(self.created_to_filter.setEnabled)
+        self.date_filter_check.toggled.connect(self._query_changed)
+        self.created_from_filter.dateChanged.connect(self._date_filter_changed)
+        self.created_to_filter.dateChanged.connect(self._date_filter_changed)
+        self.previous_page_button.clicked.connect(lambda: self._change_page(-1))
+        self.next_page_button.clicked.connect(lambda: self._change_page(1))
         
     def _create_table(self, headers):
         """Helper to create a standard table widget."""
@@ -168,6 +258,57 @@ class ReceptionistDashboardWidget(QWidget):
             self.patient_blood_type_input.currentText()
         )
         
+    def _emit_search(self):
+        self.search_patients.emit(self.patient_search_input.text().strip())
+
+    def _clear_search(self):
+        self.patient_search_input.clear()
+        self.search_patients.emit("")
+
+    def _query_changed(self, *args):
+        """A new sort or filter starts again from the first page."""
+        self.patient_page = 0
+        self.patient_query_changed.emit()
+
+    def _date_filter_changed(self, *args):
+        if self.date_filter_check.isChecked():
+            self._query_changed()
+
+    def _change_page(self, step):
+        self.patient_page = max(0, self.patient_page + step)
+        self.patient_query_changed.emit()
+
+    def patient_query(self):
+        """Returns the current sort, filters and page as get_patients_page() keyword arguments."""
+        filters = {
+            "doctor_id": self.doctor_filter.currentData(),
+            "status": self.status_filter.currentData(),
+            "blood_type": self.blood_type_filter.currentData(),
+        }
+        if self.age_filter.currentData():
+            filters["age_min"], filters["age_max"] = self.age_filter.currentData()
+        if self.date_filter_check.isChecked():
+            filters["created_from"] = self.created_from_filter.date().toString("yyyy-MM-dd")
+            filters["created_to"] = self.created_to_filter.date().toString("yyyy-MM-dd")
+        header = self.all_patients_table.horizontalHeader()
+        return {
+            "filters": filters,
+            "sort_by": PATIENT_COLUMNS[header.sortIndicatorSection()][1],
+            "descending": header.sortIndicatorOrder() == Qt.DescendingOrder,
+            "limit": PATIENT_PAGE_SIZE,
+            "offset": self.patient_page * PATIENT_PAGE_SIZE,
+        }
+
+    def reset_patient_query(self):
+        """Clears the sort, filters and page (e.g. on logout) without emitting anything."""
+        self.blockSignals(True)
+        for combo in (self.doctor_filter, self.status_filter, self.blood_type_filter, self.age_filter):
+            combo.setCurrentIndex(0)
+        self.date_filter_check.setChecked(False)
+        self.all_patients_table.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+        self.patient_page = 0
+        self.blockSignals(False)
+
     def _emit_edit_request(self):
         """Gets the selected patient ID and emits a signal."""
         patient_id = self._get_selected_patient_id()
@@ -180,18 +321,13 @@ class ReceptionistDashboardWidget(QWidget):
             QMessageBox.warning(self, "No Selection", "Please select a patient from the table.")
             return None
         selected_row = selected_rows[0].row()
-        patient_id_item = self.all_patients_table.item(selected_row, 0)
-        return int(patient_id_item.text())
+        # The row's PatientSummary record is stored on its first cell
+        return self.all_patients_table.item(selected_row, 0).data(Qt.UserRole).id
     
     # --- ADD THIS NEW FUNCTION ---
     def _update_age_label(self):
-        """Calculates and updates the age label based on the DOB input."""
-        dob_qdate = self.patient_dob_input.date()
-        dob = dob_qdate.toPyDate()
-        today = datetime.now().date()
-        
-        age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-        
+        """Shows the age for the DOB being typed (saved patients get theirs from the database)."""
+        age = age_on(self.patient_dob_input.date().toString("yyyy-MM-dd"))
         self.age_label.setText(f"Age: {age}")
     # --- END OF NEW FUNCTION ---
         
@@ -216,25 +352,51 @@ class ReceptionistDashboardWidget(QWidget):
             if doctor_id:
                 self.assign_patient.emit(patient_id, doctor_id)
 
-    def load_all_patients(self, patients):
-        """Populates the 'all patients' table."""
+    def load_all_patients(self, patients, total=None):
+        """
+        Populates the 'all patients' table from records.PatientSummary rows.
+        `total` is the number of matching patients when showing one page of the
+        list; search results (total=None) are shown without paging.
+        """
+        paged = total is not None
+        for widget in (self.previous_page_button, self.next_page_button, self.page_label):
+            widget.setVisible(paged)
+        if paged:
+            pages = max(1, (total + PATIENT_PAGE_SIZE - 1) // PATIENT_PAGE_SIZE)
+            self.page_label.setText(f"Page {self.patient_page + 1} of {pages} ({total} patients)")
+            self.previous_page_button.setEnabled(self.patient_page > 0)
+            self.next_page_button.setEnabled(self.patient_page + 1 < pages)
+
         self.all_patients_table.setRowCount(0) # Clear table
-        for row_num, patient_data in enumerate(patients):
+        for row_num, patient in enumerate(patients):
             self.all_patients_table.insertRow(row_num)
-            # data = (id, name, age, problem, doctor_name, doctor_status)
-            for col_num, data in enumerate(patient_data):
+            for col_num, (_, field) in enumerate(PATIENT_COLUMNS):
+                value = getattr(patient, field)
                 # Handle None (for unassigned doctor)
-                item_text = str(data) if data is not None else "N/A"
-                self.all_patients_table.setItem(row_num, col_num, QTableWidgetItem(item_text))
+                item = QTableWidgetItem(str(value) if value is not None else "N/A")
+                if col_num == 0:
+                    item.setData(Qt.UserRole, patient)
+                self.all_patients_table.setItem(row_num, col_num, item)
                 
     def set_doctors_list(self, doctors):
-        # doctors is a list of (id, name) tuples
+        # doctors is a list of records.DoctorWorkload (active doctors with their patient counts)
         self.doctors_list = doctors
+        # Refill the doctor filter, keeping the current choice (no re-query)
+        selected_id = self.doctor_filter.currentData()
+        self.doctor_filter.blockSignals(True)
+        self.doctor_filter.clear()
+        self.doctor_filter.addItem("All Doctors", None)
+        for doctor in doctors:
+            self.doctor_filter.addItem(doctor.full_name, doctor.id)
+        index = self.doctor_filter.findData(selected_id)
+        self.doctor_filter.setCurrentIndex(max(index, 0))
+        self.doctor_filter.blockSignals(False)
         
     def clear_patient_form(self):
         self.patient_first_name_input.clear()
         self.patient_last_name_input.clear()
         self.patient_phone_input.clear() # --- ADD THIS ---
+        self.patient_phone_check.reset()
         self.patient_dob_input.setDate(QDate.currentDate().addYears(-18))
         self.patient_address_input.clear()
         self.patient_problem_input.clear()
@@ -245,13 +407,15 @@ class AssignDoctorDialog(QDialog):
     def __init__(self, doctors, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Assign Doctor")
-        self.doctors = doctors # List of (id, name)
+        self.doctors = doctors # List of records.DoctorWorkload
         
         layout = QVBoxLayout(self)
         
+        # Show each doctor's current load so work can be spread evenly
         self.doctor_combo = QComboBox()
-        for doc_id, doc_name in self.doctors:
-            self.doctor_combo.addItem(doc_name, doc_id) # Store ID in item data
+        for doctor in self.doctors:
+            label = f"{doctor.full_name} ({doctor.pending} pending, {doctor.accepted} accepted)"
+            self.doctor_combo.addItem(label, doctor.id) # Store ID in item data
             
         layout.addWidget(QLabel("Select a doctor to assign:"))
         layout.addWidget(self.doctor_combo)
@@ -271,72 +435,79 @@ class AssignDoctorDialog(QDialog):
     
 class EditPatientDialog(QDialog):
         def __init__(self, patient_data, parent=None):
-            # patient_data is a tuple from get_patient_details
+            # patient_data is a records.PatientDetails from get_patient_details
             super().__init__(parent)
             self.setWindowTitle("Edit Patient Details")
 
-            # Unpack the data
-            (first_name, last_name, dob, gender, contact_phone, 
-            problem, address, blood_type) = patient_data
-
             layout = QVBoxLayout(self)
             patient_form = QFormLayout()
 
             # Create validators
             alpha_validator = QRegExpValidator(QRegExp("[a-zA-Z]+"))
             phone_validator = QRegExpValidator(QRegExp(r"\d{10}"))
-            self.phone_input.setMaxLength(10) # Physically limit to 10 chars
 
             # 1. First Name
             self.first_name_input = QLineEdit()
             self.first_name_input.setValidator(alpha_validator)
-            self.first_name_input.setText(first_name)
+            self.first_name_input.setText(patient_data.first_name)
             patient_form.addRow(QLabel("First Name:"), self.first_name_input)
 
             # 2. Last Name
             self.last_name_input = QLineEdit()
             self.last_name_input.setValidator(alpha_validator)
-            self.last_name_input.setText(last_name)
+            self.last_name_input.setText(patient_data.last_name)
             patient_form.addRow(QLabel("Last Name:"), self.last_name_input)
 
             # 3. Date of Birth
             self.dob_input = QDateEdit()
             self.dob_input.setCalendarPopup(True)
             self.dob_input.setDisplayFormat("yyyy-MM-dd")
-            self.dob_input.setDate(QDate.fromString(dob, "yyyy-MM-dd"))
+            self.dob_input.setDate(QDate.fromString(patient_data.date_of_birth, "yyyy-MM-dd"))
             patient_form.addRow(QLabel("Date of Birth:"), self.dob_input)
 
             # 4. Gender
             self.gender_input = QComboBox()
             self.gender_input.addItems(["Male", "Female", "Other"])
-            self.gender_input.setCurrentText(gender)
+            self.gender_input.setCurrentText(patient_data.gender)
             patient_form.addRow(QLabel("Gender:"), self.gender_input)
 
             # 5. Contact Phone
             self.phone_input = QLineEdit()
             self.phone_input.setValidator(phone_validator)
-            self.phone_input.setText(contact_phone)
+            self.phone_input.setMaxLength(10) # Physically limit to 10 chars
+            self.phone_input.setText(patient_data.contact_phone)
             patient_form.addRow(QLabel("Contact Phone:"), self.phone_input)
+            self.phone_status = QLabel()
+            self.phone_check = FieldCheck(self.phone_input, self.phone_status)
+            patient_form.addRow(self.phone_status)
 
             # 6. Blood Type
             self.blood_type_input = QComboBox()
             self.blood_type_input.addItems(["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"])
-            self.blood_type_input.setCurrentText(blood_type)
+            self.blood_type_input.setCurrentText(patient_data.blood_type)
             patient_form.addRow(QLabel("Blood Type:"), self.blood_type_input)
 
             # 7. Address
             self.address_input = QTextEdit()
-            self.address_input.setPlainText(address)
+            self.address_input.setPlainText(patient_data.address)
             self.address_input.setFixedHeight(80)
             patient_form.addRow(QLabel("Address:"), self.address_input)
             
             # 8. Problem
             self.problem_input = QLineEdit()
-            self.problem_input.setText(problem)
+            self.problem_input.setText(patient_data.problem)
             patient_form.addRow(QLabel("Problem:"), self.problem_input)
             
             layout.addLayout(patient_form)
 
+            # Visit history (filled in page by page by the main window)
+            history_box = QGroupBox("Visit History")
+            history_layout = QVBoxLayout()
+            self.history_widget = PatientHistoryWidget()
+            history_layout.addWidget(self.history_widget)
+            history_box.setLayout(history_layout)
+            layout.addWidget(history_box)
+
             # Dialog buttons
             self.buttons = QDialogButtonBox(
                 QDialogButtonBox.Save | QDialogButtonBox.Cancel,
@@ -346,15 +517,15 @@ class EditPatientDialog(QDialog):
             layout.addWidget(self.buttons)
 
         def get_details(self):
-            """Returns all the new values from the form fields."""
-            return (
-                self.first_name_input.text(),
-                self.last_name_input.text(),
-                self.dob_input.date().toString("yyyy-MM-dd"),
-                self.gender_input.currentText(),
-                self.phone_input.text(),
-                self.problem_input.text(),
-                self.address_input.toPlainText(),
-                self.blood_type_input.currentText()
+            """Returns all the new values from the form fields as a records.PatientDetails."""
+            return PatientDetails(
+                first_name=self.first_name_input.text(),
+                last_name=self.last_name_input.text(),
+                date_of_birth=self.dob_input.date().toString("yyyy-MM-dd"),
+                gender=self.gender_input.currentText(),
+                contact_phone=self.phone_input.text(),
+                problem=self.problem_input.text(),
+                address=self.address_input.toPlainText(),
+                blood_type=self.blood_type_input.currentText()
             )
     # --- END OF NEW CLASS ---
\ No newline at end of file
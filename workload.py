@@ -0,0 +1,82 @@
+"""
+Live per-doctor patient counters (pending / accepted / denied).
+
+Triggers on `patients` keep one `doctor_workload` row per doctor up to date:
+registering, assigning, accepting, denying, deleting, archiving or restoring a
+patient adds to one doctor's counts and/or takes away from another's, in the
+same transaction as the change itself. Reading a doctor's workload is a single
+primary-key lookup, however many patients there are. Only current patients
+(deleted_at IS NULL) are counted, as in the patient lists.
+"""
+
+STATUSES = ("pending", "accepted", "denied")
+
+
+def _adjust(sign, row):
+    """SET list adding (sign '+') or removing (sign '-') one patient row ('NEW'/'OLD') from the counts."""
+    return ", ".join(f"{status} = {status} {sign} ({row}.doctor_status = '{status}')" for status in STATUSES)
+
+
+def create_workload(cursor):
+    """Creates the doctor_workload table and its triggers; fills it the first time."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'doctor_workload'")
+    exists = cursor.fetchone() is not None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctor_workload (
+        doctor_id INTEGER PRIMARY KEY,
+        pending INTEGER NOT NULL DEFAULT 0,
+        accepted INTEGER NOT NULL DEFAULT 0,
+        denied INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_workload_insert AFTER INSERT ON patients
+    WHEN NEW.assigned_doctor_id IS NOT NULL AND NEW.deleted_at IS NULL
+    BEGIN
+        INSERT OR IGNORE INTO doctor_workload (doctor_id) VALUES (NEW.assigned_doctor_id);
+        UPDATE doctor_workload SET {_adjust('+', 'NEW')} WHERE doctor_id = NEW.assigned_doctor_id;
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_workload_delete AFTER DELETE ON patients
+    WHEN OLD.assigned_doctor_id IS NOT NULL AND OLD.deleted_at IS NULL
+    BEGIN
+        UPDATE doctor_workload SET {_adjust('-', 'OLD')} WHERE doctor_id = OLD.assigned_doctor_id;
+    END
+    """)
+    # Assignment, status and soft delete: take the old row out, put the new one in
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_patients_workload_update
+    AFTER UPDATE OF assigned_doctor_id, doctor_status, deleted_at ON patients
+    WHEN OLD.assigned_doctor_id IS NOT NEW.assigned_doctor_id
+      OR OLD.doctor_status IS NOT NEW.doctor_status
+      OR (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+    BEGIN
+        UPDATE doctor_workload SET {_adjust('-', 'OLD')}
+        WHERE doctor_id = OLD.assigned_doctor_id AND OLD.deleted_at IS NULL;
+        INSERT OR IGNORE INTO doctor_workload (doctor_id)
+        SELECT NEW.assigned_doctor_id WHERE NEW.assigned_doctor_id IS NOT NULL AND NEW.deleted_at IS NULL;
+        UPDATE doctor_workload SET {_adjust('+', 'NEW')}
+        WHERE doctor_id = NEW.assigned_doctor_id AND NEW.deleted_at IS NULL;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_workload_delete AFTER DELETE ON users
+    BEGIN
+        DELETE FROM doctor_workload WHERE doctor_id = OLD.id;
+    END
+    """)
+    if not exists:
+        rebuild_workload(cursor)
+
+
+def rebuild_workload(cursor):
+    """Recounts every doctor's patients from scratch (one GROUP BY). The caller commits."""
+    cursor.execute("DELETE FROM doctor_workload")
+    cursor.execute(f"""
+    INSERT INTO doctor_workload (doctor_id, {", ".join(STATUSES)})
+    SELECT assigned_doctor_id, {", ".join(f"SUM(doctor_status = '{status}')" for status in STATUSES)}
+    FROM patients
+    WHERE assigned_doctor_id IS NOT NULL AND deleted_at IS NULL
+    GROUP BY assigned_doctor_id
+    """)